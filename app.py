@@ -1,7 +1,9 @@
+# Started first so the imports below are included in the startup profile (ZYSEC_PROFILE_STARTUP=1)
+from modules import app_profiler
+app_profiler.start_if_enabled()
+import importlib
 import streamlit as st
 from streamlit_option_menu import option_menu
-# Import your page modules
-from modules import nav_about, nav_query_docs, nav_researcher, nav_summarizer, nav_file_manager
 from modules import app_constants, app_logger, common_utils
 from modules.message_store import MessageStore
 
@@ -11,6 +13,10 @@ WORKSPACE_DIRECTORY = app_constants.WORKSPACE_DIRECTORY
 # Page configuration
 st.set_page_config(page_title="ZySec AI", page_icon=":sparkles:", layout="wide")
 
+def load_page(module_name):
+    """Import a nav_* page module on first use so each page only pulls in its own dependencies."""
+    return importlib.import_module(f"modules.{module_name}")
+
 # Initialize MessageStore in the session state
 if 'message_store' not in st.session_state:
     st.session_state['message_store'] = MessageStore()
@@ -27,6 +33,11 @@ def request_username():
 
 def main():
     common_utils.setup_initial_folders()
+    # Load the embedding model in the background while the user is on the welcome screen
+    if app_constants.EMBEDDING_WARM_UP:
+        # Imported here: app_embeddings pulls in langchain_core, which the welcome screen does not need
+        from modules import app_embeddings
+        app_embeddings.warm_up()
     if 'messages' not in st.session_state:
         st.session_state['messages'] = []
 
@@ -39,8 +50,8 @@ def main():
     with st.sidebar:
         selected = option_menu(
             "ZySec AI", 
-            ["Private AI", "Playbooks", "Standards", "Policies", "Summarizer","Files", "About"], 
-            icons=["shield-lock", "book-half", "file-earmark-ruled", "journal-bookmark", "file-text","files", "info-circle"], 
+            ["Private AI", "Playbooks", "Standards", "Policies", "All Documents", "Summarizer","Files", "About"], 
+            icons=["shield-lock", "book-half", "file-earmark-ruled", "journal-bookmark", "collection", "file-text","files", "info-circle"], 
             default_index=0, 
             menu_icon="cast", 
             styles={}
@@ -53,27 +64,32 @@ def main():
 
 
         if selected == "Private AI":
-            #nav_private_ai.app(message_store)
-            nav_query_docs.app(message_store,current_page="nav_private_ai")
+            load_page("nav_query_docs").app(message_store,current_page="nav_private_ai")
         elif selected == "Playbooks":
-            nav_query_docs.app(message_store,current_page="nav_playbooks",use_retrieval_chain=True)
+            load_page("nav_query_docs").app(message_store,current_page="nav_playbooks",use_retrieval_chain=True)
         elif selected == "Standards":
-            nav_query_docs.app(message_store,current_page="nav_standards",use_retrieval_chain=True)
+            load_page("nav_query_docs").app(message_store,current_page="nav_standards",use_retrieval_chain=True)
         elif selected == "Policies":
-            nav_query_docs.app(message_store,current_page="nav_policies",use_retrieval_chain=True)
+            load_page("nav_query_docs").app(message_store,current_page="nav_policies",use_retrieval_chain=True)
+        elif selected == "All Documents":
+            load_page("nav_query_docs").app(message_store,current_page="nav_all_documents",use_retrieval_chain=True,federated_pages=app_constants.FEDERATED_PAGES)
         elif selected == "Researcher":
-            nav_researcher.app(message_store)
+            load_page("nav_researcher").app(message_store)
         elif selected == "Summarizer":
-            nav_summarizer.app()
+            load_page("nav_summarizer").app()
         elif selected == "Files":
-            nav_file_manager.app()
+            load_page("nav_file_manager").app()
         elif selected == "About":
-            nav_about.app()
+            load_page("nav_about").app()
         else:
             pass
 
     except Exception as e:
         st.error(f"Looks like there's a gap here; maybe we forgot to add some data!: {e}")
 
+    if app_profiler.is_enabled() and not st.session_state.get('startup_profile_logged'):
+        app_logger.info("Startup import profile:\n" + app_profiler.format_report())
+        st.session_state['startup_profile_logged'] = True
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,82 @@
+#bench_html_extractor.py
+"""
+Throughput and output comparison of the HTML extractors in modules/app_html_extractor.py.
+
+    python benchmarks/bench_html_extractor.py [corpus directories] [--repeat N] [--engines lxml legacy]
+
+The corpus is every saved page (*.html, *.htm) and HTTP cache body (*.body) that looks like HTML in the
+directories. By default these are benchmarks/corpus, which holds a vendor advisory, a NIST publication page, a
+security blog post and pages that broke an extractor before, and the Researcher's HTTP cache (cache/http). Each
+engine extracts every page --repeat times; the report gives pages/s, MB/s and, against the first engine, how
+similar the outputs are.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import app_html_extractor, app_http_cache  # noqa: E402
+
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+def load_corpus(directories):
+    pages = []
+    for directory in directories:
+        for pattern in ("*.html", "*.htm", "*.body"):
+            for path in sorted(glob.glob(os.path.join(directory, pattern))):
+                with open(path, "rb") as f:
+                    content = f.read()
+                if b"<html" in content[:4096].lower() or b"<!doctype html" in content[:4096].lower():
+                    pages.append((os.path.basename(path), content))
+    return pages
+
+def run(engine, pages, repeat):
+    outputs = []
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        outputs = [app_html_extractor.extract_text(content, engine) for _, content in pages]
+    return time.perf_counter() - start_time, outputs
+
+def similarity(a, b):
+    """Overlap of the two outputs' word multisets: 1.0 means the same words in any order."""
+    words_a, words_b = Counter(a.lower().split()), Counter(b.lower().split())
+    total = sum((words_a | words_b).values())
+    return sum((words_a & words_b).values()) / total if total else 1.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="*", default=[CORPUS_DIRECTORY, app_http_cache.CACHE_DIRECTORY])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engines", nargs="+", default=["legacy", "lxml"], choices=app_html_extractor.ENGINES)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        sys.exit(f"No HTML pages found in {', '.join(args.corpus)}")
+    megabytes = sum(len(content) for _, content in pages) / (1024 * 1024)
+    print(f"{len(pages)} pages, {megabytes:.1f} MB, {args.repeat} repetitions\n")
+
+    results = {}
+    for engine in args.engines:
+        seconds, outputs = run(engine, pages, args.repeat)
+        results[engine] = outputs
+        characters = sum(len(output) for output in outputs)
+        print(
+            f"{engine:>8}: {seconds / args.repeat:8.3f}s per pass, {len(pages) * args.repeat / seconds:8.1f} pages/s, "
+            f"{megabytes * args.repeat / seconds:7.2f} MB/s, {characters} characters of text"
+        )
+
+    baseline = args.engines[0]
+    for engine in args.engines[1:]:
+        scores = sorted((similarity(a, b), name) for (name, _), a, b in zip(pages, results[baseline], results[engine]))
+        mean = sum(score for score, _ in scores) / len(scores)
+        print(f"\n{engine} vs {baseline}: mean word overlap {mean:.1%}, least similar pages:")
+        for score, name in scores[:5]:
+            print(f"  {score:6.1%}  {name}")
+
+if __name__ == "__main__":
+    main()
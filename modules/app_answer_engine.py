@@ -0,0 +1,226 @@
+#app_answer_engine.py
+# Answer engine for the RAG pages, selected by app_constants.RAG_TECHNIQUE:
+#   stuff      - retrieved chunks are packed into a single prompt sized against CONTEXT_LENGTH (one LLM call)
+#   map_reduce - one extraction call per chunk, sent concurrently, then one call combining the extracts
+# Every answer reports the LLM calls and tokens it used so the modes can be compared by latency.
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from modules import app_constants, app_logger, app_llm_clients, app_response_cache, app_tokenizer
+
+app_logger = app_logger.app_logger
+
+ANSWER_MODES = ("stuff", "map_reduce")
+NO_RELEVANT_CONTENT = "NONE"
+
+STUFF_TEMPLATE = (
+    "Use the following excerpts from the documents to answer the question. "
+    "If they do not contain the answer, say so instead of making one up.\n\n"
+    "{context}\n\nQuestion: {question}"
+)
+MAP_TEMPLATE = (
+    "Extract the parts of the excerpt below that help answer the question, verbatim where possible. "
+    f"If nothing in it is relevant, reply with {NO_RELEVANT_CONTENT} only.\n\n"
+    "Excerpt:\n{excerpt}\n\nQuestion: {question}"
+)
+
+def new_stats(mode):
+    return {"mode": mode, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+
+def _complete(client, messages, stats, lock, max_tokens=None, extra_body=None):
+    response = client.chat.completions.create(
+        model=app_constants.MODEL_NAME,
+        messages=messages,
+        max_tokens=max_tokens,
+        extra_body=extra_body,
+    )
+    content = response.choices[0].message.content or ""
+    usage = getattr(response, "usage", None)
+    # Servers that omit usage are counted with the local tokenizer instead
+    prompt_tokens = usage.prompt_tokens if usage else sum(app_tokenizer.count_message_tokens(message) for message in messages)
+    completion_tokens = usage.completion_tokens if usage else app_tokenizer.count_tokens(content)
+    with lock:
+        stats["llm_calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+    return content
+
+def _format_excerpt(doc):
+    source = os.path.basename(doc.metadata.get("source", "")) or "unknown"
+    collection = doc.metadata.get("collection")
+    label = f"{source} ({collection})" if collection else source
+    return f"[{label}]\n{doc.page_content}"
+
+def format_sources(documents):
+    sources = []
+    for doc in documents:
+        source = doc.metadata.get("source")
+        if source and source not in sources:
+            sources.append(source)
+    return ", ".join(sources)
+
+def prompt_budget(messages):
+    """Tokens left for retrieved context once the conversation and the answer are accounted for."""
+    used = sum(app_tokenizer.count_message_tokens(message) for message in messages)
+    return app_constants.CONTEXT_LENGTH - app_constants.ANSWER_MAX_TOKENS - used
+
+def pack_excerpts(excerpts, budget):
+    """Keep excerpts in relevance order while they fit in budget tokens."""
+    packed = []
+    for excerpt in excerpts:
+        cost = app_tokenizer.count_tokens(excerpt)
+        if cost > budget:
+            break
+        packed.append(excerpt)
+        budget -= cost
+    return packed
+
+def _with_context(messages, question, excerpts):
+    """messages with the final user turn replaced by the question plus the packed context."""
+    budget = prompt_budget(messages) - app_tokenizer.count_tokens(STUFF_TEMPLATE)
+    packed = pack_excerpts(excerpts, budget)
+    if len(packed) < len(excerpts):
+        app_logger.info(f"Context budget fits {len(packed)} of {len(excerpts)} excerpts")
+    content = STUFF_TEMPLATE.format(context="\n\n".join(packed), question=question)
+    return messages[:-1] + [{"role": "user", "content": content}], packed
+
+def _complete_stream(client, messages, stats, lock, max_tokens=None, extra_body=None):
+    """Like _complete, but yields the answer as it is generated. Completion tokens are counted per streamed delta."""
+    with lock:
+        stats["llm_calls"] += 1
+        stats["prompt_tokens"] += sum(app_tokenizer.count_message_tokens(message) for message in messages)
+    response = client.chat.completions.create(
+        model=app_constants.MODEL_NAME,
+        messages=messages,
+        max_tokens=max_tokens,
+        stream=True,
+        extra_body=extra_body,
+    )
+    for chunk in response:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            with lock:
+                stats["completion_tokens"] += 1
+            yield delta
+
+def stuff_messages(question, documents, messages):
+    prompt_messages, _ = _with_context(messages, question, [_format_excerpt(doc) for doc in documents])
+    return prompt_messages
+
+def map_reduce_messages(client, question, documents, messages, stats, lock):
+    """Run the map calls concurrently and return the messages for the combining call."""
+    def extract(doc):
+        content = MAP_TEMPLATE.format(excerpt=_format_excerpt(doc), question=question)
+        # No slot: the map calls run side by side, they only share the template's prefix
+        return _complete(client, [{"role": "user", "content": content}], stats, lock, app_constants.ANSWER_MAX_TOKENS, app_llm_clients.prompt_cache_params())
+
+    # The map calls run under the answer's single gateway admission, so they may not outnumber the
+    # requests the gateway lets through to the model server at once
+    workers = min(app_constants.MAP_REDUCE_WORKERS, app_constants.LLM_GATEWAY_CONCURRENCY, len(documents))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        extracts = list(executor.map(extract, documents))
+    relevant = [
+        f"[{os.path.basename(doc.metadata.get('source', '')) or 'unknown'}]\n{extract_text.strip()}"
+        for doc, extract_text in zip(documents, extracts)
+        if extract_text.strip() and extract_text.strip().upper() != NO_RELEVANT_CONTENT
+    ]
+    prompt_messages, _ = _with_context(messages, question, relevant)
+    return prompt_messages
+
+def _retrieve(question, retriever, mode):
+    if mode not in ANSWER_MODES:
+        raise ValueError(f"Unknown answer mode {mode}, expected one of {ANSWER_MODES}")
+    return retriever.invoke(question)
+
+def _prepare(question, documents, messages, mode, stats, lock):
+    """Run everything up to the final LLM call; returns (client, final messages)."""
+    client = app_llm_clients.get_client()
+    if mode == "stuff" or not documents:
+        return client, stuff_messages(question, documents, messages)
+    return client, map_reduce_messages(client, question, documents, messages, stats, lock)
+
+def _cache_scope(retriever, messages, documents):
+    """(system role, context chunk ids, collection versions) for app_response_cache."""
+    system_role = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    context_ids = [doc.metadata.get("chunk_id", "") for doc in documents]
+    collections = retriever.collection_versions() if hasattr(retriever, "collection_versions") else {}
+    return system_role, context_ids, collections
+
+def _log_stats(stats):
+    if stats.get("cache"):
+        app_logger.info(f"Answered from the response cache ({stats['cache']} match) in {stats['seconds']:.2f}s")
+        return
+    app_logger.info(
+        f"Answered with {stats['mode']}: {stats['llm_calls']} LLM calls, {stats['prompt_tokens']} prompt + "
+        f"{stats['completion_tokens']} completion tokens in {stats['seconds']:.2f}s"
+    )
+
+def answer(question, retriever, messages, mode=None, cache_page=None, extra_body=None, admission=None):
+    """
+    Answer question from the documents returned by retriever.
+
+    :param messages: Chat messages to send, ending with the user's question
+    :param cache_page: Page to look up and store the answer under in app_response_cache, None to bypass it
+    :param extra_body: Extra request fields for the final call, e.g. app_llm_clients.prompt_cache_params()
+    :param admission: Callable returning the app_llm_gateway context the LLM calls run in
+    :return: (answer, sources, stats)
+    """
+    mode = mode or app_constants.RAG_TECHNIQUE
+    stats = new_stats(mode)
+    lock = threading.Lock()
+    start_time = time.time()
+    documents = _retrieve(question, retriever, mode)
+    sources = format_sources(documents)
+    if cache_page:
+        scope = _cache_scope(retriever, messages, documents)
+        cached = app_response_cache.lookup(cache_page, scope[0], scope[1], question, scope[2])
+        if cached:
+            stats["cache"] = cached[2]
+            stats["seconds"] = time.time() - start_time
+            _log_stats(stats)
+            return cached[0], cached[1], stats
+    with (admission or nullcontext)() as ticket:
+        stats["queue_wait"] = (ticket or {}).get("queue_wait", 0.0)
+        client, prompt_messages = _prepare(question, documents, messages, mode, stats, lock)
+        response = _complete(client, prompt_messages, stats, lock, app_constants.ANSWER_MAX_TOKENS, extra_body)
+    if cache_page:
+        app_response_cache.store(cache_page, scope[0], scope[1], question, response, sources, scope[2])
+    stats["seconds"] = time.time() - start_time
+    _log_stats(stats)
+    return response, sources, stats
+
+def answer_stream(question, retriever, messages, stats, mode=None, cache_page=None, extra_body=None, admission=None):
+    """
+    Streaming answer: yields the final LLM call's tokens. stats is filled in as the answer progresses,
+    including stats["sources"] once retrieval is done. A cached answer is yielded in one piece.
+    """
+    mode = mode or app_constants.RAG_TECHNIQUE
+    stats.update(new_stats(mode))
+    lock = threading.Lock()
+    start_time = time.time()
+    documents = _retrieve(question, retriever, mode)
+    stats["sources"] = format_sources(documents)
+    if cache_page:
+        scope = _cache_scope(retriever, messages, documents)
+        cached = app_response_cache.lookup(cache_page, scope[0], scope[1], question, scope[2])
+        if cached:
+            stats["cache"] = cached[2]
+            stats["sources"] = cached[1]
+            yield cached[0]
+            stats["seconds"] = time.time() - start_time
+            _log_stats(stats)
+            return
+    parts = []
+    with (admission or nullcontext)() as ticket:
+        stats["queue_wait"] = (ticket or {}).get("queue_wait", 0.0)
+        client, prompt_messages = _prepare(question, documents, messages, mode, stats, lock)
+        for token in _complete_stream(client, prompt_messages, stats, lock, app_constants.ANSWER_MAX_TOKENS, extra_body):
+            parts.append(token)
+            yield token
+    if cache_page:
+        app_response_cache.store(cache_page, scope[0], scope[1], question, "".join(parts), stats["sources"], scope[2])
+    stats["seconds"] = time.time() - start_time
+    _log_stats(stats)
@@ -0,0 +1,166 @@
+#app_bulk_ingest.py
+# Bulk ingestion: load, split and embed many files on a process pool, then write
+# the chunks to each page's <page>_chroma_db from a single writer in this process.
+
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from modules import app_constants, app_logger, app_embedding_cache, app_lexical_index, app_to_vectorstore, common_utils, database_utils, file_utils
+
+app_logger = app_logger.app_logger
+work_dir = app_constants.WORKSPACE_DIRECTORY
+
+WRITE_BATCH_SIZE = 1000
+
+# Set once per worker process by _init_worker so the model is loaded only once per worker
+_worker_embeddings = None
+
+def _init_worker(threads_per_worker):
+    # Workers are spawned, not forked, so they open their own embedding cache connection and model here
+    # instead of inheriting the parent's threads and open SQLite/Chroma handles
+    global _worker_embeddings
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except Exception:
+        pass
+    app_embedding_cache.get_cache()
+    _worker_embeddings = app_embedding_cache.get_cached_embeddings()
+
+def _process_file(file_path):
+    """Runs in a worker process: load, split and embed a single file."""
+    documents = app_to_vectorstore.load_file_documents(file_path)
+    if not documents:
+        raise ValueError(f"No documents loaded from {file_path}")
+    docs = app_to_vectorstore.split_documents(documents)
+    if not docs:
+        raise ValueError(f"No documents to process after splitting from {file_path}")
+    ids = app_to_vectorstore.make_chunk_ids(docs)
+    texts = [doc.page_content for doc in docs]
+    metadatas = [doc.metadata for doc in docs]
+    embeddings = _worker_embeddings.embed_documents(texts)
+    return ids, texts, metadatas, embeddings
+
+def collect_directory_files(directory, page="nav_playbooks"):
+    """Return (file_path, page) pairs for every loadable file under a directory."""
+    jobs = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            if app_to_vectorstore.get_loader_class(file_path):
+                jobs.append((file_path, page))
+    return jobs
+
+def collect_catalog_files(entries):
+    """Return (file_path, page) pairs for app-content.json style catalog entries."""
+    jobs = []
+    for entry in entries:
+        file_path = work_dir + "docs/" + file_utils.sanitize_filename(entry.get("url", ""))
+        page = common_utils.get_content_mapping_to_module(entry.get("content_type", ""))
+        jobs.append((file_path, page))
+    return jobs
+
+def _write_chunks(db, persist_directory, ids, texts, metadatas, embeddings):
+    for start in range(0, len(texts), WRITE_BATCH_SIZE):
+        end = start + WRITE_BATCH_SIZE
+        db._collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end],
+            metadatas=metadatas[start:end],
+            documents=texts[start:end],
+        )
+    app_lexical_index.add_chunks(persist_directory, ids, texts, metadatas)
+
+def bulk_ingest(jobs, max_workers=None):
+    """
+    Index many files in parallel.
+
+    Args:
+    jobs (List[Tuple[str, str]]): (file_path, page) pairs, see collect_directory_files and collect_catalog_files.
+    max_workers (int): Worker processes to use, defaults to app_constants.INGEST_THREADS.
+
+    Returns:
+    List[Dict]: One result per job with file_path, page, status, chunks and error.
+    """
+    from langchain_community.vectorstores import Chroma
+
+    results = []
+    pending = {}
+    seen_md5 = set()
+    for file_path, page in jobs:
+        result = {"file_path": file_path, "page": page, "status": False, "chunks": 0, "error": None}
+        results.append(result)
+        if not os.path.exists(file_path):
+            result["error"] = "File not found"
+            continue
+        if not app_to_vectorstore.get_loader_class(file_path):
+            result["error"] = "No suitable loader for file type"
+            continue
+        file_md5 = file_utils.compute_md5(file_path)
+        if file_md5 in seen_md5 or app_to_vectorstore.is_file_processed(file_md5):
+            result["error"] = "Already processed"
+            continue
+        seen_md5.add(file_md5)
+        pending[file_path] = (result, file_md5)
+
+    if not pending:
+        return results
+
+    max_workers = max(1, min(max_workers or app_constants.INGEST_THREADS, len(pending)))
+    threads_per_worker = max(1, app_constants.INGEST_THREADS // max_workers)
+    app_logger.info(f"Bulk ingesting {len(pending)} files on {max_workers} worker processes")
+
+    # Single writer: one Chroma handle per page, only ever used from this process
+    writers = {}
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(threads_per_worker,)) as executor:
+        futures = {executor.submit(_process_file, file_path): file_path for file_path in pending}
+        for future in as_completed(futures):
+            file_path = futures[future]
+            result, file_md5 = pending[file_path]
+            try:
+                ids, texts, metadatas, embeddings = future.result()
+                page = result["page"]
+                if page not in writers:
+                    persist_directory = app_to_vectorstore.get_chroma_persist_directory(file_path, page, True)
+                    writers[page] = (Chroma(persist_directory=persist_directory, client_settings=app_constants.CHROMA_SETTINGS), persist_directory)
+                _write_chunks(writers[page][0], writers[page][1], ids, texts, metadatas, embeddings)
+                app_to_vectorstore.update_processed_files_record(file_md5, page, file_path)
+                result["status"] = True
+                result["chunks"] = len(texts)
+                app_logger.info(f"Indexed {len(texts)} chunks from {file_path} into {page}")
+            except Exception as e:
+                result["error"] = str(e)
+                app_logger.error(f"Error in bulk ingestion for {file_path}: {e}")
+
+    for db, persist_directory in writers.values():
+        db.persist()
+        database_utils.mark_index_changed(persist_directory)
+    return results
+
+def ingest_directory(directory, page="nav_playbooks", max_workers=None):
+    return bulk_ingest(collect_directory_files(directory, page), max_workers)
+
+def ingest_catalog(catalog_path=app_constants.SYSTEM_CONTENT_DATA, max_workers=None):
+    entries = file_utils.load_json_data(catalog_path)
+    return bulk_ingest(collect_catalog_files(entries), max_workers)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk index documents into the ZySec vector stores.")
+    parser.add_argument("--directory", help="Index every supported file under this directory")
+    parser.add_argument("--page", default="nav_playbooks", help="Page to index the directory into")
+    parser.add_argument("--catalog", help="Index the downloaded files listed in a catalog such as app-content.json")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes")
+    args = parser.parse_args()
+
+    common_utils.setup_initial_folders()
+    if args.catalog:
+        ingest_results = ingest_catalog(args.catalog, args.workers)
+    elif args.directory:
+        ingest_results = ingest_directory(args.directory, args.page, args.workers)
+    else:
+        parser.error("one of --directory or --catalog is required")
+    for item in ingest_results:
+        status = "OK" if item["status"] else f"FAILED ({item['error']})"
+        print(f"{item['page']}\t{item['file_path']}\t{item['chunks']} chunks\t{status}")
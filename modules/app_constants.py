@@ -1,7 +1,4 @@
 import os
-from langchain_community.document_loaders import (CSVLoader, TextLoader, UnstructuredExcelLoader, Docx2txtLoader,
-                                                   UnstructuredFileLoader, UnstructuredMarkdownLoader, UnstructuredHTMLLoader, JSONLoader)
-from chromadb.config import Settings
 
 from modules import app_logger
 
@@ -16,44 +13,125 @@ model_uri = os.environ.get("REMOTE_BASE_URL") or os.environ.get("LOCAL_BASE_URL"
 
 #model_uri = os.environ.get("LOCAL_OPENAI_URI", None)
 
-DOCUMENT_MAP = {
-    ".html": UnstructuredHTMLLoader,
-    ".txt": TextLoader,
-    ".md": UnstructuredMarkdownLoader,
-    ".py": TextLoader,
-    ".json": JSONLoader,
-    ".jsonl": JSONLoader,
-    ".pdf": UnstructuredFileLoader,
-    ".csv": CSVLoader,
-    ".xls": UnstructuredExcelLoader,
-    ".xlsx": UnstructuredExcelLoader,
-    ".docx": Docx2txtLoader,
-    ".doc": Docx2txtLoader,
+# Loader class names per extension, resolved lazily through DOCUMENT_MAP (see __getattr__)
+DOCUMENT_LOADERS = {
+    ".html": "UnstructuredHTMLLoader",
+    ".txt": "TextLoader",
+    ".md": "UnstructuredMarkdownLoader",
+    ".py": "TextLoader",
+    ".json": "JSONLoader",
+    ".jsonl": "JSONLoader",
+    ".pdf": "UnstructuredFileLoader",
+    ".csv": "CSVLoader",
+    ".xls": "UnstructuredExcelLoader",
+    ".xlsx": "UnstructuredExcelLoader",
+    ".docx": "Docx2txtLoader",
+    ".doc": "Docx2txtLoader",
 }
 MODELS_PATH = "./models"
+LOCAL_MODEL_PATH = os.path.join(MODELS_PATH, "ZySec-AI", os.environ.get("MODEL_FILE", "ZySec-7B.Q8_0.gguf")) # start.sh downloads the model here
 EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+EMBEDDING_BACKEND = 'sentence-transformers' # Options: sentence-transformers, multiprocess, onnx, hash (tests only)
+EMBEDDING_BATCH_CANDIDATES = (8, 16, 32, 64, 128) # batch sizes tried before settling on the fastest
+EMBEDDING_PROCESSES = max(1, (os.cpu_count() or 2) // 2) # encode processes for the multiprocess backend
+EMBEDDING_MAX_TOKENS = 256 # truncation length for the onnx backend
+EMBEDDING_WARM_UP = False # load the embedding model in the background at startup, for deployments that mostly query documents
 MODEL_NAME = 'gpt-3.5-turbo'
+LLM_CONNECT_TIMEOUT = 5 # seconds to connect to the model endpoint
+LLM_READ_TIMEOUT = 300 # seconds to wait for response data, CPU inference of a long answer is slow
+LLM_MAX_RETRIES = 2 # retries on connection errors, 429 and 5xx with jittered exponential backoff
+LLM_MAX_CONNECTIONS = 20 # keep-alive connections shared by all LLM clients
+LLM_KEEPALIVE_SECONDS = 60
+LLM_HEALTH_CHECK_TTL = 30 # seconds a model endpoint health check result is reused
+PROMPT_CACHE_ENABLED = True # keep prompt prefixes stable across turns and ask the server to reuse its prompt cache
+PROMPT_CACHE_HEADROOM = 0.5 # share of the history budget freed when the history window has to move
+LLM_SERVER_SLOTS = int(os.environ.get("LLM_SERVER_SLOTS", 1)) # parallel slots of a llama.cpp server (--parallel), set in config.cfg
+LLM_GATEWAY_CONCURRENCY = LLM_SERVER_SLOTS # requests sent to the model server at once, see app_llm_gateway
+LLM_GATEWAY_MAX_QUEUE = 16 # waiting requests per priority class before new ones are rejected
+LLM_GATEWAY_MAX_QUEUE_PER_USER = 4
+LLM_GATEWAY_MAX_WAIT = 120 # seconds a request may wait for admission
 # Constants
 WORKSPACE_DIRECTORY = './workspace/'
+# Kept outside the workspace so caches survive "Clear Data"
+CACHE_DIRECTORY = './cache/'
 
-
-CHROMA_SETTINGS = Settings(
-    anonymized_telemetry=False,
-    is_persistent=True,
-)
 INGEST_THREADS = os.cpu_count() or 8
 
 CHUNK_SIZE = 880
 CHUNK_OVERLAP = 200
-PROCESSED_DOCS = 'index_processed.log'
+STREAM_BATCH_SIZE = 64 # chunks embedded and written per batch by stream_chroma_index
+STREAM_TEXT_BLOCK_SIZE = 64 * 1024 # characters read per block from plain text files
+STREAM_INGEST_THRESHOLD_MB = 20 # get_chroma_index streams files larger than this
+PROCESSED_DOCS = 'index_processed.log' # legacy CSV log, imported into PROCESSED_DOCS_DB
+PROCESSED_DOCS_DB = 'index_processed.db'
+EMBEDDING_CACHE_MAX_MB = 512
 SEARCH_COUNT = 5
-MESSAGE_HISTORY = 4
+RESEARCH_KEYWORD_MODE = 'rake' # Options: rake, noun_chunks (offline, app_keyphrases on the titles and snippets of a search for the topic), llm (ask the model server)
+RESEARCH_KEYWORD_COUNT = 5
+RESEARCH_KEYWORD_MAX_WORDS = 3 # longest offline keyphrase, longer runs of words from the snippets are left out
+RESEARCH_KEYWORD_LLM_FALLBACK = False # ask the model server when offline extraction finds no keywords
+SEARCH_WORKERS = 4 # concurrent DuckDuckGo searches for the Researcher's keywords
+SEARCH_DEADLINE = 10 # seconds to wait for all keyword searches, later results are left for the cache
+SEARCH_CACHE_SIZE = 256 # topics and search terms kept in the Researcher's keyword and result caches
+SEARCH_CACHE_TTL = 6 * 3600
+WEB_FETCH_WORKERS = 8 # concurrent page downloads for the Researcher
+WEB_FETCH_PER_HOST = 2 # concurrent downloads from any one host
+WEB_FETCH_CONNECT_TIMEOUT = 5
+WEB_FETCH_READ_TIMEOUT = 15 # seconds without data before a download is abandoned
+WEB_FETCH_MAX_BYTES = 5 * 1024 * 1024 # larger pages are skipped
+WEB_FETCH_DEADLINE = 90 # seconds for all downloads of one research run, unfinished pages are skipped
+HTML_EXTRACTOR = 'lxml' # Options: lxml (single pass, app_html_extractor), legacy (BeautifulSoup + html2text)
+WEB_CLEAN_WORKERS = 2 # threads cleaning downloaded pages while the remaining downloads run
+RESEARCH_NOTE_BATCH = 8 # cleaned pages segmented and saved per batch
+HTTP_CACHE_ENABLED = True # conditional-GET cache of downloaded documents and research pages, see app_http_cache
+HTTP_CACHE_MAX_MB = 1024
+CATALOG_DOWNLOAD_MAX_MB = 200 # size limit for documents downloaded from the content catalog
+WEB_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0"
+SENTENCE_SEGMENTER = 'sentencizer' # Options: sentencizer (rule-based), regex, parser (full en_core_web_sm pipeline)
+SENTENCE_BATCH_SIZE = 32 # research pages segmented per spaCy batch
+SENTENCE_PROCESSES = 1 # spaCy worker processes for segmentation, >1 only pays off for large runs
 RAG_K = 3
-RAG_TECHNIQUE = 'refine'
+RETRIEVAL_MODE = 'hybrid' # Options: hybrid (BM25 + vector), similarity (vector only)
+HYBRID_ALPHA = 0.5 # weight of the vector score in hybrid retrieval, the rest goes to BM25
+HYBRID_CANDIDATES = 4 # each side of hybrid retrieval fetches RAG_K * HYBRID_CANDIDATES candidates
+FEDERATED_PAGES = ["nav_playbooks", "nav_standards", "nav_policies"] # collections searched together by "All Documents"
+FEDERATED_THREADS = 4
+FEDERATED_MIN_PER_COLLECTION = 1 # results reserved for each collection before the rest are filled by score
+QUERY_CACHE_SIZE = 1024 # entries per level in app_query_cache
+QUERY_CACHE_TTL = 3600 # seconds before a cached query embedding or retrieval expires
+RESPONSE_CACHE_ENABLED = True # persistent cache of LLM answers, see app_response_cache
+RESPONSE_CACHE_SEMANTIC = False # also answer near-duplicate prompts by query embedding similarity
+RESPONSE_CACHE_SIMILARITY = 0.95 # minimum cosine similarity for a near-duplicate hit
+RESPONSE_CACHE_FOLLOW_UPS = False # also cache prompts sent with conversation history, whose answers may depend on it
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
+RESPONSE_CACHE_MAX_MB = 64
+RAG_TECHNIQUE = 'stuff' # Options: stuff, map_reduce (app_answer_engine), refine (langchain RetrievalQAWithSourcesChain)
+CONTEXT_LENGTH = int(os.environ.get("CONTEXT_LENGTH", 8192)) # model context window, exported by start.sh from config.cfg
+ANSWER_MAX_TOKENS = 1024 # tokens reserved for the answer when packing context
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 2048)) # system prompt, greeting, history and question; retrieved context is sized separately
+TOKENIZER = 'auto' # Options: auto, llama (local GGUF vocabulary), tiktoken, estimate
+MAP_REDUCE_WORKERS = 4 # concurrent map calls, capped at LLM_GATEWAY_CONCURRENCY
 SUMMARIZER_BATCH = 3
 MAX_FILE_SIZE = 10 #not implement
 LOCAL_PERSISTANT_DB = WORKSPACE_DIRECTORY + "db/"
+CHROMA_POOL_IDLE_SECONDS = 900 # unreferenced pooled Chroma handles are closed after this idle time
 CONTENT_TYPE = ["Policies", "Playbooks", "Standards", "Reference Docs"]
 SYSTEM_CONTENT_DATA = "app-content.json"
 SYSTEM_DEPLOYMENT_MODE = 0 #private-0, openai-1, demo-2
-ZYSEC_DEMO = "http://zysec.is-a-geek.com:8000/v1" #not enabled yet
\ No newline at end of file
+ZYSEC_DEMO = "http://zysec.is-a-geek.com:8000/v1" #not enabled yet
+
+def __getattr__(name):
+    """Build DOCUMENT_MAP and CHROMA_SETTINGS on first access so importing constants stays cheap."""
+    if name == "DOCUMENT_MAP":
+        from langchain_community import document_loaders
+        value = {extension: getattr(document_loaders, loader) for extension, loader in DOCUMENT_LOADERS.items()}
+    elif name == "CHROMA_SETTINGS":
+        from chromadb.config import Settings
+        value = Settings(
+            anonymized_telemetry=False,
+            is_persistent=True,
+        )
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
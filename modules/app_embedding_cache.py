@@ -0,0 +1,178 @@
+#app_embedding_cache.py
+# Persistent embedding cache keyed by (model name, normalized chunk text hash).
+# Vectors are stored as packed float32 blobs in SQLite and evicted least-recently-used
+# once the store grows past EMBEDDING_CACHE_MAX_MB.
+
+import os
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from langchain_core.embeddings import Embeddings
+from modules import app_constants, app_logger, app_embeddings
+
+app_logger = app_logger.app_logger
+
+CACHE_FILE = os.path.join(app_constants.CACHE_DIRECTORY, "embeddings.sqlite3")
+# Lookups that are remembered before their last_used updates are written without a put
+LAST_USED_FLUSH = 5000
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+def cache_key(model_name, text):
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.digest()
+
+class EmbeddingCache:
+    def __init__(self, path=CACHE_FILE, max_bytes=app_constants.EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        # Running upper bound of the stored bytes (replaced rows are counted twice); the exact
+        # total is only summed when this crosses max_bytes
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        # key -> last lookup time, written with the next put so reads stay read-only
+        self._pending_used = {}
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys present in the cache. Their LRU position is refreshed with the next write."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[bytes(key)] = vector.tolist()
+            if found:
+                now = time.time()
+                self._pending_used.update((key, now) for key in found)
+                if len(self._pending_used) >= LAST_USED_FLUSH:
+                    self._flush_used()
+                    self._conn.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs."""
+        now = time.time()
+        rows = []
+        for key, vector in items:
+            blob = array("f", vector).tobytes()
+            rows.append((key, blob, len(blob) + len(key), now))
+        with self._lock:
+            self._flush_used()
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._total_bytes += sum(row[2] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _flush_used(self):
+        """Write the remembered lookup times; the caller commits."""
+        if self._pending_used:
+            self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(used, key) for key, used in self._pending_used.items()])
+            self._pending_used = {}
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        self._total_bytes = total
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the limit so eviction does not run on every insert
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        rows = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_used ASC")
+        stale_keys = []
+        for key, size in rows:
+            if total <= target:
+                break
+            stale_keys.append((key,))
+            total -= size
+            removed += 1
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale_keys)
+        self._conn.commit()
+        self._total_bytes = total
+        app_logger.info(f"Evicted {removed} entries from embedding cache {self.path}")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_mb": size / (1024 * 1024),
+        }
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only runs the model for chunks missing from the cache."""
+
+    def __init__(self, embeddings, model_name, cache):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        keys = [cache_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            # Texts repeated inside one batch are embedded once
+            unique_missing = {}
+            for i in missing:
+                unique_missing.setdefault(keys[i], texts[i])
+            computed = self.embeddings.embed_documents(list(unique_missing.values()))
+            new_items = list(zip(unique_missing.keys(), computed))
+            self.cache.put_many(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+_cache = None
+_cached_embeddings = {}
+_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
+
+def get_cached_embeddings(model_name=app_constants.EMBEDDING_MODEL_NAME):
+    """Return a shared CachedEmbeddings for model_name backed by the registry model."""
+    cache = get_cache()
+    # Keyed by backend as well, quantized backends produce different vectors
+    key = app_embeddings.embedding_id(model_name)
+    with _lock:
+        cached = _cached_embeddings.get(key)
+    if cached is not None:
+        return cached
+    # Loaded outside _lock so a slow model load does not block cache lookups; the registry loads it once
+    embeddings = app_embeddings.get_embeddings(model_name)
+    with _lock:
+        return _cached_embeddings.setdefault(key, CachedEmbeddings(embeddings, key, cache))
@@ -0,0 +1,286 @@
+#app_embeddings.py
+# Process-wide embedding model registry: each model is loaded once and shared by every caller.
+# Models are created by the backend named in app_constants.EMBEDDING_BACKEND, see EMBEDDING_BACKENDS.
+
+import os
+import atexit
+import hashlib
+import math
+import re
+import threading
+import time
+from langchain_core.embeddings import Embeddings
+from modules import app_constants, app_logger
+
+app_logger = app_logger.app_logger
+
+_models = {}
+_model_stats = {}
+_registry_lock = threading.Lock()
+_model_locks = {}
+
+def _current_rss_mb():
+    """Resident memory of this process in MB, None if it cannot be determined."""
+    try:
+        with open("/proc/self/status", "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except Exception:
+        return None
+
+class BatchAutotuner:
+    """Tries each candidate batch size on real batches, then keeps the one with the best chunks/sec."""
+
+    def __init__(self, candidates=app_constants.EMBEDDING_BATCH_CANDIDATES):
+        self.candidates = list(candidates)
+        self.measurements = {}
+        self.batch_size = None
+
+    def next_batch_size(self, remaining):
+        if self.batch_size is not None:
+            return self.batch_size
+        for size in self.candidates:
+            if size not in self.measurements:
+                return size if size <= remaining else remaining
+        return remaining
+
+    def record(self, size, elapsed):
+        # Only full candidate batches are comparable
+        if self.batch_size is not None or size not in self.candidates or size in self.measurements:
+            return
+        self.measurements[size] = size / elapsed if elapsed > 0 else float("inf")
+        if len(self.measurements) == len(self.candidates):
+            self.batch_size = max(self.measurements, key=self.measurements.get)
+            app_logger.info(f"Embedding batch size tuned to {self.batch_size} ({self.measurements[self.batch_size]:.1f} chunks/sec)")
+
+class EmbeddingBackend(Embeddings):
+    """Base class for embedding backends: handles batching, autotuning and throughput reporting."""
+
+    name = "base"
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.autotuner = BatchAutotuner()
+        self.chunks = 0
+        self.seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _encode(self, texts, batch_size):
+        raise NotImplementedError
+
+    def embed_documents(self, texts):
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = []
+        position = 0
+        while position < len(texts):
+            size = self.autotuner.next_batch_size(len(texts) - position)
+            batch = texts[position:position + size]
+            start_time = time.perf_counter()
+            vectors.extend(self._encode(batch, size))
+            elapsed = time.perf_counter() - start_time
+            self.autotuner.record(len(batch), elapsed)
+            with self._stats_lock:
+                self.chunks += len(batch)
+                self.seconds += elapsed
+            position += size
+        return vectors
+
+    def embed_query(self, text):
+        return self._encode([text.replace("\n", " ")], 1)[0]
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "backend": self.name,
+                "chunks": self.chunks,
+                "chunks_per_sec": self.chunks / self.seconds if self.seconds else None,
+                "batch_size": self.autotuner.batch_size,
+            }
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    name = "sentence-transformers"
+
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def _encode(self, texts, batch_size):
+        return self.model.encode(texts, batch_size=batch_size, show_progress_bar=False).tolist()
+
+class MultiProcessBackend(SentenceTransformerBackend):
+    """Sentence-transformers with a pool of encode processes, one per EMBEDDING_PROCESSES."""
+
+    name = "multiprocess"
+
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        self.pool = self.model.start_multi_process_pool(["cpu"] * app_constants.EMBEDDING_PROCESSES)
+        atexit.register(self.model.stop_multi_process_pool, self.pool)
+
+    def _encode(self, texts, batch_size):
+        # Small batches are not worth the inter-process round trip
+        if len(texts) < app_constants.EMBEDDING_PROCESSES * 2:
+            return super()._encode(texts, batch_size)
+        chunk_size = max(1, math.ceil(len(texts) / app_constants.EMBEDDING_PROCESSES))
+        return self.model.encode_multi_process(texts, self.pool, batch_size=batch_size, chunk_size=chunk_size).tolist()
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    ONNX Runtime backend for a local export of the model, e.g. an int8-quantized one.
+
+    Expects MODELS_PATH/<model name>-onnx/ to contain model_quantized.onnx or model.onnx and tokenizer.json.
+    Uses mean pooling and L2 normalization, matching all-MiniLM-L6-v2.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name):
+        super().__init__(model_name)
+        import numpy as np
+        import onnxruntime
+        from tokenizers import Tokenizer
+        self.np = np
+        model_dir = os.path.join(app_constants.MODELS_PATH, os.path.basename(model_name) + "-onnx")
+        model_file = os.path.join(model_dir, "model_quantized.onnx")
+        if not os.path.exists(model_file):
+            model_file = os.path.join(model_dir, "model.onnx")
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"No ONNX model found in {model_dir}")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = app_constants.INGEST_THREADS
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=app_constants.EMBEDDING_MAX_TOKENS)
+        self.tokenizer.enable_padding()
+
+    def _encode(self, texts, batch_size):
+        np = self.np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, inputs)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.tolist()
+
+class HashBackend(EmbeddingBackend):
+    """Deterministic feature-hashing embedder with no model weights, intended for tests."""
+
+    name = "hash"
+    dimensions = 384
+
+    def _encode(self, texts, batch_size):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for token in re.findall(r"\w+", text.lower()):
+                digest = hashlib.md5(token.encode("utf-8")).digest()
+                index = int.from_bytes(digest[:4], "little") % self.dimensions
+                vector[index] += 1.0 if digest[4] & 1 else -1.0
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            vectors.append([value / norm for value in vector])
+        return vectors
+
+EMBEDDING_BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    MultiProcessBackend.name: MultiProcessBackend,
+    OnnxBackend.name: OnnxBackend,
+    HashBackend.name: HashBackend,
+}
+
+def register_backend(name, factory):
+    """Register a backend factory taking a model name and returning an EmbeddingBackend."""
+    EMBEDDING_BACKENDS[name] = factory
+
+def _load_model(model_name, backend):
+    factory = EMBEDDING_BACKENDS.get(backend)
+    if factory is None:
+        raise ValueError(f"Unknown embedding backend {backend}")
+    return factory(model_name)
+
+def embedding_id(model_name=app_constants.EMBEDDING_MODEL_NAME, backend=None):
+    """Identifier of the vectors a backend produces for a model, used to key caches."""
+    return f"{backend or app_constants.EMBEDDING_BACKEND}/{model_name}"
+
+def get_embeddings(model_name=app_constants.EMBEDDING_MODEL_NAME, backend=None):
+    """Return the shared embeddings instance for model_name, loading it on first use."""
+    backend = backend or app_constants.EMBEDDING_BACKEND
+    key = embedding_id(model_name, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        model_lock = _model_locks.setdefault(key, threading.Lock())
+
+    # Per-model lock so concurrent first callers wait for a single load
+    with model_lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        rss_before = _current_rss_mb()
+        start_time = time.time()
+        model = _load_model(model_name, backend)
+        load_time = time.time() - start_time
+        rss_after = _current_rss_mb()
+        memory_mb = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        _model_stats[key] = {
+            "load_time": load_time,
+            "memory_mb": memory_mb,
+            "loaded_at": time.time(),
+            "pid": os.getpid(),
+        }
+        _models[key] = model
+        memory_info = f", {memory_mb:.1f} MB" if memory_mb is not None else ""
+        app_logger.info(f"Loaded embedding model {key} in {load_time:.2f}s{memory_info}")
+        return model
+
+_warm_up_started = set()
+
+def warm_up(model_names=None):
+    """
+    Load the given models (default: EMBEDDING_MODEL_NAME) on a background thread.
+    Each model is warmed up at most once per process, however often this is called.
+    """
+    model_names = model_names or [app_constants.EMBEDDING_MODEL_NAME]
+    with _registry_lock:
+        pending = [name for name in model_names if name not in _warm_up_started and not is_loaded(name)]
+        _warm_up_started.update(pending)
+    if not pending:
+        return None
+
+    def _warm_up():
+        for name in pending:
+            try:
+                get_embeddings(name).embed_query("warm up")
+            except Exception as e:
+                app_logger.error(f"Failed to warm up embedding model {name}: {e}")
+
+    thread = threading.Thread(target=_warm_up, name="embedding-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+def is_loaded(model_name=app_constants.EMBEDDING_MODEL_NAME, backend=None):
+    return embedding_id(model_name, backend) in _models
+
+def get_model_stats():
+    """Load time (seconds), memory growth (MB) and throughput recorded for each loaded model."""
+    stats = {}
+    for key, load_stats in _model_stats.items():
+        stats[key] = dict(load_stats)
+        model = _models.get(key)
+        if isinstance(model, EmbeddingBackend):
+            stats[key].update(model.stats())
+    return stats
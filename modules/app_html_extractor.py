@@ -0,0 +1,122 @@
+#app_html_extractor.py
+# Text of downloaded web pages for the Researcher's notes.
+#   lxml:   one pass of libxml2's HTML parser with a parser target, no tree is built. Scripts, styles,
+#           navigation, forms and other boilerplate are skipped with their content as the parser reports them,
+#           block elements are separated by spaces and the text is filtered and whitespace-normalized once joined.
+#   legacy: the original BeautifulSoup html.parser + get_text + html2text cleaner, kept for comparison
+#           (benchmarks/bench_html_extractor.py) and as a fallback.
+# Both keep the same characters as before: word characters, whitespace, '.', '<', '>' and '/'.
+
+import re
+from modules import app_constants, app_logger
+
+app_logger = app_logger.app_logger
+
+ENGINES = ("lxml", "legacy")
+DISALLOWED = re.compile(r'[^\w\s<>/\.]+')
+# Removed with their content. Links and images are dropped as the legacy cleaner did.
+DROP_TAGS = (
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "nav", "header", "footer", "aside", "form", "button", "select", "a", "img",
+)
+BLOCK_TAGS = (
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "table", "tr", "td", "th",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "br", "hr", "figure", "figcaption", "title",
+)
+# Whole class and id tokens of boilerplate blocks, compared case-insensitively: "sidebar" and "cookie-banner"
+# but not "has-sidebar" or "advert-free".
+BOILERPLATE_TOKENS = (
+    "cookie", "cookies", "cookie-banner", "cookie-notice", "cookie-consent", "breadcrumb", "breadcrumbs",
+    "sidebar", "newsletter", "newsletter-signup", "advert", "advertisement", "ad-container", "social-share", "share-buttons",
+)
+BOILERPLATE_ROLES = ("navigation", "banner", "contentinfo")
+# Page wrappers are never dropped, sites put state classes such as "has-sidebar" or "sidebar" on them
+WRAPPER_TAGS = ("html", "body", "main", "article")
+
+def _is_boilerplate(tag, attrib):
+    if tag in DROP_TAGS:
+        return True
+    if tag in WRAPPER_TAGS:
+        return False
+    if attrib.get("role") in BOILERPLATE_ROLES or attrib.get("aria-hidden") == "true" or "hidden" in attrib:
+        return True
+    tokens = f"{attrib.get('class', '')} {attrib.get('id', '')}".lower().split()
+    return any(token in BOILERPLATE_TOKENS for token in tokens)
+
+class _TextTarget:
+    """
+    Parser target collecting the text of a page as libxml2 reports it: nothing is built, the content of dropped
+    and boilerplate elements is skipped as it arrives and block elements are separated by spaces.
+    """
+    def __init__(self):
+        self.parts = []
+        self.skip_depth = 0
+
+    def start(self, tag, attrib):
+        if self.skip_depth:
+            self.skip_depth += 1
+        elif _is_boilerplate(tag, attrib):
+            self.skip_depth = 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def end(self, tag):
+        if self.skip_depth:
+            self.skip_depth -= 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def data(self, text):
+        if not self.skip_depth:
+            self.parts.append(text)
+
+    def close(self):
+        return "".join(self.parts)
+
+_lxml = None
+
+def _load_lxml():
+    global _lxml
+    if _lxml is None:
+        from lxml import etree
+        _lxml = etree
+    return _lxml
+
+def lxml_extract_text(content):
+    etree = _load_lxml()
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if not content.strip():
+        return ""
+    parser = etree.HTMLParser(target=_TextTarget(), remove_comments=True, remove_pis=True, no_network=True)
+    try:
+        parser.feed(content)
+        text = parser.close()
+    except (etree.ParserError, etree.XMLSyntaxError, ValueError):
+        return ""
+    return " ".join(DISALLOWED.sub("", text).split())
+
+def legacy_extract_text(content):
+    from bs4 import BeautifulSoup
+    import html2text
+    soup = BeautifulSoup(content, 'html.parser')
+    for script in soup(["script", "style", "img", "a"]):
+        script.extract()
+
+    body_text = soup.get_text()
+    h = html2text.HTML2Text()
+    h.ignore_links = True
+    h.ignore_images = True
+    h.ignore_emphasis = True
+    h.ignore_tables = True
+    clean_text = h.handle(body_text)
+    clean_text = re.sub(r'[^\w\s\n<>/\.]+', '', clean_text)  # Include '.' in the allowed characters
+    clean_text = re.sub(r'\s+', ' ', clean_text).strip()
+    return clean_text
+
+def extract_text(content, engine=None):
+    """Readable text of an HTML page (bytes or str) with the given engine, HTML_EXTRACTOR by default."""
+    engine = engine or app_constants.HTML_EXTRACTOR
+    if engine == "legacy":
+        return legacy_extract_text(content)
+    return lxml_extract_text(content)
@@ -0,0 +1,211 @@
+#app_http_cache.py
+# On-disk HTTP cache for downloaded documents and research pages, used by app_web_fetcher.
+# Each URL keeps its raw body and, once a caller has cleaned it, the extracted text next to it, plus the
+# ETag / Last-Modified validators and the Cache-Control max-age. Fresh entries are served without a request;
+# stale ones are revalidated with a conditional GET, so an unchanged source costs a 304 and no parsing.
+# Entries are evicted least-recently-used once the files exceed HTTP_CACHE_MAX_MB.
+
+import os
+import re
+import sqlite3
+import hashlib
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from modules import app_constants, app_logger
+
+app_logger = app_logger.app_logger
+
+CACHE_DIRECTORY = os.path.join(app_constants.CACHE_DIRECTORY, "http")
+MAX_AGE = re.compile(r'max-age\s*=\s*"?(\d+)"?', re.IGNORECASE)
+
+def _lifetime(headers):
+    """Seconds the response may be served without revalidation, None if it must not be stored."""
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    match = MAX_AGE.search(cache_control)
+    if match:
+        return int(match.group(1))
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            return max(0, int(parsedate_to_datetime(expires).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return 0
+    return 0
+
+def _write_file(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class HTTPCache:
+    def __init__(self, directory=CACHE_DIRECTORY, max_bytes=app_constants.HTTP_CACHE_MAX_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, expires REAL NOT NULL, "
+            "has_text INTEGER NOT NULL DEFAULT 0, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used)")
+        self._conn.commit()
+        # Running upper bound of the cached bytes, summed exactly only when it crosses max_bytes
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _path(self, url, suffix):
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest() + suffix)
+
+    def body_path(self, url):
+        return self._path(url, ".body")
+
+    def text_path(self, url):
+        return self._path(url, ".txt")
+
+    def lookup(self, url):
+        """Cache entry for url (dict with etag, last_modified, expires, has_text) or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT etag, last_modified, expires, has_text FROM entries WHERE url = ?", (url,)).fetchone()
+        if row is None or not os.path.exists(self.body_path(url)):
+            return None
+        return {"url": url, "etag": row[0], "last_modified": row[1], "expires": row[2], "has_text": bool(row[3])}
+
+    @staticmethod
+    def is_fresh(entry):
+        return entry["expires"] > time.time()
+
+    @staticmethod
+    def validators(entry):
+        """Request headers for a conditional GET of entry."""
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, headers, body):
+        """Cache a full response; returns its entry, or None when the response may not be stored."""
+        lifetime = _lifetime(headers)
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        # A response that is neither fresh for a while nor revalidatable would never be served from the cache
+        if lifetime is None or (not lifetime and not etag and not last_modified):
+            self.remove(url)
+            return None
+        now = time.time()
+        with self._lock:
+            _write_file(self.body_path(url), body)
+            _remove_file(self.text_path(url))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (url, etag, last_modified, expires, has_text, size, last_used) VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (url, etag, last_modified, now + lifetime, len(body), now),
+            )
+            self._conn.commit()
+            self._total_bytes += len(body)
+            self._evict()
+        return self.lookup(url)
+
+    def revalidated(self, url, headers):
+        """Record a 304 for url: refresh its lifetime and any new validators. Returns the entry."""
+        lifetime = _lifetime(headers) or 0
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), expires = ?, last_used = ? WHERE url = ?",
+                (headers.get("ETag"), headers.get("Last-Modified"), now + lifetime, now, url),
+            )
+            self._conn.commit()
+        return self.lookup(url)
+
+    def touch(self, url):
+        with self._lock:
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def read_body(self, entry):
+        with open(self.body_path(entry["url"]), "rb") as f:
+            return f.read()
+
+    def read_text(self, entry):
+        """Cleaned text stored with store_text, None if there is none yet."""
+        if not entry["has_text"]:
+            return None
+        try:
+            with open(self.text_path(entry["url"]), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def store_text(self, url, text):
+        data = text.encode("utf-8")
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM entries WHERE url = ?", (url,)).fetchone() is None:
+                return
+            _write_file(self.text_path(url), data)
+            self._conn.execute("UPDATE entries SET has_text = 1, size = size + ? WHERE url = ?", (len(data), url))
+            self._conn.commit()
+            self._total_bytes += len(data)
+            self._evict()
+
+    def remove(self, url):
+        with self._lock:
+            self._delete([url])
+            self._conn.commit()
+
+    def _delete(self, urls):
+        for url in urls:
+            _remove_file(self.body_path(url))
+            _remove_file(self.text_path(url))
+        self._conn.executemany("DELETE FROM entries WHERE url = ?", [(url,) for url in urls])
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self._total_bytes = total
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the limit so eviction does not run on every download
+        target = int(self.max_bytes * 0.9)
+        stale_urls = []
+        for url, size in self._conn.execute("SELECT url, size FROM entries ORDER BY last_used ASC").fetchall():
+            if total <= target:
+                break
+            stale_urls.append(url)
+            total -= size
+        self._delete(stale_urls)
+        self._conn.commit()
+        self._total_bytes = total
+        app_logger.info(f"Evicted {len(stale_urls)} least recently used pages from the HTTP cache")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": entries, "size_mb": size / (1024 * 1024)}
+
+_cache = None
+_lock = threading.Lock()
+
+def get_cache():
+    """Shared HTTPCache, None when HTTP_CACHE_ENABLED is off."""
+    global _cache
+    if not app_constants.HTTP_CACHE_ENABLED:
+        return None
+    with _lock:
+        if _cache is None:
+            _cache = HTTPCache()
+        return _cache
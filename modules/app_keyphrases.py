@@ -0,0 +1,105 @@
+#app_keyphrases.py
+# Offline keyphrase extraction for the Researcher's search keywords, in place of an LLM round trip.
+#   rake:        Rapid Automatic Keyword Extraction, pure Python. Candidate phrases are the runs of words between
+#                stop words and punctuation, each word scores degree / frequency and a phrase the sum of its words.
+#   noun_chunks: noun chunks from spaCy's en_core_web_sm parser, ranked by frequency and length.
+# Short inputs yield few phrases, so the ranked phrases are followed by their best single words. With max_words,
+# longer phrases are left out, as they make poor search terms.
+
+import re
+import threading
+from collections import Counter, defaultdict
+from modules import app_logger
+
+app_logger = app_logger.app_logger
+
+METHODS = ("rake", "noun_chunks")
+WORD = re.compile(r"[a-z0-9][a-z0-9+#\-\.']*[a-z0-9+#]|[a-z0-9]")
+PHRASE_DELIMITERS = re.compile(r"[,;:!?()\[\]{}\"/|\n]|\.(?:\s|$)")
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just let me more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves
+best explain find get give guide help info information know latest learn list make need new show tell topic use using
+vs way ways what's
+""".split())
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def get_nlp():
+    """en_core_web_sm with only the tagger and parser that noun_chunks needs, loaded on first use."""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            _nlp = spacy.load("en_core_web_sm", disable=["ner", "lemmatizer"])
+        return _nlp
+
+def _candidate_phrases(text):
+    phrases = []
+    for fragment in PHRASE_DELIMITERS.split(text.lower()):
+        phrase = []
+        for word in WORD.findall(fragment):
+            if word in STOP_WORDS:
+                if phrase:
+                    phrases.append(tuple(phrase))
+                phrase = []
+            else:
+                phrase.append(word)
+        if phrase:
+            phrases.append(tuple(phrase))
+    return phrases
+
+def _with_single_words(ranked_phrases, word_scores, count):
+    """Ranked phrases, then their highest scoring words not already used as a phrase."""
+    keywords = [" ".join(phrase) for phrase in ranked_phrases]
+    for word in sorted(word_scores, key=word_scores.get, reverse=True):
+        if len(keywords) >= count:
+            break
+        if word not in keywords and len(word) > 2:
+            keywords.append(word)
+    return keywords[:count]
+
+def rake(text, count=5, max_words=None):
+    phrases = [phrase for phrase in _candidate_phrases(text) if not max_words or len(phrase) <= max_words]
+    frequency = Counter()
+    degree = defaultdict(int)
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+    word_scores = {word: degree[word] / frequency[word] for word in frequency}
+    phrase_scores = {}
+    for phrase in phrases:
+        phrase_scores[phrase] = sum(word_scores[word] for word in phrase)
+    ranked = sorted(phrase_scores, key=phrase_scores.get, reverse=True)
+    return _with_single_words(ranked[:count], word_scores, count)
+
+def noun_chunks(text, count=5, max_words=None):
+    doc = get_nlp()(text)
+    chunk_counts = Counter()
+    word_scores = Counter()
+    for chunk in doc.noun_chunks:
+        # Drop leading determiners, pronouns and other stop words: "the latest ransomware" -> "ransomware"
+        words = [token.text.lower() for token in chunk if not token.is_punct]
+        while words and words[0] in STOP_WORDS:
+            words.pop(0)
+        if words and (not max_words or len(words) <= max_words):
+            chunk_counts[tuple(words)] += 1
+            word_scores.update(word for word in words if word not in STOP_WORDS)
+    ranked = sorted(chunk_counts, key=lambda phrase: (chunk_counts[phrase], len(phrase)), reverse=True)
+    return _with_single_words(ranked[:count], word_scores, count)
+
+def extract(text, count=5, method="rake", max_words=None):
+    """Up to count ranked keyphrases of text, [] if none are found or the method fails."""
+    try:
+        if method == "noun_chunks":
+            return noun_chunks(text, count, max_words)
+        return rake(text, count, max_words)
+    except Exception as e:
+        app_logger.error(f"Keyphrase extraction with {method} failed: {e}")
+        return []
@@ -0,0 +1,181 @@
+#app_lexical_index.py
+# BM25 inverted index kept next to each <page>_chroma_db (in <persist_dir>/lexical_index.sqlite3).
+# Postings are written during ingestion and loaded into memory per index version for queries,
+# so exact identifiers such as CVE-2021-44228, AC-2 or T1059.001 are matched without the embedding model.
+
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from modules import app_logger, database_utils
+
+app_logger = app_logger.app_logger
+
+INDEX_FILE = "lexical_index.sqlite3"
+# Words joined by - _ . : / stay one token (ac-2, cve-2021-44228, t1059.001); their parts are indexed too
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.:/][a-z0-9]+)*")
+PART_SEPARATORS = re.compile(r"[-_.:/]")
+# NIST SP 800-53 control families; control ids are matched case-sensitively and only for these, so
+# "top-10", "SHA-256" or "tls-1.2" in an ordinary question are not taken for identifier lookups
+CONTROL_FAMILIES = "AC|AT|AU|CA|CM|CP|IA|IR|MA|MP|PE|PL|PM|PS|PT|RA|SA|SC|SI|SR"
+IDENTIFIER_PATTERN = re.compile(
+    r"\b(?:(?i:CVE-\d{4}-\d{4,}|CWE-\d+|CAPEC-\d+|T[AS]?\d{4}(?:\.\d{3})?)|(?:" + CONTROL_FAMILIES + r")-\d+(?:\.\d+)*(?:\(\d+\))?)\b"
+)
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was what when where which who why with".split()
+)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def tokenize(text):
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if token not in STOP_WORDS:
+            tokens.append(token)
+        parts = PART_SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part and part not in STOP_WORDS)
+    return tokens
+
+def find_identifiers(query):
+    """Identifier tokens in query, e.g. ["cve-2021-44228", "ac-2"] (control enhancements like AC-2(1) map to ac-2)."""
+    return [TOKEN_PATTERN.match(match.group().lower()).group() for match in IDENTIFIER_PATTERN.finditer(query)]
+
+def _index_path(persist_directory):
+    return os.path.join(persist_directory, INDEX_FILE)
+
+def _connect(persist_directory):
+    os.makedirs(persist_directory, exist_ok=True)
+    conn = sqlite3.connect(_index_path(persist_directory), timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, source TEXT, length INTEGER NOT NULL)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+        "PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source)")
+    return conn
+
+def _delete_ids(conn, ids):
+    rows = [(chunk_id,) for chunk_id in ids]
+    conn.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+    conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", rows)
+
+def add_chunks(persist_directory, ids, texts, metadatas):
+    """Index chunks written to the collection at persist_directory, replacing any with the same id."""
+    try:
+        conn = _connect(persist_directory)
+        try:
+            with conn:
+                _delete_ids(conn, ids)
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    counts = Counter(tokenize(text))
+                    conn.execute(
+                        "INSERT INTO chunks (chunk_id, source, length) VALUES (?, ?, ?)",
+                        (chunk_id, (metadata or {}).get("source"), sum(counts.values())),
+                    )
+                    conn.executemany(
+                        "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                        [(term, chunk_id, tf) for term, tf in counts.items()],
+                    )
+        finally:
+            conn.close()
+    except Exception as e:
+        app_logger.error(f"Error updating lexical index for {persist_directory}: {e}")
+
+def delete_chunks(persist_directory, ids):
+    if not os.path.exists(_index_path(persist_directory)):
+        return
+    try:
+        conn = _connect(persist_directory)
+        try:
+            with conn:
+                _delete_ids(conn, ids)
+        finally:
+            conn.close()
+    except Exception as e:
+        app_logger.error(f"Error deleting from lexical index for {persist_directory}: {e}")
+
+def delete_source(persist_directory, source):
+    if not os.path.exists(_index_path(persist_directory)):
+        return
+    try:
+        conn = _connect(persist_directory)
+        try:
+            with conn:
+                ids = [row[0] for row in conn.execute("SELECT chunk_id FROM chunks WHERE source = ?", (source,))]
+                _delete_ids(conn, ids)
+        finally:
+            conn.close()
+    except Exception as e:
+        app_logger.error(f"Error deleting {source} from lexical index for {persist_directory}: {e}")
+
+def rebuild(persist_directory, db):
+    """Build the lexical index from an existing collection, for stores indexed before it existed."""
+    contents = db._collection.get(include=["documents", "metadatas"])
+    if contents["ids"]:
+        add_chunks(persist_directory, contents["ids"], contents["documents"], contents["metadatas"])
+        app_logger.info(f"Built lexical index for {persist_directory} with {len(contents['ids'])} chunks")
+
+class LexicalIndex:
+    """In-memory snapshot of one collection's postings."""
+
+    def __init__(self, postings, lengths):
+        self.postings = postings
+        self.lengths = lengths
+        self.avg_length = (sum(lengths.values()) / len(lengths)) if lengths else 0.0
+
+    def search(self, query, k):
+        """Top k (chunk_id, bm25 score) pairs for query."""
+        scores = {}
+        total = len(self.lengths)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[chunk_id] / (self.avg_length or 1))
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def lookup(self, identifiers):
+        """Chunk ids containing every identifier, most occurrences first."""
+        matches = None
+        counts = Counter()
+        for identifier in identifiers:
+            postings = dict(self.postings.get(identifier, ()))
+            matches = set(postings) if matches is None else matches & set(postings)
+            counts.update(postings)
+        return sorted(matches or (), key=lambda chunk_id: counts[chunk_id], reverse=True)
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+def get_index(persist_directory):
+    """Return the in-memory index for a collection, reloading it when the index version changes."""
+    key = os.path.normpath(persist_directory)
+    version = database_utils.get_index_version(persist_directory)
+    with _loaded_lock:
+        loaded = _loaded.get(key)
+        if loaded is not None and loaded[0] == version:
+            return loaded[1]
+    if not os.path.exists(_index_path(persist_directory)):
+        return None
+    postings = {}
+    lengths = {}
+    conn = _connect(persist_directory)
+    try:
+        for chunk_id, length in conn.execute("SELECT chunk_id, length FROM chunks"):
+            lengths[chunk_id] = length
+        for term, chunk_id, tf in conn.execute("SELECT term, chunk_id, tf FROM postings"):
+            postings.setdefault(term, []).append((chunk_id, tf))
+    finally:
+        conn.close()
+    index = LexicalIndex(postings, lengths)
+    with _loaded_lock:
+        _loaded[key] = (version, index)
+    return index
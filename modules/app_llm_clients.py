@@ -0,0 +1,151 @@
+#app_llm_clients.py
+# Process-wide clients for the OpenAI-compatible model endpoint.
+# Clients are cached per (base_url, api_key, model) and share one keep-alive HTTP connection pool,
+# so questions reuse open TCP/TLS connections. Retries are bounded and use the SDK's jittered backoff.
+# reset() drops everything, e.g. when the About page switches server mode.
+# With LLM_SERVER_SLOTS > 1, sessions are pinned to a slot of a llama.cpp server (assign_slot) so it can reuse
+# their prompt prefix. The llama_cpp.server started by start.sh has no slots and keeps one prompt cache (--cache).
+
+import threading
+import time
+import httpx
+from openai import OpenAI
+from modules import app_constants, app_logger
+
+app_logger = app_logger.app_logger
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+_http_client = None
+_clients = {}
+_health = {}
+_lock = threading.Lock()
+
+def get_timeout():
+    return httpx.Timeout(
+        connect=app_constants.LLM_CONNECT_TIMEOUT,
+        read=app_constants.LLM_READ_TIMEOUT,
+        write=app_constants.LLM_CONNECT_TIMEOUT,
+        pool=app_constants.LLM_CONNECT_TIMEOUT,
+    )
+
+def _get_http_client():
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(
+            timeout=get_timeout(),
+            limits=httpx.Limits(
+                max_connections=app_constants.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=app_constants.LLM_MAX_CONNECTIONS,
+                keepalive_expiry=app_constants.LLM_KEEPALIVE_SECONDS,
+            ),
+        )
+    return _http_client
+
+def _resolve(base_url, api_key, model):
+    return (
+        base_url if base_url is not None else app_constants.model_uri,
+        api_key if api_key is not None else app_constants.openai_api_key,
+        model or app_constants.MODEL_NAME,
+    )
+
+def get_client(base_url=None, api_key=None, model=None):
+    """Shared OpenAI client for the configured endpoint (or the one given)."""
+    base_url, api_key, model = _resolve(base_url, api_key, model)
+    key = ("openai", base_url, api_key, model)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                base_url=base_url,
+                api_key=api_key,
+                http_client=_get_http_client(),
+                timeout=get_timeout(),
+                max_retries=app_constants.LLM_MAX_RETRIES,
+            )
+            _clients[key] = client
+        return client
+
+def get_chat_model(base_url=None, api_key=None, model=None, streaming=True):
+    """Shared langchain ChatOpenAI on the same connection pool, for the langchain chains."""
+    from langchain_openai import ChatOpenAI
+    base_url, api_key, model = _resolve(base_url, api_key, model)
+    key = ("langchain", base_url, api_key, model, streaming)
+    with _lock:
+        llm = _clients.get(key)
+        if llm is None:
+            llm = ChatOpenAI(
+                model_name=model,
+                openai_api_key=api_key,
+                base_url=base_url,
+                streaming=streaming,
+                http_client=_get_http_client(),
+                request_timeout=get_timeout(),
+                max_retries=app_constants.LLM_MAX_RETRIES,
+            )
+            _clients[key] = llm
+        return llm
+
+_next_slot = 0
+
+def assign_slot():
+    """Server slot for a new session, round-robin over LLM_SERVER_SLOTS."""
+    global _next_slot
+    with _lock:
+        slot = _next_slot % app_constants.LLM_SERVER_SLOTS
+        _next_slot += 1
+    return slot
+
+def prompt_cache_params(slot=None):
+    """
+    Request body fields asking a llama.cpp server to reuse its prompt cache and, when the server has
+    several slots, to run on the session's slot. Servers without these options ignore them.
+    """
+    if not app_constants.PROMPT_CACHE_ENABLED:
+        return None
+    params = {"cache_prompt": True}
+    if slot is not None and app_constants.LLM_SERVER_SLOTS > 1:
+        params["id_slot"] = slot
+    return params
+
+def check_health(base_url=None, api_key=None, force=False):
+    """
+    Probe GET {base_url}/models. Results are cached for LLM_HEALTH_CHECK_TTL seconds.
+
+    :return: dict with ok, latency (seconds), error and checked_at
+    """
+    base_url, api_key, _ = _resolve(base_url, api_key, None)
+    key = (base_url, api_key)
+    with _lock:
+        cached = _health.get(key)
+        http_client = _get_http_client()
+    if cached and not force and time.time() - cached["checked_at"] < app_constants.LLM_HEALTH_CHECK_TTL:
+        return cached
+    start_time = time.time()
+    result = {"ok": False, "latency": None, "error": None, "checked_at": start_time}
+    try:
+        # No base URL means the OpenAI API, as for the OpenAI client
+        response = http_client.get(
+            (base_url or OPENAI_BASE_URL).rstrip("/") + "/models",
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=app_constants.LLM_CONNECT_TIMEOUT,
+        )
+        response.raise_for_status()
+        result["ok"] = True
+    except Exception as e:
+        result["error"] = str(e)
+        app_logger.error(f"Model endpoint health check failed for {base_url}: {e}")
+    result["latency"] = time.time() - start_time
+    with _lock:
+        _health[key] = result
+    return result
+
+def reset():
+    """Drop all cached clients, the connection pool and health results."""
+    global _http_client
+    with _lock:
+        # Not closed here: requests still streaming on the old pool finish, and it is released once they are done
+        _http_client = None
+        _clients.clear()
+        _health.clear()
+    app_logger.info("LLM clients reset")
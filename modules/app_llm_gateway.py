@@ -0,0 +1,150 @@
+#app_llm_gateway.py
+# Admission control in front of the model server. At most LLM_GATEWAY_CONCURRENCY requests run at once;
+# the rest wait in a priority queue (interactive chat before research keywords before summarization) and,
+# within a priority, are ordered by start-time fair queueing so one user cannot starve the others.
+# Full queues reject new requests at once with GatewayBusyError instead of letting every request time out.
+# The scheduler runs on its own asyncio event loop; callers use the blocking admit() context manager
+# and keep their slot until the block exits, which for streamed answers is when the stream ends.
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from modules import app_constants, app_logger
+
+app_logger = app_logger.app_logger
+
+INTERACTIVE = 0
+RESEARCH = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", RESEARCH: "research", BACKGROUND: "background"}
+
+class GatewayBusyError(Exception):
+    """The request was rejected by admission control instead of being queued or was not admitted in time."""
+
+class LLMGateway:
+    def __init__(self, concurrency, max_queue, max_queue_per_user, max_wait):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self._heap = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._user_tags = {}
+        self._in_flight = 0
+        self._queued = Counter()
+        self._queued_per_user = Counter()
+        self._stats = {priority: {"admitted": 0, "rejected": 0, "timed_out": 0, "completed": 0, "wait_total": 0.0, "service_total": 0.0} for priority in PRIORITY_NAMES}
+        self._stats_lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+    def _count(self, priority, field, amount=1):
+        with self._stats_lock:
+            self._stats[priority][field] += amount
+
+    # The methods below run on the gateway's event loop
+
+    async def _acquire(self, priority, user):
+        if self._in_flight < self.concurrency and not self._heap:
+            self._in_flight += 1
+            return
+        if self._queued[priority] >= self.max_queue or self._queued_per_user[user] >= self.max_queue_per_user:
+            self._count(priority, "rejected")
+            raise GatewayBusyError(f"Model server is busy: {self._queued[priority]} {PRIORITY_NAMES[priority]} requests already waiting")
+        # Start-time fair queueing: a user's next request is tagged after their previous one
+        tag = max(self._virtual_time, self._user_tags.get(user, 0.0)) + 1.0
+        self._user_tags[user] = tag
+        future = self.loop.create_future()
+        heapq.heappush(self._heap, (priority, tag, next(self._seq), future, user))
+        self._queued[priority] += 1
+        self._queued_per_user[user] += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done():
+                return
+            future.cancel()
+            self._queued[priority] -= 1
+            self._queued_per_user[user] -= 1
+            self._count(priority, "timed_out")
+            raise GatewayBusyError(f"Model server is busy: not admitted within {self.max_wait}s")
+
+    def _dispatch(self):
+        while self._in_flight < self.concurrency and self._heap:
+            priority, tag, _, future, user = heapq.heappop(self._heap)
+            if future.cancelled():
+                continue
+            self._queued[priority] -= 1
+            self._queued_per_user[user] -= 1
+            self._virtual_time = tag
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    @contextmanager
+    def admit(self, priority=INTERACTIVE, user=""):
+        """
+        Block until the request may run, then hold its slot for the duration of the with block.
+        Yields a dict with queue_wait (seconds); raises GatewayBusyError when rejected.
+        """
+        requested = time.time()
+        asyncio.run_coroutine_threadsafe(self._acquire(priority, user or "anonymous"), self.loop).result()
+        admitted = time.time()
+        self._count(priority, "admitted")
+        self._count(priority, "wait_total", admitted - requested)
+        ticket = {"queue_wait": admitted - requested}
+        try:
+            yield ticket
+        finally:
+            self.loop.call_soon_threadsafe(self._release)
+            ticket["service_time"] = time.time() - admitted
+            self._count(priority, "completed")
+            self._count(priority, "service_total", ticket["service_time"])
+
+    def stats(self):
+        """Per priority class: admitted, rejected, timed out, queued now and average queue wait and service time."""
+        with self._stats_lock:
+            result = {}
+            for priority, name in PRIORITY_NAMES.items():
+                counts = self._stats[priority]
+                result[name] = {
+                    "admitted": counts["admitted"],
+                    "rejected": counts["rejected"],
+                    "timed_out": counts["timed_out"],
+                    "queued": self._queued[priority],
+                    "avg_wait": counts["wait_total"] / counts["admitted"] if counts["admitted"] else 0.0,
+                    "avg_service": counts["service_total"] / counts["completed"] if counts["completed"] else 0.0,
+                }
+            result["in_flight"] = self._in_flight
+            return result
+
+_gateway = None
+_lock = threading.Lock()
+
+def get_gateway():
+    global _gateway
+    with _lock:
+        if _gateway is None:
+            _gateway = LLMGateway(
+                app_constants.LLM_GATEWAY_CONCURRENCY,
+                app_constants.LLM_GATEWAY_MAX_QUEUE,
+                app_constants.LLM_GATEWAY_MAX_QUEUE_PER_USER,
+                app_constants.LLM_GATEWAY_MAX_WAIT,
+            )
+        return _gateway
+
+def admit(priority=INTERACTIVE, user=""):
+    return get_gateway().admit(priority, user)
+
+def stats():
+    return get_gateway().stats()
@@ -39,6 +39,12 @@ PAGE_CONFIG = {
         "system_role": "As ZySec, specializing in policy analysis and advice, and developed by the ZySec AI team, use AI to clarify and explain policies.",
         "content": ["policies","policy","guidelines"]
     },
+    "nav_all_documents": {
+        "title": "All Documents",
+        "caption": "🗂️ Search playbooks, standards and policies together.",
+        "greeting": "Ask me anything across your playbooks, standards and policies.",
+        "system_role": "As ZySec, developed by the ZySec AI team, answer using playbooks, standards and policies together, and point out which collection each insight comes from. Please review and complete task from user input like a security expert."
+    },
     "nav_file_manager": {
         "title": "File Manager",
         "caption": "📃 Explore the content in your application, enable to maintain focus of ZySec."
@@ -0,0 +1,226 @@
+#app_processed_registry.py
+# Registry of indexed files backed by SQLite, replacing the linear-scan index_processed.log.
+# Reads are served from an in-memory view. This process's writes update it row by row; it is rebuilt from
+# the table only when the database file was changed by another process.
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from modules import app_constants, app_logger
+
+app_logger = app_logger.app_logger
+
+REGISTRY_FILE = os.path.join(app_constants.WORKSPACE_DIRECTORY, app_constants.PROCESSED_DOCS_DB)
+LEGACY_LOG_FILE = os.path.join(app_constants.WORKSPACE_DIRECTORY, app_constants.PROCESSED_DOCS)
+# Research notes are indexed from here into temporary stores (is_persistent=False)
+TEMP_PREFIX = app_constants.WORKSPACE_DIRECTORY + "tmp"
+
+class RegistryTransaction:
+    """Changes staged inside ProcessedFilesRegistry.transaction(), committed together."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        # (page, path, entry) in order, entry None for a removal, applied to the in-memory view after the commit
+        self.changes = []
+
+    def record(self, md5, page, path, size=None, mtime=None, persistent=True):
+        entry = {"page": page, "path": path, "md5": md5, "size": size, "mtime": mtime, "indexed_at": time.time(), "persistent": int(persistent)}
+        self._conn.execute(
+            "INSERT OR REPLACE INTO processed_files (page, path, md5, size, mtime, indexed_at, persistent) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (page, path, md5, size, mtime, entry["indexed_at"], entry["persistent"]),
+        )
+        self.changes.append((page, path, entry))
+
+    def remove(self, page, path):
+        self._conn.execute("DELETE FROM processed_files WHERE page = ? AND path = ?", (page, path))
+        self.changes.append((page, path, None))
+
+class ProcessedFilesRegistry:
+    def __init__(self, path=REGISTRY_FILE, legacy_log=LEGACY_LOG_FILE):
+        self.path = path
+        self.legacy_log = legacy_log
+        self._lock = threading.RLock()
+        self._signature = None
+        self._migrated = False
+        self._by_md5 = {}
+        self._by_path = {}
+        self._by_page = {}
+
+    def _connect(self):
+        is_new = not os.path.exists(self.path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if is_new:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_files ("
+                "page TEXT NOT NULL, path TEXT NOT NULL, md5 TEXT NOT NULL, size INTEGER, mtime REAL, "
+                "indexed_at REAL NOT NULL, persistent INTEGER NOT NULL DEFAULT 1, PRIMARY KEY (page, path))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_files_md5 ON processed_files(md5)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_files_path ON processed_files(path)")
+            self._import_legacy_log(conn)
+            conn.commit()
+        elif not self._migrated:
+            self._add_persistent_column(conn)
+        self._migrated = True
+        return conn
+
+    def _add_persistent_column(self, conn):
+        """Registries created before the persistent column: files indexed from the temp directory were research notes."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(processed_files)")}
+        if "persistent" in columns:
+            return
+        conn.execute("ALTER TABLE processed_files ADD COLUMN persistent INTEGER NOT NULL DEFAULT 1")
+        conn.execute("UPDATE processed_files SET persistent = 0 WHERE path LIKE ?", (TEMP_PREFIX + "%",))
+        conn.commit()
+
+    def _import_legacy_log(self, conn):
+        """Import rows from the md5,module,path CSV log used before the registry existed."""
+        if not os.path.exists(self.legacy_log):
+            return
+        imported = 0
+        try:
+            with open(self.legacy_log, "r", encoding="utf-8") as log_file:
+                for line in log_file:
+                    parts = line.strip().split(",", 2)
+                    if len(parts) < 3:
+                        continue
+                    md5, page, path = parts
+                    RegistryTransaction(conn).record(md5, page, path, persistent=not path.startswith(TEMP_PREFIX))
+                    imported += 1
+            app_logger.info(f"Imported {imported} entries from {self.legacy_log} into {self.path}")
+        except Exception as e:
+            app_logger.error(f"Error importing processed files log {self.legacy_log}: {e}")
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _refresh(self, force=False):
+        signature = self._file_signature()
+        if not force and signature == self._signature:
+            return
+        by_md5, by_path, by_page = {}, {}, {}
+        if signature is not None:
+            conn = self._connect()
+            try:
+                rows = conn.execute("SELECT page, path, md5, size, mtime, indexed_at, persistent FROM processed_files ORDER BY indexed_at").fetchall()
+            finally:
+                conn.close()
+            for row in rows:
+                entry = dict(row)
+                by_md5.setdefault(entry["md5"], []).append(entry)
+                by_path.setdefault(entry["path"], []).append(entry)
+                by_page.setdefault(entry["page"].lower(), {})[entry["path"]] = entry
+            signature = self._file_signature()
+        self._by_md5, self._by_path, self._by_page = by_md5, by_path, by_page
+        self._signature = signature
+
+    def _forget(self, page, path):
+        for entry in self._by_path.get(path, []):
+            if entry["page"] == page:
+                break
+        else:
+            return
+        for index, key in ((self._by_md5, entry["md5"]), (self._by_path, path)):
+            index[key].remove(entry)
+            if not index[key]:
+                del index[key]
+        page_entries = self._by_page.get(page.lower(), {})
+        if page_entries.get(path) is entry:
+            del page_entries[path]
+            if not page_entries:
+                del self._by_page[page.lower()]
+
+    def _apply(self, changes):
+        """Update the in-memory view with the committed changes of a transaction."""
+        for page, path, entry in changes:
+            self._forget(page, path)
+            if entry is not None:
+                self._by_md5.setdefault(entry["md5"], []).append(entry)
+                self._by_path.setdefault(path, []).append(entry)
+                self._by_page.setdefault(page.lower(), {})[path] = entry
+
+    def initialize(self):
+        """Create the registry file, importing the legacy log if present."""
+        with self._lock:
+            self._connect().close()
+            self._refresh(force=True)
+
+    @contextmanager
+    def transaction(self):
+        """Apply several record/remove calls atomically."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                # Checked under the write lock: the view is current unless another process wrote since it was read
+                is_current = self._signature is not None and self._file_signature() == self._signature
+                txn = RegistryTransaction(conn)
+                yield txn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            if is_current:
+                self._apply(txn.changes)
+                self._signature = self._file_signature()
+            else:
+                self._refresh(force=True)
+
+    def record(self, md5, page, path, size=None, mtime=None, persistent=True):
+        with self.transaction() as txn:
+            txn.record(md5, page, path, size, mtime, persistent)
+
+    def remove(self, page, path):
+        with self.transaction() as txn:
+            txn.remove(page, path)
+
+    def is_processed(self, md5):
+        with self._lock:
+            self._refresh()
+            return md5 in self._by_md5
+
+    def get_by_md5(self, md5):
+        with self._lock:
+            self._refresh()
+            return list(self._by_md5.get(md5, []))
+
+    def get_by_path(self, path):
+        with self._lock:
+            self._refresh()
+            return list(self._by_path.get(path, []))
+
+    def get(self, page, path):
+        with self._lock:
+            self._refresh()
+            return self._by_page.get(page.lower(), {}).get(path)
+
+    def files_for_page(self, page):
+        with self._lock:
+            self._refresh()
+            return list(self._by_page.get(page.lower(), {}).values())
+
+    def all_paths(self):
+        with self._lock:
+            self._refresh()
+            return set(self._by_path)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """Return the process-wide registry for the workspace."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProcessedFilesRegistry()
+        return _registry
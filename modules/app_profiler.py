@@ -0,0 +1,89 @@
+#app_profiler.py
+# Startup profiler: records how long each module takes to import.
+# Enable with ZYSEC_PROFILE_STARTUP=1; it must be started before the imports it should measure.
+# Only the standard library is imported here so that nothing is loaded before profiling starts.
+
+import os
+import sys
+import threading
+import time
+
+_timings = {}
+_local = threading.local()
+_finder = None
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+def _timed_exec_module(name, exec_module):
+    def exec_module_with_timing(module):
+        stack = _stack()
+        stack.append(0.0)
+        start_time = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            _timings[name] = {"cumulative": elapsed, "self": elapsed - nested}
+    return exec_module_with_timing
+
+class _ImportTimingFinder:
+    """Meta path finder that delegates to the other finders and times the module's execution."""
+
+    def find_spec(self, fullname, path=None, target=None):
+        if getattr(_local, "finding", False):
+            return None
+        _local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            _local.finding = False
+        loader = spec.loader
+        # Built-in and frozen importers are classes shared by every module, leave them alone
+        if loader is not None and not isinstance(loader, type) and hasattr(loader, "exec_module"):
+            loader.exec_module = _timed_exec_module(fullname, loader.exec_module)
+        return spec
+
+def is_enabled():
+    return os.environ.get("ZYSEC_PROFILE_STARTUP", "").lower() in ("1", "yes", "true", "on")
+
+def start():
+    """Start recording import times for every module imported from now on."""
+    global _finder
+    if _finder is None:
+        _finder = _ImportTimingFinder()
+        sys.meta_path.insert(0, _finder)
+
+def start_if_enabled():
+    if is_enabled():
+        start()
+
+def stop():
+    global _finder
+    if _finder is not None and _finder in sys.meta_path:
+        sys.meta_path.remove(_finder)
+    _finder = None
+
+def get_import_times():
+    """Return (module, cumulative seconds, self seconds) sorted by cumulative time."""
+    rows = [(name, timing["cumulative"], timing["self"]) for name, timing in _timings.items()]
+    return sorted(rows, key=lambda row: row[1], reverse=True)
+
+def format_report(limit=25):
+    rows = get_import_times()
+    lines = [f"{'cumulative':>10} {'self':>8}  module"]
+    for name, cumulative, self_time in rows[:limit]:
+        lines.append(f"{cumulative:10.3f} {self_time:8.3f}  {name}")
+    return "\n".join(lines)
@@ -1,64 +1,228 @@
 # app_combined_prompt.py
+import time
 import modules.app_constants as app_constants  # Ensure this is correctly referenced
-from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQAWithSourcesChain
-from openai import OpenAI
-from modules import app_logger, common_utils, app_st_session_utils
+from modules import app_logger, common_utils, app_st_session_utils, app_answer_engine, app_llm_clients, app_llm_gateway, app_response_cache, app_tokenizer
 
 # Use the logger from app_config
 app_logger = app_logger.app_logger
 
+BUSY_MESSAGE = "The model server is busy with other requests right now, please try again in a moment. ({error})"
+ERROR_MESSAGE = "Is model server running ? Ensure you have right settings at About/Server Mode Selection (You can try demo mode).\n An error occurred while querying the language model: {error}"
+
+def _build_retrieval_chain(retriever):
+    app_logger.info("Using ChatOpenAI with RetrievalQAWithSourcesChain")
+    # Imported here so the Private AI chat page does not load langchain
+    from langchain.chains import RetrievalQAWithSourcesChain
+    return RetrievalQAWithSourcesChain.from_chain_type(
+        llm=app_llm_clients.get_chat_model(),
+        chain_type=app_constants.RAG_TECHNIQUE,
+        retriever=retriever,
+        return_source_documents=False
+    )
+
+def _build_messages(prompt, page, message_store, last_page):
+    # Update page messages if there's a change in the page
+    if last_page != page:
+        app_logger.info(f"Updating messages for new page: {page}")
+        common_utils.get_system_role(page, message_store)
+
+    # Construct messages to send to the LLM, excluding timestamps
+    messages_to_send = common_utils.construct_messages_to_send(page, message_store, prompt)
+    app_logger.debug(messages_to_send)
+    return messages_to_send
+
+def _cache_page(page, message_store):
+    """Page to cache the answer under in app_response_cache, None for follow-ups unless RESPONSE_CACHE_FOLLOW_UPS."""
+    if not app_constants.RESPONSE_CACHE_FOLLOW_UPS and message_store.get_history(page):
+        return None
+    return page
+
+def _system_role(messages_to_send):
+    return messages_to_send[0]["content"] if messages_to_send[0]["role"] == "system" else ""
+
+def _shape_request(message_store, messages_to_send, sent_messages, stats):
+    """
+    Pin the session to a server slot and measure how much of the prompt repeats the previous request's
+    prefix, which the server can take from its prompt cache. Returns the extra request body fields.
+    """
+    if not app_constants.PROMPT_CACHE_ENABLED:
+        return None
+    if message_store.slot is None:
+        message_store.slot = app_llm_clients.assign_slot()
+    tokenizer = app_tokenizer.get_tokenizer()
+    costs = [message_store.get_token_count(message, tokenizer) + app_tokenizer.MESSAGE_OVERHEAD for message in messages_to_send]
+    reused = 0
+    for index, (message, previous) in enumerate(zip(messages_to_send, message_store.last_prompt)):
+        if message != previous:
+            break
+        reused += costs[index]
+    stats["prefix_tokens"] = reused
+    stats["prefix_reuse"] = reused / sum(costs) if costs else 0.0
+    message_store.last_prompt = sent_messages
+    app_logger.info(f"Slot {message_store.slot}: {reused} of {sum(costs)} prompt tokens repeat the previous request")
+    return app_llm_clients.prompt_cache_params(message_store.slot)
+
+def _admission(username):
+    """Interactive-priority admission through app_llm_gateway for this user."""
+    return lambda: app_llm_gateway.admit(app_llm_gateway.INTERACTIVE, username)
+
 # Define a function to query the language model
-def query_llm(prompt, page="nav_private_ai", retriever=None, message_store=None, use_retrieval_chain=False, last_page=None, username=""):
+def query_llm(prompt, page="nav_private_ai", retriever=None, message_store=None, use_retrieval_chain=False, last_page=None, username="", answer_stats=None):
     try:
+        # stuff and map_reduce go through app_answer_engine, other techniques through the langchain chain
+        use_answer_engine = use_retrieval_chain and app_constants.RAG_TECHNIQUE in app_answer_engine.ANSWER_MODES
         # Choose the language model client based on the use_retrieval_chain flag
-        if use_retrieval_chain:
-            app_logger.info("Using ChatOpenAI with RetrievalQAWithSourcesChain")
-            llm = ChatOpenAI(
-                model_name=app_constants.MODEL_NAME,
-                openai_api_key=app_constants.openai_api_key,
-                base_url=app_constants.model_uri,
-                streaming=True
-            )
-            qa = RetrievalQAWithSourcesChain.from_chain_type(
-                llm=llm,
-                chain_type=app_constants.RAG_TECHNIQUE,
-                retriever=retriever,
-                return_source_documents=False
-            )
+        if use_answer_engine:
+            app_logger.info(f"Using answer engine in {app_constants.RAG_TECHNIQUE} mode")
+        elif use_retrieval_chain:
+            qa = _build_retrieval_chain(retriever)
         else:
             app_logger.info("Using direct OpenAI API call")
-            llm = OpenAI(
-                base_url=app_constants.model_uri,
-                api_key=app_constants.openai_api_key
-            )
-
-        # Update page messages if there's a change in the page
-        if last_page != page:
-            app_logger.info(f"Updating messages for new page: {page}")
-            common_utils.get_system_role(page, message_store)
+            llm = app_llm_clients.get_client()
 
-        # Construct messages to send to the LLM, excluding timestamps
-        messages_to_send = common_utils.construct_messages_to_send(page, message_store, prompt)
-        app_logger.debug(messages_to_send)
+        messages_to_send = _build_messages(prompt, page, message_store, last_page)
         # Sending the messages to the LLM and retrieving the response
+        cache_page = _cache_page(page, message_store)
+        request_stats = {}
+        # The answer engine adds retrieved context to the last message, so only the rest is a reusable prefix
+        extra_body = _shape_request(message_store, messages_to_send, messages_to_send[:-1] if use_answer_engine else messages_to_send, request_stats)
         response = None
-        if use_retrieval_chain:
-            response = qa.invoke(prompt)
+        cached = None
+        if use_answer_engine:
+            raw_msg, source_info, stats = app_answer_engine.answer(prompt, retriever, messages_to_send, cache_page=cache_page, extra_body=extra_body, admission=_admission(username))
+            request_stats.update(stats)
+        elif use_retrieval_chain:
+            with _admission(username)() as ticket:
+                request_stats["queue_wait"] = ticket["queue_wait"]
+                response = qa.invoke(prompt)
         else:
-            response = llm.chat.completions.create(
-                model=app_constants.MODEL_NAME,
-                messages=messages_to_send
-            )
+            cached = cache_page and app_response_cache.lookup(cache_page, _system_role(messages_to_send), [], prompt)
+            if cached:
+                raw_msg, source_info = cached[0], ''
+            else:
+                with _admission(username)() as ticket:
+                    request_stats["queue_wait"] = ticket["queue_wait"]
+                    response = llm.chat.completions.create(
+                        model=app_constants.MODEL_NAME,
+                        messages=messages_to_send,
+                        extra_body=extra_body
+                    )
 
         # Process the response
-        raw_msg = response.get('answer') if use_retrieval_chain else response.choices[0].message.content
-        source_info = response.get('sources', '').strip() if use_retrieval_chain else ''
+        if not use_answer_engine and not cached:
+            raw_msg = response.get('answer') if use_retrieval_chain else response.choices[0].message.content
+            source_info = response.get('sources', '').strip() if use_retrieval_chain else ''
+            if cache_page and not use_retrieval_chain:
+                app_response_cache.store(cache_page, _system_role(messages_to_send), [], prompt, raw_msg)
         formatted_msg = app_st_session_utils.format_response(raw_msg + "Source: " + source_info if source_info else raw_msg)
+        if answer_stats is not None:
+            answer_stats.update(request_stats)
 
         return formatted_msg
 
+    except app_llm_gateway.GatewayBusyError as e:
+        app_logger.warning(f"Request from {username or 'anonymous'} rejected: {e}")
+        return BUSY_MESSAGE.format(error=e)
     except Exception as e:
-        error_message = f"Is model server running ? Ensure you have right settings at About/Server Mode Selection (You can try demo mode).\n An error occurred while querying the language model: {e}"
+        error_message = ERROR_MESSAGE.format(error=e)
         app_logger.error(error_message)
         return error_message
+
+def _timed_stream(chunks, stream_stats, start_time):
+    """Pass chunks through, recording time to first token and tokens per second in stream_stats."""
+    first_token_time = None
+    parts = []
+    try:
+        for chunk in chunks:
+            if first_token_time is None:
+                first_token_time = time.time()
+            parts.append(chunk)
+            yield chunk
+    finally:
+        end_time = time.time()
+        first_token_time = first_token_time or end_time
+        generation_time = end_time - first_token_time
+        # Servers send a few tokens per chunk, so the streamed text is counted with the tokenizer
+        tokens = app_tokenizer.count_tokens("".join(parts))
+        stream_stats.update({
+            "time_to_first_token": first_token_time - start_time,
+            "chunks": len(parts),
+            "tokens": tokens,
+            "tokens_per_second": tokens / generation_time if generation_time > 0 else 0.0,
+            "total_seconds": end_time - start_time,
+        })
+        app_logger.info(
+            f"Streamed {tokens} tokens in {len(parts)} chunks, first token after {stream_stats['time_to_first_token']:.2f}s, "
+            f"{stream_stats['tokens_per_second']:.1f} tokens/s"
+        )
+
+def _stream_answer(prompt, page, retriever, message_store, use_retrieval_chain, last_page, username, stream_stats, start_time):
+    use_answer_engine = use_retrieval_chain and app_constants.RAG_TECHNIQUE in app_answer_engine.ANSWER_MODES
+    messages_to_send = _build_messages(prompt, page, message_store, last_page)
+    cache_page = _cache_page(page, message_store)
+    extra_body = _shape_request(message_store, messages_to_send, messages_to_send[:-1] if use_answer_engine else messages_to_send, stream_stats)
+    source_info = ''
+    if use_answer_engine:
+        app_logger.info(f"Streaming from answer engine in {app_constants.RAG_TECHNIQUE} mode")
+        yield from _timed_stream(app_answer_engine.answer_stream(prompt, retriever, messages_to_send, stream_stats, cache_page=cache_page, extra_body=extra_body, admission=_admission(username)), stream_stats, start_time)
+        source_info = stream_stats.get("sources", "")
+    elif use_retrieval_chain:
+        # The langchain chains make several LLM calls, so only their final answer is shown, in one piece,
+        # and there is no time to first token to report
+        with _admission(username)() as ticket:
+            stream_stats["queue_wait"] = ticket["queue_wait"]
+            response = _build_retrieval_chain(retriever).invoke(prompt)
+        stream_stats["total_seconds"] = time.time() - start_time
+        yield response.get('answer')
+        source_info = response.get('sources', '').strip()
+    else:
+        cached = cache_page and app_response_cache.lookup(cache_page, _system_role(messages_to_send), [], prompt)
+        if cached:
+            stream_stats["cache"] = cached[2]
+            stream_stats["total_seconds"] = time.time() - start_time
+            yield cached[0]
+            return
+        app_logger.info("Streaming from direct OpenAI API call")
+        llm = app_llm_clients.get_client()
+        parts = []
+        with _admission(username)() as ticket:
+            stream_stats["queue_wait"] = ticket["queue_wait"]
+            response = llm.chat.completions.create(
+                model=app_constants.MODEL_NAME,
+                messages=messages_to_send,
+                stream=True,
+                extra_body=extra_body
+            )
+            deltas = (chunk.choices[0].delta.content for chunk in response if chunk.choices and chunk.choices[0].delta.content)
+            for delta in _timed_stream(deltas, stream_stats, start_time):
+                parts.append(delta)
+                yield delta
+        if cache_page:
+            app_response_cache.store(cache_page, _system_role(messages_to_send), [], prompt, "".join(parts))
+    if source_info:
+        yield "\n\nSource: " + source_info
+
+def query_llm_stream(prompt, page="nav_private_ai", retriever=None, message_store=None, use_retrieval_chain=False, last_page=None, username="", stream_stats=None):
+    """
+    Streaming variant of query_llm: yields the response as it is generated.
+    stream_stats receives total_seconds once the stream ends and, for answers generated as a stream,
+    time_to_first_token, chunks, tokens and tokens_per_second. An error after part of the answer was
+    streamed is put in stream_stats["error"] instead of the stream, so it is not saved with the answer.
+    """
+    start_time = time.time()
+    stream_stats = {} if stream_stats is None else stream_stats
+    streamed = False
+    try:
+        for chunk in _stream_answer(prompt, page, retriever, message_store, use_retrieval_chain, last_page, username, stream_stats, start_time):
+            streamed = True
+            yield chunk
+    except app_llm_gateway.GatewayBusyError as e:
+        app_logger.warning(f"Request from {username or 'anonymous'} rejected: {e}")
+        yield BUSY_MESSAGE.format(error=e)
+    except Exception as e:
+        error_message = ERROR_MESSAGE.format(error=e)
+        app_logger.error(error_message)
+        if streamed:
+            stream_stats["error"] = error_message
+        else:
+            yield error_message
@@ -0,0 +1,82 @@
+#app_query_cache.py
+# Two-level query cache for retrieval:
+#   1. normalized query text -> query embedding
+#   2. (collection, index version, query, k) -> retrieved (chunk id, distance) pairs
+# Entries expire after a TTL and are evicted least-recently-used. Retrieval entries for a collection are
+# dropped when database_utils.mark_index_changed reports a write, and never match a newer index version.
+
+import threading
+import time
+from collections import OrderedDict
+from modules import app_constants
+
+class LRUTTLCache:
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[1] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+_query_embeddings = LRUTTLCache(app_constants.QUERY_CACHE_SIZE, app_constants.QUERY_CACHE_TTL)
+_retrievals = LRUTTLCache(app_constants.QUERY_CACHE_SIZE, app_constants.QUERY_CACHE_TTL)
+
+def normalize_query(query):
+    # The MiniLM tokenizer is uncased, so case and spacing do not change the embedding
+    return " ".join(query.lower().split())
+
+def get_query_embedding(query, embeddings, embedding_id):
+    """Return the embedding of query, computing it with embeddings only on a cache miss."""
+    key = (embedding_id, normalize_query(query))
+    vector = _query_embeddings.get(key)
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        _query_embeddings.put(key, vector)
+    return vector
+
+def get_retrieval(collection, version, query, k):
+    return _retrievals.get((collection, version, normalize_query(query), k))
+
+def put_retrieval(collection, version, query, k, results):
+    """Store the (chunk id, distance) pairs retrieved for query."""
+    _retrievals.put((collection, version, normalize_query(query), k), list(results))
+
+def invalidate_collection(collection):
+    _retrievals.discard_where(lambda key: key[0] == collection)
+
+def stats():
+    return {"query_embeddings": _query_embeddings.stats(), "retrievals": _retrievals.stats()}
@@ -1,51 +1,102 @@
-import requests
-from bs4 import BeautifulSoup
-import html2text
 import re
 import os
-from modules import app_constants, file_utils, app_logger
+from modules import app_constants, file_utils, app_logger, app_llm_clients, app_llm_gateway, app_web_fetcher, app_query_cache, app_keyphrases, app_html_extractor
 import json
-from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
-import spacy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from duckduckgo_search import DDGS
-nlp = spacy.load("en_core_web_sm")
 
 # Use the logger from app_config
 app_logger = app_logger.app_logger
 
 TMP_DIRECTORY = app_constants.WORKSPACE_DIRECTORY + 'tmp'
 DEFAULT_SEARCH_COUNT = app_constants.SEARCH_COUNT
+# Sentence boundary after ., ! or ? followed by whitespace, used by the "regex" segmenter
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+_keyword_cache = app_query_cache.LRUTTLCache(app_constants.SEARCH_CACHE_SIZE, app_constants.SEARCH_CACHE_TTL)
+_search_cache = app_query_cache.LRUTTLCache(app_constants.SEARCH_CACHE_SIZE, app_constants.SEARCH_CACHE_TTL)
+_search_executor = ThreadPoolExecutor(max_workers=app_constants.SEARCH_WORKERS, thread_name_prefix="ddg-search")
+
+def get_nlp():
+    """Load the spaCy pipeline for app_constants.SENTENCE_SEGMENTER on first use."""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            if app_constants.SENTENCE_SEGMENTER == "parser":
+                _nlp = spacy.load("en_core_web_sm")
+            else:
+                # Rule-based sentence boundaries only, no tagger, parser or NER
+                _nlp = spacy.blank("en")
+                _nlp.add_pipe("sentencizer")
+        return _nlp
+
+def segment_texts(texts):
+    """Split each text into sentences, processing all texts in one batch."""
+    if app_constants.SENTENCE_SEGMENTER == "regex":
+        return [[sentence for sentence in SENTENCE_BOUNDARY.split(text.strip()) if sentence] for text in texts]
+    nlp = get_nlp()
+    docs = nlp.pipe(texts, batch_size=app_constants.SENTENCE_BATCH_SIZE, n_process=app_constants.SENTENCE_PROCESSES)
+    return [[sent.text for sent in doc.sents] for doc in docs]
+
+def pack_sentences(sentences):
+    """Group sentences into text blocks of 120 to 240 words (a trailing block needs 300)."""
+    blocks = []
+    text_block = ""
+    word_count = 0
+    for sentence in sentences:
+        sentence_word_count = len(sentence.split())
+        if word_count + sentence_word_count > 240:  # If adding the sentence exceeds the max limit
+            if word_count >= 120:  # Ensure the text block meets the minimum word count
+                blocks.append(text_block)
+            # Reset text block and word count
+            text_block = sentence
+            word_count = sentence_word_count
+        else:
+            # Add the sentence to the text block
+            text_block += ' ' + sentence if text_block else sentence
+            word_count += sentence_word_count
+
+    # Keep any remaining text block if it meets the minimum word count
+    if word_count >= 300:
+        blocks.append(text_block)
+    return blocks
+
+def clean_html(content):
+    """Readable text of an HTML page (bytes or str), see app_html_extractor."""
+    return app_html_extractor.extract_text(content)
+
+def page_text(result):
+    """Cleaned text of a fetched page; unchanged pages reuse the text cached with them instead of being parsed again."""
+    cache = app_web_fetcher.get_fetcher().cache
+    entry = result.cache_entry
+    if result.content is None:
+        text = cache.read_text(entry)
+        if text is not None:
+            return text
+        content = cache.read_body(entry)
+    else:
+        content = result.content
+    text = clean_html(content)
+    if entry:
+        cache.store_text(result.url, text)
+    return text
 
 def download_and_clean(url):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0"}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        for script in soup(["script", "style", "img", "a"]):
-            script.extract()
-
-        body_text = soup.get_text()
-        h = html2text.HTML2Text()
-        h.ignore_links = True
-        h.ignore_images = True
-        h.ignore_emphasis = True
-        h.ignore_tables = True
-        clean_text = h.handle(body_text)
-        clean_text = re.sub(r'[^\w\s\n<>/\.]+', '', clean_text)  # Include '.' in the allowed characters
-        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-        return clean_text
-
-    except requests.exceptions.RequestException as e:
-        app_logger.error(f"Error while downloading and cleaning URL {url}: {str(e)}")
+    result = app_web_fetcher.get_fetcher().fetch(url)
+    if result.error:
+        app_logger.error(f"Error while downloading and cleaning URL {url}: {result.error}")
         return None
+    return page_text(result)
 
-def save_notes_to_file(topic, note, source_url):
-    # Process the text
-    doc = nlp(note)
-
+def save_notes_batch(topic, notes):
+    """Segment a batch of (note, source_url) pairs together and append their text blocks to the topic file."""
     # Ensure the temp directory exists
     if not os.path.exists(TMP_DIRECTORY):
         os.makedirs(TMP_DIRECTORY)
@@ -54,95 +105,152 @@ def save_notes_to_file(topic, note, source_url):
     sanitized_filename = file_utils.sanitize_filename(topic)+'.jsonl'
     full_path = os.path.join(TMP_DIRECTORY, sanitized_filename)
 
-    # Initialize variables for accumulating sentences
-    text_block = ""
-    word_count = 0
-
-    # Append each sentence to form a text block and write it to the file
+    sentences_per_note = segment_texts([note for note, _ in notes])
     with open(full_path, 'a') as file:
-        for sent in doc.sents:
-            sentence_word_count = len(sent.text.split())
-            if word_count + sentence_word_count > 240:  # If adding the sentence exceeds the max limit
-                # Write the current text block to the file
-                if word_count >= 120:  # Ensure the text block meets the minimum word count
-                    data = {
-                        "note": text_block,
-                        "source_url": source_url
-                    }
-                    file.write(json.dumps(data) + '\n')
-                # Reset text block and word count
-                text_block = sent.text
-                word_count = sentence_word_count
-            else:
-                # Add the sentence to the text block
-                text_block += ' ' + sent.text if text_block else sent.text
-                word_count += sentence_word_count
-
-        # Write any remaining text block to the file if it meets the minimum word count
-        if word_count >= 300:
-            data = {
-                "note": text_block,
-                "source_url": source_url
-            }
-            file.write(json.dumps(data) + '\n')
+        for (_, source_url), sentences in zip(notes, sentences_per_note):
+            for text_block in pack_sentences(sentences):
+                data = {
+                    "note": text_block,
+                    "source_url": source_url
+                }
+                file.write(json.dumps(data) + '\n')
 
     app_logger.info(f"Notes saved to file {full_path}")
     return full_path
 
+def save_notes_to_file(topic, note, source_url):
+    return save_notes_batch(topic, [(note, source_url)])
 
-def url_list_downloader(url_list, topic):
-    notes_file = None
-    for url in url_list:
-        try:
-            text = download_and_clean(url)
-            if text:
-                notes_file = save_notes_to_file(topic, text, url)
-        except Exception as e:
-            app_logger.error(f"Error during processing for URL {url}: {e}")
-    return notes_file
-
-def search_term_ddg(topic,count=DEFAULT_SEARCH_COUNT):
+
+def url_list_downloader(url_list, topic, cancel=None):
+    """
+    Download url_list concurrently through app_web_fetcher. Pages are cleaned (or their cached text read) as they arrive and
+    saved in batches of RESEARCH_NOTE_BATCH while the remaining downloads run.
+    """
+    note_file = None
+    notes = []
+    cleaning = {}
+
+    def collect(wait_all):
+        nonlocal note_file
+        for future in [future for future in cleaning if wait_all or future.done()]:
+            url = cleaning.pop(future)
+            try:
+                text = future.result()
+                if text:
+                    notes.append((text, url))
+            except Exception as e:
+                app_logger.error(f"Error during processing for URL {url}: {e}")
+        if notes and (wait_all or len(notes) >= app_constants.RESEARCH_NOTE_BATCH):
+            try:
+                note_file = save_notes_batch(topic, notes)
+            except Exception as e:
+                app_logger.error(f"Error saving notes for topic {topic}: {e}")
+            notes.clear()
+
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=app_constants.WEB_CLEAN_WORKERS, thread_name_prefix="web-clean") as cleaner:
+        for result in app_web_fetcher.get_fetcher().fetch_all(url_list, deadline=app_constants.WEB_FETCH_DEADLINE, cancel=cancel):
+            if result.error:
+                app_logger.error(f"Error while downloading URL {result.url}: {result.error}")
+                continue
+            cleaning[cleaner.submit(page_text, result)] = result.url
+            collect(wait_all=False)
+        collect(wait_all=True)
+    app_logger.info(f"Downloaded and cleaned {len(url_list)} URLs for {topic} in {time.time() - start_time:.1f}s")
+    return note_file
+
+def expand_keywords(topic, username="", mode=None, count=DEFAULT_SEARCH_COUNT):
+    """
+    Search keywords for topic, cached per topic and mode for SEARCH_CACHE_TTL.
+    mode defaults to RESEARCH_KEYWORD_MODE: rake or noun_chunks extract them offline from the titles and snippets
+    of a search for the topic alone (cached, so search_term_ddg does not repeat it), llm asks the model server.
+    """
+    mode = mode or app_constants.RESEARCH_KEYWORD_MODE
+    key = (mode, app_query_cache.normalize_query(topic))
+    keywords = _keyword_cache.get(key)
+    if keywords is not None:
+        return keywords
+    if mode in app_keyphrases.METHODS:
+        keywords = _offline_keywords(topic, mode, count)
+        if keywords or not app_constants.RESEARCH_KEYWORD_LLM_FALLBACK:
+            app_logger.info(f"Keywords for {topic} from {mode}: {keywords}")
+            _keyword_cache.put(key, keywords)
+            return keywords
+    keywords = _llm_keywords(topic, username)
+    _keyword_cache.put(key, keywords)
+    return keywords
+
+def _offline_keywords(topic, mode, count):
     try:
-        llm = ChatOpenAI(
-            model_name=app_constants.MODEL_NAME,
-            openai_api_key=app_constants.openai_api_key,
-            base_url=app_constants.model_uri,
-            streaming=True
-        )
-        prompt = [
-            SystemMessage(content="Generate 5 plain keywords in comma separated based on user input. For example ['cat','bat','monkey','donkey','eagel']"),
-            HumanMessage(content=topic),
-        ]
+        snippets = [f"{result['title']}.\n{result['body']}" for result in search_results(topic, count)]
+    except Exception as e:
+        app_logger.error(f"Search for keyword text on {topic} failed: {e}")
+        snippets = []
+    text = "\n".join([topic] + snippets)
+    # Each phrase is searched next to the topic: phrases sharing words with it are kept, those adding no word are dropped
+    topic_words = set(app_keyphrases.WORD.findall(topic.lower()))
+    phrases = app_keyphrases.extract(text, app_constants.RESEARCH_KEYWORD_COUNT + len(topic_words), mode, app_constants.RESEARCH_KEYWORD_MAX_WORDS)
+    keywords = [phrase for phrase in phrases if not set(phrase.split()) <= topic_words]
+    return keywords[:app_constants.RESEARCH_KEYWORD_COUNT]
+
+def _llm_keywords(topic, username=""):
+    llm = app_llm_clients.get_chat_model()
+    prompt = [
+        SystemMessage(content="Generate 5 plain keywords in comma separated based on user input. For example ['cat','bat','monkey','donkey','eagel']"),
+        HumanMessage(content=topic),
+    ]
+    with app_llm_gateway.admit(app_llm_gateway.RESEARCH, username):
         response = llm(prompt)
-        # Extract string content from the response object
-        if hasattr(response, 'content'):
-            search_keywords = response.content
-        else:
-            raise ValueError("Invalid response format")
-        
-        # Splitting and trimming the keywords
-        search_keywords = [keyword.strip() for keyword in search_keywords.split(',')]
-        #print(search_keywords)
-        # Limiting keywords to a maximum of 8
-        search_keywords = search_keywords[:8]
-
-        urls = []
-        # Initialize DDGS with a timeout
+    # Extract string content from the response object
+    if hasattr(response, 'content'):
+        search_keywords = response.content
+    else:
+        raise ValueError("Invalid response format")
+
+    # Splitting and trimming the keywords, limited to a maximum of 8
+    return [keyword.strip() for keyword in search_keywords.split(',') if keyword.strip()][:8]
+
+def search_results(query, count=DEFAULT_SEARCH_COUNT):
+    """DuckDuckGo results for query as {'href', 'title', 'body'} dicts, cached for SEARCH_CACHE_TTL."""
+    key = (app_query_cache.normalize_query(query), count)
+    results = _search_cache.get(key)
+    if results is None:
         with DDGS(timeout=3) as ddgs:
-            for term in search_keywords:
-                # Fetch results for each search term
-                results = ddgs.text(f"{topic} {term}", max_results=count)
-                for result in results:
-                    url = result['href']
-                    if not url.endswith(('.pdf', '.ppt', '.pptx', '.doc', '.docx')):
-                        urls.append(url)
-        return sorted(set(urls))
+            results = [{field: result.get(field, "") for field in ("href", "title", "body")} for result in ddgs.text(query, max_results=count) or []]
+        _search_cache.put(key, results)
+    return results
+
+def search_urls(query, count=DEFAULT_SEARCH_COUNT):
+    """Result URLs of search_results, without documents."""
+    return [result['href'] for result in search_results(query, count) if not result['href'].endswith(('.pdf', '.ppt', '.pptx', '.doc', '.docx'))]
+
+def search_term_ddg(topic,count=DEFAULT_SEARCH_COUNT, username=""):
+    try:
+        mode = app_constants.RESEARCH_KEYWORD_MODE
+        search_keywords = expand_keywords(topic, username, mode, count)
+        # Offline keywords come from the results of the topic searched on its own, which are kept as well
+        terms = [""] + search_keywords if mode in app_keyphrases.METHODS else search_keywords or [""]
+        urls = set()
+        # All keyword searches run at once; results are merged as each one finishes
+        futures = {_search_executor.submit(search_urls, f"{topic} {term}".strip(), count): term for term in terms}
+        try:
+            for future in as_completed(futures, timeout=app_constants.SEARCH_DEADLINE):
+                try:
+                    urls.update(future.result())
+                except Exception as e:
+                    app_logger.error(f"Search for {topic} {futures[future]} failed: {e}")
+        except FuturesTimeoutError:
+            # Searches still running finish in the background and fill the cache for the next run
+            late = [term for future, term in futures.items() if not future.done()]
+            app_logger.warning(f"Searches for {late} did not finish within {app_constants.SEARCH_DEADLINE}s, continuing with {len(urls)} URLs")
+        return sorted(urls)
 
     except Exception as e:
         app_logger.error(f"An error occurred while searching for topic {topic}: {e}")
         return []
 
-def explore_url_on_internet(topic, count=DEFAULT_SEARCH_COUNT):
+def explore_url_on_internet(topic, count=DEFAULT_SEARCH_COUNT, username=""):
     app_logger.info(f"Starting research on topic {topic}")
     # Sanitize the filename and create the full path
     sanitized_filename = file_utils.sanitize_filename(topic)+'.jsonl'
@@ -153,7 +261,7 @@ def explore_url_on_internet(topic, count=DEFAULT_SEARCH_COUNT):
         app_logger.info(f"File already exists skipping download: ",full_path)
         note_file = full_path
     else:
-        url_list = search_term_ddg(topic,count)
+        url_list = search_term_ddg(topic,count,username)
         note_file = url_list_downloader(url_list, topic)
     app_logger.info(f"Research on Internet completed for {topic}, file: {note_file}")
     return note_file
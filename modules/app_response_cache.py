@@ -0,0 +1,216 @@
+#app_response_cache.py
+# Persistent cache of LLM answers keyed by (page, system role, retrieved chunk ids, normalized prompt).
+# Entries record the index version of every collection the context came from and only match while those
+# versions are current; database_utils.mark_index_changed also deletes them. With RESPONSE_CACHE_SEMANTIC
+# a miss falls back to the most similar cached prompt with the same page, role and context, by query embedding.
+# Entries expire after RESPONSE_CACHE_TTL and are evicted least-recently-used past RESPONSE_CACHE_MAX_MB.
+
+import os
+import json
+import math
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from modules import app_constants, app_logger, app_query_cache
+
+app_logger = app_logger.app_logger
+
+CACHE_FILE = os.path.join(app_constants.CACHE_DIRECTORY, "responses.sqlite3")
+
+def _digest(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.digest()
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+class ResponseCache:
+    def __init__(self, path=CACHE_FILE, max_bytes=app_constants.RESPONSE_CACHE_MAX_MB * 1024 * 1024, ttl_seconds=app_constants.RESPONSE_CACHE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key BLOB PRIMARY KEY, scope BLOB NOT NULL, prompt TEXT NOT NULL, response TEXT NOT NULL, sources TEXT, "
+            "embedding BLOB, size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS response_collections (key BLOB NOT NULL, collection TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_scope ON responses(scope)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_response_collections ON response_collections(collection)")
+        self._conn.commit()
+        # Running upper bound of the cached bytes; expired entries are never served, so they are
+        # only purged, together with the size scan, when this crosses max_bytes
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def scope(page, system_role, context_ids, collections):
+        """Everything but the prompt: page, system role, the retrieved chunks and the versions they were read at."""
+        versions = json.dumps(sorted(collections.items()))
+        return _digest(page or "", system_role or "", "\n".join(sorted(context_ids)), versions)
+
+    def get(self, scope, prompt, embedding=None):
+        """Return (response, sources, "exact" | "semantic") or None."""
+        now = time.time()
+        key = _digest(scope.hex(), app_query_cache.normalize_query(prompt))
+        with self._lock:
+            row = self._conn.execute("SELECT response, sources, created FROM responses WHERE key = ?", (key,)).fetchone()
+            kind = "exact"
+            if (row is None or now - row[2] > self.ttl_seconds) and embedding is not None:
+                row, key = self._nearest(scope, embedding, now)
+                kind = "semantic"
+            if row is None or now - row[2] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            if kind == "exact":
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            return row[0], row[1], kind
+
+    def _nearest(self, scope, embedding, now):
+        best, best_key, best_score = None, None, app_constants.RESPONSE_CACHE_SIMILARITY
+        rows = self._conn.execute(
+            "SELECT key, response, sources, created, embedding FROM responses WHERE scope = ? AND embedding IS NOT NULL AND created > ?",
+            (scope, now - self.ttl_seconds),
+        )
+        for key, response, sources, created, blob in rows:
+            vector = array("f")
+            vector.frombytes(blob)
+            score = _cosine(embedding, vector)
+            if score >= best_score:
+                best, best_key, best_score = (response, sources, created), key, score
+        return best, best_key
+
+    def put(self, scope, prompt, response, sources, collections, embedding=None):
+        now = time.time()
+        key = _digest(scope.hex(), app_query_cache.normalize_query(prompt))
+        blob = array("f", embedding).tobytes() if embedding is not None else None
+        size = len(prompt) + len(response) + len(sources or "") + (len(blob) if blob else 0)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, prompt, response, sources, embedding, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, scope, prompt, response, sources, blob, size, now, now),
+            )
+            self._conn.execute("DELETE FROM response_collections WHERE key = ?", (key,))
+            self._conn.executemany("INSERT INTO response_collections (key, collection) VALUES (?, ?)", [(key, collection) for collection in collections])
+            self._conn.commit()
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict(now)
+
+    def _delete_keys(self, keys):
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+        self._conn.executemany("DELETE FROM response_collections WHERE key = ?", keys)
+
+    def _evict(self, now):
+        expired = self._conn.execute("SELECT key FROM responses WHERE created <= ?", (now - self.ttl_seconds,)).fetchall()
+        self._delete_keys(expired)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        stale_keys = []
+        if total > self.max_bytes:
+            # Trim to 90% of the limit so eviction does not run on every insert
+            target = int(self.max_bytes * 0.9)
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used ASC").fetchall():
+                if total <= target:
+                    break
+                stale_keys.append((key,))
+                total -= size
+            self._delete_keys(stale_keys)
+        self._conn.commit()
+        self._total_bytes = total
+        if expired or stale_keys:
+            app_logger.info(f"Evicted {len(expired)} expired and {len(stale_keys)} least recently used cached responses")
+
+    def invalidate_collection(self, collection):
+        with self._lock:
+            keys = self._conn.execute("SELECT key FROM response_collections WHERE collection = ?", (collection,)).fetchall()
+            self._delete_keys(keys)
+            self._conn.commit()
+        if keys:
+            app_logger.info(f"Dropped {len(keys)} cached responses built on {collection}")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "size_mb": size / (1024 * 1024),
+        }
+
+_cache = None
+_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+def _query_embedding(prompt):
+    if not app_constants.RESPONSE_CACHE_SEMANTIC:
+        return None
+    from modules import app_embeddings
+    return app_query_cache.get_query_embedding(prompt, app_embeddings.get_embeddings(), app_embeddings.embedding_id())
+
+def lookup(page, system_role, context_ids, prompt, collections=None):
+    """
+    Cached answer for prompt or None.
+
+    :param context_ids: Ids of the retrieved chunks the answer is built from
+    :param collections: {persist directory: index version} of the collections they came from
+    :return: (response, sources, "exact" | "semantic") or None
+    """
+    if not app_constants.RESPONSE_CACHE_ENABLED:
+        return None
+    try:
+        scope = ResponseCache.scope(page, system_role, context_ids, collections or {})
+        return get_cache().get(scope, prompt, _query_embedding(prompt))
+    except Exception as e:
+        app_logger.error(f"Response cache lookup failed: {e}")
+        return None
+
+def store(page, system_role, context_ids, prompt, response, sources="", collections=None):
+    if not app_constants.RESPONSE_CACHE_ENABLED or not response:
+        return
+    try:
+        collections = collections or {}
+        scope = ResponseCache.scope(page, system_role, context_ids, collections)
+        get_cache().put(scope, prompt, response, sources, list(collections), _query_embedding(prompt))
+    except Exception as e:
+        app_logger.error(f"Response cache store failed: {e}")
+
+def invalidate_collection(collection):
+    if not os.path.exists(CACHE_FILE):
+        return
+    try:
+        get_cache().invalidate_collection(collection)
+    except Exception as e:
+        app_logger.error(f"Response cache invalidation failed for {collection}: {e}")
+
+def stats():
+    return get_cache().stats()
@@ -0,0 +1,189 @@
+#app_retrievers.py
+# Retrievers used by the chat pages on top of the pooled Chroma handles.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from modules import app_constants, app_logger, app_embeddings, app_lexical_index, app_query_cache, database_utils
+
+app_logger = app_logger.app_logger
+
+def _to_documents(ids, documents, metadatas, distances=None):
+    results = []
+    for index, (chunk_id, text, metadata) in enumerate(zip(ids, documents, metadatas)):
+        metadata = dict(metadata or {})
+        metadata["chunk_id"] = chunk_id
+        if distances is not None:
+            metadata["distance"] = distances[index]
+        results.append(Document(page_content=text, metadata=metadata))
+    return results
+
+def fetch_documents(db, ids, distances=None):
+    """Load chunks by id, in the given order, skipping ids no longer in the collection."""
+    if not ids:
+        return []
+    found = db._collection.get(ids=list(ids), include=["documents", "metadatas"])
+    by_id = {chunk_id: (text, metadata) for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])}
+    kept = [index for index, chunk_id in enumerate(ids) if chunk_id in by_id]
+    return _to_documents(
+        [ids[index] for index in kept],
+        [by_id[ids[index]][0] for index in kept],
+        [by_id[ids[index]][1] for index in kept],
+        [distances[index] for index in kept] if distances is not None else None,
+    )
+
+def similarity_search(db, persist_directory, query, k=app_constants.RAG_K, query_embedding=None):
+    """
+    Similarity search through the query cache: repeated queries against an unchanged collection
+    skip both the query embedding and the nearest-neighbour search.
+    """
+    collection = os.path.normpath(persist_directory)
+    version = database_utils.get_index_version(persist_directory)
+    cached = app_query_cache.get_retrieval(collection, version, query, k)
+    if cached is not None:
+        documents = fetch_documents(db, [chunk_id for chunk_id, _ in cached], [distance for _, distance in cached])
+        if len(documents) == len(cached):
+            return documents
+
+    if query_embedding is None:
+        query_embedding = app_query_cache.get_query_embedding(query, db._embedding_function, app_embeddings.embedding_id())
+    result = db._collection.query(query_embeddings=[query_embedding], n_results=k, include=["documents", "metadatas", "distances"])
+    ids, documents, metadatas, distances = result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+    app_query_cache.put_retrieval(collection, version, query, k, zip(ids, distances))
+    return _to_documents(ids, documents, metadatas, distances)
+
+def _normalize_scores(scores):
+    """Min-max scale a {chunk_id: score} dict to 0..1."""
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {chunk_id: 1.0 for chunk_id in scores}
+    return {chunk_id: (score - low) / (high - low) for chunk_id, score in scores.items()}
+
+def hybrid_search(db, persist_directory, query, k=app_constants.RAG_K):
+    """
+    Combine BM25 and vector similarity. Queries naming identifiers (CVE, CWE, NIST control or
+    MITRE technique ids) found in the lexical index are answered from it alone, without the embedding model.
+    """
+    lexical = app_lexical_index.get_index(persist_directory)
+    if lexical is None:
+        app_lexical_index.rebuild(persist_directory, db)
+        lexical = app_lexical_index.get_index(persist_directory)
+
+    identifiers = app_lexical_index.find_identifiers(query)
+    if lexical is not None and identifiers:
+        matched_ids = lexical.lookup(identifiers)[:k]
+        if matched_ids:
+            return fetch_documents(db, matched_ids)
+
+    candidates = k * app_constants.HYBRID_CANDIDATES
+    vector_documents = similarity_search(db, persist_directory, query, candidates)
+    lexical_hits = lexical.search(query, candidates) if lexical is not None else []
+
+    by_id = {doc.metadata["chunk_id"]: doc for doc in vector_documents}
+    vector_scores = _normalize_scores({chunk_id: 1.0 / (1.0 + doc.metadata.get("distance", 0.0)) for chunk_id, doc in by_id.items()})
+    lexical_scores = _normalize_scores(dict(lexical_hits))
+    alpha = app_constants.HYBRID_ALPHA
+    combined = {
+        chunk_id: alpha * vector_scores.get(chunk_id, 0.0) + (1 - alpha) * lexical_scores.get(chunk_id, 0.0)
+        for chunk_id in set(vector_scores) | set(lexical_scores)
+    }
+    top_ids = sorted(combined, key=combined.get, reverse=True)[:k]
+
+    missing_ids = [chunk_id for chunk_id in top_ids if chunk_id not in by_id]
+    for doc in fetch_documents(db, missing_ids):
+        by_id[doc.metadata["chunk_id"]] = doc
+    results = []
+    for chunk_id in top_ids:
+        if chunk_id in by_id:
+            doc = by_id[chunk_id]
+            doc.metadata["score"] = combined[chunk_id]
+            results.append(doc)
+    return results
+
+class CachedVectorStoreRetriever(BaseRetriever):
+    """Similarity retriever over a Chroma collection that goes through app_query_cache."""
+
+    vectorstore: Any
+    persist_directory: str
+    k: int = app_constants.RAG_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        return similarity_search(self.vectorstore, self.persist_directory, query, self.k)
+
+    def collection_versions(self):
+        return {os.path.normpath(self.persist_directory): database_utils.get_index_version(self.persist_directory)}
+
+class HybridRetriever(CachedVectorStoreRetriever):
+    """Lexical (BM25) plus vector retriever, see hybrid_search."""
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        return hybrid_search(self.vectorstore, self.persist_directory, query, self.k)
+
+_federated_executor = ThreadPoolExecutor(max_workers=app_constants.FEDERATED_THREADS, thread_name_prefix="federated-search")
+
+def get_persist_directory(page):
+    return app_constants.LOCAL_PERSISTANT_DB + page + '_chroma_db'
+
+def _search_collection(page, query, k, query_embedding):
+    persist_directory = get_persist_directory(page)
+    if not os.path.exists(persist_directory):
+        return []
+    db = database_utils.get_chroma_db(persist_directory)
+    if db is None:
+        return []
+    documents = similarity_search(db, persist_directory, query, k, query_embedding=query_embedding)
+    for doc in documents:
+        doc.metadata["collection"] = page
+    return documents
+
+def _merge_with_quotas(results_by_page, k, quota):
+    """Top k by distance, where each collection first gets up to quota of its own best results."""
+    selected = []
+    remaining = []
+    for documents in results_by_page.values():
+        selected.extend(documents[:quota])
+        remaining.extend(documents[quota:])
+    by_distance = lambda doc: doc.metadata.get("distance", float("inf"))
+    selected = sorted(selected, key=by_distance)[:k]
+    selected.extend(sorted(remaining, key=by_distance)[:k - len(selected)])
+    return sorted(selected, key=by_distance)
+
+def federated_search(pages, query, k=app_constants.RAG_K, quota=app_constants.FEDERATED_MIN_PER_COLLECTION):
+    """
+    Search the collections of several pages at once. The query is embedded once and the collections
+    are searched in parallel, so latency follows the slowest collection rather than their sum.
+    """
+    query_embedding = app_query_cache.get_query_embedding(query, app_embeddings.get_embeddings(), app_embeddings.embedding_id())
+    futures = {page: _federated_executor.submit(_search_collection, page, query, k, query_embedding) for page in pages}
+    results_by_page = {}
+    for page, future in futures.items():
+        try:
+            results_by_page[page] = future.result()
+        except Exception as e:
+            app_logger.error(f"Federated search failed for {page}: {e}")
+    return _merge_with_quotas(results_by_page, k, quota)
+
+class FederatedRetriever(BaseRetriever):
+    """Retriever over several pages' collections, see federated_search."""
+
+    pages: List[str]
+    k: int = app_constants.RAG_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager: Any = None) -> List[Document]:
+        return federated_search(self.pages, query, self.k)
+
+    def collection_versions(self):
+        paths = [get_persist_directory(page) for page in self.pages]
+        return {os.path.normpath(path): database_utils.get_index_version(path) for path in paths}
+
+def get_federated_retriever(pages=app_constants.FEDERATED_PAGES, k=app_constants.RAG_K):
+    return FederatedRetriever(pages=list(pages), k=k)
+
+def get_retriever(db, persist_directory, k=app_constants.RAG_K):
+    """Retriever for app_constants.RETRIEVAL_MODE ("hybrid" or "similarity")."""
+    retriever_class = HybridRetriever if app_constants.RETRIEVAL_MODE == "hybrid" else CachedVectorStoreRetriever
+    return retriever_class(vectorstore=db, persist_directory=persist_directory, k=k)
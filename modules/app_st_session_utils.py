@@ -77,23 +77,46 @@ def initialize_or_retrieve_db(db_path):
     Returns:
     The initialized or retrieved database object.
     """
-    app_logger.info("initializing db", db_path)
-    if 'db_retriever' not in st.session_state or st.session_state['db_path'] != db_path:
-        # Database not initialized or path has changed
-        db_retriever = database_utils.initialize_chroma_db(db_path)
-        if db_retriever is not None:
-            st.session_state['db_retriever'] = db_retriever
-            st.session_state['db_path'] = db_path
-            app_logger.info(f"Database initialized at {db_path}")
-        else:
-            app_logger.error(f"Failed to initialize database at {db_path}")
-            return None
-    return st.session_state['db_retriever']
+    app_logger.info(f"initializing db {db_path}")
+    lease = st.session_state.get('db_lease')
+    if lease is None or lease.path != db_path:
+        # Handles are pooled per database across sessions, the session only holds a reference
+        if lease is not None:
+            lease.release()
+        lease = database_utils.ChromaDbLease(db_path)
+        st.session_state['db_lease'] = lease
+        st.session_state['db_path'] = db_path
+    db_retriever = lease.db
+    if db_retriever is None:
+        app_logger.error(f"Failed to initialize database at {db_path}")
+    return db_retriever
 
 # Function to format the response
 def format_response(response):
     return response.replace('\r\n', '\n').replace('\r', '\n').strip()
 
+def stream_chat_message(chunks):
+    """Render a streamed assistant response as it arrives and return the formatted full text."""
+    response = st.chat_message("assistant").write_stream(chunks)
+    # write_stream returns a list when the stream produced something other than text
+    return format_response(response if isinstance(response, str) else "".join(str(part) for part in response))
+
+def display_stream_stats(stream_stats):
+    if stream_stats.get("error"):
+        # Shown below the partial answer rather than in it, the answer is what goes into the history
+        st.error(stream_stats["error"])
+    if stream_stats.get("cache"):
+        st.caption(f"Answered from the response cache ({stream_stats['cache']} match) in {stream_stats['total_seconds']:.2f}s")
+    elif stream_stats.get("tokens"):
+        prefix_info = f", {stream_stats['prefix_reuse']:.0%} of the prompt reused from the previous turn" if "prefix_reuse" in stream_stats else ""
+        queue_info = f" (waited {stream_stats['queue_wait']:.2f}s for the model server)" if stream_stats.get("queue_wait") else ""
+        st.caption(
+            f"First token after {stream_stats['time_to_first_token']:.2f}s{queue_info}, {stream_stats['tokens']} tokens in "
+            f"{stream_stats['chunks']} chunks, {stream_stats['tokens_per_second']:.1f} tokens/s{prefix_info}"
+        )
+    elif stream_stats.get("total_seconds"):
+        st.caption(f"Answered in {stream_stats['total_seconds']:.2f}s, not streamed")
+
 # Add a message to the session state
 def add_message_to_session(role, content, add_to_history=True):
     timestamp = datetime.datetime.now()
@@ -1,11 +1,12 @@
-
 #app_to_vectorstore.py
 
 import os
+import hashlib
+import json
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import CharacterTextSplitter
-from modules import common_utils,file_utils
+from langchain_core.documents import Document
+from modules import common_utils,file_utils,app_embedding_cache,app_processed_registry,database_utils,app_lexical_index
 from modules import app_logger
 # Assuming all necessary loader classes are imported
 
@@ -16,31 +17,53 @@ app_logger = app_logger.app_logger
 TEMP_DIR = app_constants.WORKSPACE_DIRECTORY + "tmp"
 DB_DIR = app_constants.WORKSPACE_DIRECTORY + "db"
 
-processed_files_record = os.path.join(app_constants.WORKSPACE_DIRECTORY, app_constants.PROCESSED_DOCS)
-
-def load_documents_from_jsonl(file_path, loader_class):
+def update_processed_files_record(file_md5,module, file_path, is_persistent=True):
     try:
-        loader = loader_class(file_path, json_lines=True, text_content=False, jq_schema='.')
-        return loader.load()
+        stat = os.stat(file_path)
+        app_processed_registry.get_registry().record(file_md5, module, file_path, stat.st_size, stat.st_mtime, is_persistent)
     except Exception as e:
-        app_logger.error(f"Error loading documents from JSONL file {file_path}: {e}")
-        return None
+        app_logger.error(f"Error updating processed files record: {e}")
 
-def update_processed_files_record(file_md5,module, file_path):
+def is_file_processed(file_md5):
+    return app_processed_registry.get_registry().is_processed(file_md5)
+
+def get_loader_class(file_path):
+    _, file_extension = os.path.splitext(file_path)
+    return app_constants.DOCUMENT_MAP.get(file_extension.lower(), None)
+
+def load_file_documents(file_path):
+    """All documents of a file from iter_documents, for the paths that index a file in one go."""
     try:
-        with open(processed_files_record, 'a') as file:  # 'a' mode will create the file if it doesn't exist
-            file.write(f"{file_md5},{module},{file_path}\n")
+        return list(iter_documents(file_path))
     except Exception as e:
-        app_logger.error(f"Error updating processed files record: {e}")
+        app_logger.error(f"Error loading documents from {file_path}: {e}")
+        return None
 
-def is_file_processed(file_md5):
-    if os.path.exists(processed_files_record):
-        with open(processed_files_record, 'r') as file:
-            for line in file:
-                md5, _ = line.strip().split(',', 1)
-                if md5 == file_md5:
-                    return True
-    return False
+def split_documents(documents):
+    """Split documents into chunks; each document is split on its own, so splitting them in batches gives the same chunks."""
+    text_splitter = CharacterTextSplitter(chunk_size=app_constants.CHUNK_SIZE, chunk_overlap=app_constants.CHUNK_OVERLAP)
+    return text_splitter.split_documents(documents)
+
+def make_chunk_ids(docs, seen=None):
+    """
+    Content-addressed chunk ids so unchanged chunks keep their id across re-indexing.
+    Pass the same seen dict for all batches of one file.
+    """
+    ids = []
+    seen = {} if seen is None else seen
+    for doc in docs:
+        digest = hashlib.sha1(f"{doc.metadata.get('source', '')}\0{doc.page_content}".encode("utf-8")).hexdigest()
+        # Identical chunks inside one file get an occurrence suffix to stay unique
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{digest}-{occurrence}")
+    return ids
+
+def get_chroma_persist_directory(file_path, current_page="nav_playbooks", is_persistent=True):
+    storage_dir = DB_DIR if is_persistent else TEMP_DIR
+    base_filename = f"{current_page}_chroma_db" if is_persistent else f"{os.path.splitext(os.path.basename(file_path))[0]}_chroma_db"
+    sanitized_base_filename = file_utils.sanitize_filename(base_filename)
+    return os.path.join(storage_dir, sanitized_base_filename)
 
 def get_chroma_index(file_path, current_page="nav_playbooks", is_persistent=True):
     app_logger.info(f"Starting get_chroma_index for {file_path}")
@@ -49,54 +72,246 @@ def get_chroma_index(file_path, current_page="nav_playbooks", is_persistent=True
         app_logger.info(f"File {file_path} has already been processed. Skipping.")
         db = None
         return False
-    
-    _, file_extension = os.path.splitext(file_path)
-    loader_class = app_constants.DOCUMENT_MAP.get(file_extension.lower(), None)
 
-    if not loader_class:
+    if not get_loader_class(file_path):
+        _, file_extension = os.path.splitext(file_path)
         app_logger.error(f"No suitable loader found for file type {file_extension}")
         return None, False
 
-    embedding_model = app_constants.EMBEDDING_MODEL_NAME
-    chunk_size = app_constants.CHUNK_SIZE
-    chunk_overlap = app_constants.CHUNK_OVERLAP
-
-    storage_dir = DB_DIR if is_persistent else TEMP_DIR
-
-    base_filename = f"{current_page}_chroma_db" if is_persistent else f"{os.path.splitext(os.path.basename(file_path))[0]}_chroma_db"
-    sanitized_base_filename = file_utils.sanitize_filename(base_filename)
-    chroma_persist_directory = os.path.join(storage_dir, sanitized_base_filename)
+    if os.path.getsize(file_path) > app_constants.STREAM_INGEST_THRESHOLD_MB * 1024 * 1024:
+        return stream_chroma_index(file_path, current_page, is_persistent)
 
+    chroma_persist_directory = get_chroma_persist_directory(file_path, current_page, is_persistent)
 
-    embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+    embeddings = app_embedding_cache.get_cached_embeddings()
     try:
-        if file_extension.lower() == '.jsonl':
-            documents = load_documents_from_jsonl(file_path, loader_class)
-        else:
-            loader = loader_class(file_path)
-            documents = loader.load()
+        documents = load_file_documents(file_path)
 
         if not documents:
             app_logger.error(f"No documents loaded from {file_path}.")
             db = None
             return False
 
-        text_splitter = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        docs = text_splitter.split_documents(documents)
+        docs = split_documents(documents)
 
         if not docs:
             app_logger.error(f"No documents to process after splitting from {file_path}.")
             db = None
             return False
 
-        db = Chroma.from_documents(docs, embeddings, persist_directory=chroma_persist_directory, client_settings=app_constants.CHROMA_SETTINGS)
-        update_processed_files_record(file_md5,current_page, file_path)
+        ids = make_chunk_ids(docs)
+        db = Chroma.from_documents(docs, embeddings, ids=ids, persist_directory=chroma_persist_directory, client_settings=app_constants.CHROMA_SETTINGS)
+        app_lexical_index.add_chunks(chroma_persist_directory, ids, [doc.page_content for doc in docs], [doc.metadata for doc in docs])
+        update_processed_files_record(file_md5,current_page, file_path, is_persistent)
         app_logger.info("Created index and saved to disk")
         db.persist()
+        database_utils.mark_index_changed(chroma_persist_directory)
     except Exception as e:
         app_logger.error(f"Error in get_chroma_index for {file_path}: {e}")
         db = None
         return False
     app_logger.info("Completed get_chroma_index operation")
     db = None
-    return True
\ No newline at end of file
+    return True
+
+def iter_documents(file_path):
+    """
+    Yield the documents of a file one page, record or text block at a time.
+
+    This is the one loader for every indexing path (get_chroma_index, stream_chroma_index,
+    update_chroma_index and app_bulk_ingest), so a file gets the same chunks and chunk ids whichever
+    path indexes or re-indexes it. JSONL and plain text files are read incrementally and PDFs one page
+    at a time with pypdf. Other types go through the loader's lazy_load(), which is only as lazy as
+    the underlying loader.
+    """
+    _, file_extension = os.path.splitext(file_path)
+    file_extension = file_extension.lower()
+    if file_extension == '.jsonl':
+        # Same content and metadata as JSONLoader(json_lines=True, text_content=False, jq_schema='.')
+        with open(file_path, 'r', encoding='utf-8') as file:
+            seq_num = 0
+            for line in file:
+                if not line.strip():
+                    continue
+                seq_num += 1
+                record = json.loads(line)
+                content = record if isinstance(record, str) else (json.dumps(record) if record else "")
+                yield Document(page_content=content, metadata={"source": str(file_path), "seq_num": seq_num})
+    elif file_extension in ('.txt', '.py'):
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+            block = []
+            block_size = 0
+            for line in file:
+                block.append(line)
+                block_size += len(line)
+                if block_size >= app_constants.STREAM_TEXT_BLOCK_SIZE:
+                    yield Document(page_content="".join(block), metadata={"source": file_path})
+                    block = []
+                    block_size = 0
+            if block:
+                yield Document(page_content="".join(block), metadata={"source": file_path})
+    elif file_extension == '.pdf':
+        # The unstructured loader in DOCUMENT_MAP partitions the whole PDF into one Document;
+        # PyPDFLoader reads and yields a page at a time
+        from langchain_community.document_loaders import PyPDFLoader
+        yield from PyPDFLoader(file_path).lazy_load()
+    else:
+        loader_class = get_loader_class(file_path)
+        if not loader_class:
+            app_logger.error(f"No suitable loader found for file type {file_extension}")
+            return
+        yield from loader_class(file_path).lazy_load()
+
+def add_chunks(db, persist_directory, ids, docs):
+    """Embed and write chunks to the Chroma store and the lexical index."""
+    texts = [doc.page_content for doc in docs]
+    metadatas = [doc.metadata for doc in docs]
+    db.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+    app_lexical_index.add_chunks(persist_directory, ids, texts, metadatas)
+
+def stream_chroma_index(file_path, current_page="nav_playbooks", is_persistent=True, batch_size=app_constants.STREAM_BATCH_SIZE, progress_callback=None):
+    """
+    Index a file with bounded memory: documents are split as they are read and chunks are
+    embedded and written in batches of batch_size.
+
+    progress_callback, if given, is called after every batch with a dict holding
+    documents, chunks, batches and fraction (None when the loader cannot tell).
+    """
+    app_logger.info(f"Starting stream_chroma_index for {file_path}")
+    file_md5 = file_utils.compute_md5(file_path)
+    if is_file_processed(file_md5):
+        app_logger.info(f"File {file_path} has already been processed. Skipping.")
+        return False
+
+    chroma_persist_directory = get_chroma_persist_directory(file_path, current_page, is_persistent)
+    embeddings = app_embedding_cache.get_cached_embeddings()
+    progress = {"documents": 0, "chunks": 0, "batches": 0, "fraction": None}
+    total_bytes = os.path.getsize(file_path) or 1
+    _, file_extension = os.path.splitext(file_path)
+    track_bytes = file_extension.lower() in ('.jsonl', '.txt', '.py')
+    bytes_read = 0
+    seen_ids = {}
+    buffer = []
+
+    db = Chroma(persist_directory=chroma_persist_directory, embedding_function=embeddings, client_settings=app_constants.CHROMA_SETTINGS)
+
+    def flush():
+        add_chunks(db, chroma_persist_directory, make_chunk_ids(buffer, seen_ids), buffer)
+        progress["chunks"] += len(buffer)
+        progress["batches"] += 1
+        buffer.clear()
+        if progress_callback:
+            progress_callback(dict(progress))
+
+    try:
+        for document in iter_documents(file_path):
+            progress["documents"] += 1
+            if track_bytes:
+                bytes_read += len(document.page_content.encode('utf-8'))
+                progress["fraction"] = min(bytes_read / total_bytes, 1.0)
+            buffer.extend(split_documents([document]))
+            while len(buffer) >= batch_size:
+                pending = buffer[batch_size:]
+                del buffer[batch_size:]
+                flush()
+                buffer.extend(pending)
+        if buffer:
+            flush()
+        if not progress["chunks"]:
+            app_logger.error(f"No documents to process after splitting from {file_path}.")
+            return False
+        db.persist()
+        update_processed_files_record(file_md5, current_page, file_path, is_persistent)
+    except Exception as e:
+        app_logger.error(f"Error in stream_chroma_index for {file_path}: {e}")
+        return False
+    finally:
+        db = None
+        if progress["chunks"]:
+            database_utils.mark_index_changed(chroma_persist_directory)
+    progress["fraction"] = 1.0
+    if progress_callback:
+        progress_callback(dict(progress))
+    app_logger.info(f"Completed stream_chroma_index for {file_path}: {progress['chunks']} chunks in {progress['batches']} batches")
+    return True
+
+def update_chroma_index(file_path, current_page="nav_playbooks", is_persistent=True, batch_size=app_constants.STREAM_BATCH_SIZE):
+    """
+    Re-index a file that may have changed since it was last indexed, touching only the chunks that differ.
+
+    Checks size and mtime first, then the MD5, and only then reads the file. It is read and split as it
+    was indexed (iter_documents), so unchanged chunks keep their ids. New chunks are embedded and written
+    in batches of batch_size as they are found, and chunks that are no longer present are deleted at the end.
+
+    Returns:
+    bool: True if the index was changed, False otherwise.
+    """
+    app_logger.info(f"Starting update_chroma_index for {file_path}")
+    registry = app_processed_registry.get_registry()
+    entry = registry.get(current_page, file_path)
+    if entry is None:
+        return get_chroma_index(file_path, current_page, is_persistent)
+
+    try:
+        stat = os.stat(file_path)
+    except OSError as e:
+        app_logger.error(f"Unable to read {file_path} for re-indexing: {e}")
+        return False
+    if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        app_logger.info(f"File {file_path} is unchanged. Skipping.")
+        return False
+
+    file_md5 = file_utils.compute_md5(file_path)
+    if file_md5 == entry["md5"]:
+        registry.record(file_md5, current_page, file_path, stat.st_size, stat.st_mtime, is_persistent)
+        app_logger.info(f"File {file_path} was touched but its content is unchanged. Skipping.")
+        return False
+
+    chroma_persist_directory = get_chroma_persist_directory(file_path, current_page, is_persistent)
+    embeddings = app_embedding_cache.get_cached_embeddings()
+    db = None
+    current_ids = set()
+    seen_ids = {}
+    changes = {"added": 0, "removed": 0}
+    buffer = []
+    try:
+        db = Chroma(persist_directory=chroma_persist_directory, embedding_function=embeddings, client_settings=app_constants.CHROMA_SETTINGS)
+        existing_ids = set(db._collection.get(where={"source": file_path}, include=[])["ids"])
+
+        def flush():
+            ids = make_chunk_ids(buffer, seen_ids)
+            current_ids.update(ids)
+            new_chunks = [(chunk_id, doc) for chunk_id, doc in zip(ids, buffer) if chunk_id not in existing_ids]
+            if new_chunks:
+                add_chunks(db, chroma_persist_directory, [chunk_id for chunk_id, _ in new_chunks], [doc for _, doc in new_chunks])
+                changes["added"] += len(new_chunks)
+            buffer.clear()
+
+        for document in iter_documents(file_path):
+            buffer.extend(split_documents([document]))
+            if len(buffer) >= batch_size:
+                flush()
+        if buffer:
+            flush()
+        if not current_ids:
+            app_logger.error(f"No documents to process after splitting from {file_path}.")
+            return False
+
+        stale_ids = list(existing_ids.difference(current_ids))
+        for start in range(0, len(stale_ids), batch_size):
+            batch = stale_ids[start:start + batch_size]
+            db._collection.delete(ids=batch, where={"source": file_path})
+            app_lexical_index.delete_chunks(chroma_persist_directory, batch)
+            changes["removed"] += len(batch)
+        db.persist()
+        registry.record(file_md5, current_page, file_path, stat.st_size, stat.st_mtime, is_persistent)
+        app_logger.info(f"Updated index for {file_path}: {changes['added']} chunks added, {changes['removed']} removed, {len(current_ids) - changes['added']} kept")
+    except Exception as e:
+        app_logger.error(f"Error in update_chroma_index for {file_path}: {e}")
+        return False
+    finally:
+        db = None
+        # Chunks written before a failure stay in the store, the next update keeps them by id
+        if changes["added"] or changes["removed"]:
+            database_utils.mark_index_changed(chroma_persist_directory)
+    return True
@@ -0,0 +1,71 @@
+#app_tokenizer.py
+# Local token counting for sizing prompts. TOKENIZER selects the implementation:
+#   llama    - vocabulary of the local GGUF model (exact for the llama.cpp server), loaded without weights
+#   tiktoken - cl100k_base, for OpenAI-hosted models
+#   estimate - about four characters per token, no dependencies
+#   auto     - llama when the model file exists, otherwise tiktoken, otherwise estimate
+
+import os
+import threading
+from modules import app_constants, app_logger
+
+app_logger = app_logger.app_logger
+
+# Tokens a chat template adds around every message (role markers and separators)
+MESSAGE_OVERHEAD = 4
+
+class EstimateTokenizer:
+    name = "estimate"
+
+    def count(self, text):
+        return len(text) // 4 + 1
+
+class LlamaTokenizer:
+    name = "llama"
+
+    def __init__(self, model_path):
+        from llama_cpp import Llama
+        self.model = Llama(model_path=model_path, vocab_only=True, verbose=False)
+
+    def count(self, text):
+        return len(self.model.tokenize(text.encode("utf-8"), add_bos=False))
+
+class TiktokenTokenizer:
+    name = "tiktoken"
+
+    def __init__(self, encoding_name="cl100k_base"):
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text):
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+def _load_tokenizer(kind):
+    if kind in ("auto", "llama") and os.path.exists(app_constants.LOCAL_MODEL_PATH):
+        try:
+            return LlamaTokenizer(app_constants.LOCAL_MODEL_PATH)
+        except Exception as e:
+            app_logger.error(f"Could not load llama tokenizer from {app_constants.LOCAL_MODEL_PATH}: {e}")
+    if kind in ("auto", "tiktoken"):
+        try:
+            return TiktokenTokenizer()
+        except Exception as e:
+            app_logger.error(f"Could not load tiktoken: {e}")
+    return EstimateTokenizer()
+
+_tokenizer = None
+_lock = threading.Lock()
+
+def get_tokenizer():
+    global _tokenizer
+    with _lock:
+        if _tokenizer is None:
+            _tokenizer = _load_tokenizer(app_constants.TOKENIZER)
+            app_logger.info(f"Counting tokens with the {_tokenizer.name} tokenizer")
+        return _tokenizer
+
+def count_tokens(text):
+    return get_tokenizer().count(text or "")
+
+def count_message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
@@ -0,0 +1,172 @@
+#app_web_fetcher.py
+# Concurrent page downloads for the Researcher. All downloads share one pooled keep-alive requests.Session;
+# at most WEB_FETCH_WORKERS run at once and at most WEB_FETCH_PER_HOST against any one host. Downloads for a
+# busy host wait in that host's queue, not in a worker thread, so they never hold up other hosts. Every request
+# has connect and read timeouts, bodies over WEB_FETCH_MAX_BYTES are abandoned, and a run can be cancelled
+# or given a deadline, after which the downloads still queued or in progress are dropped.
+# With an app_http_cache.HTTPCache, fresh pages are served from disk and stale ones revalidated with a conditional GET.
+
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from modules import app_constants, app_logger, app_http_cache
+
+app_logger = app_logger.app_logger
+
+CHUNK_SIZE = 64 * 1024
+
+# content is the response body (bytes) when error is None. It is None when the cached copy is still current
+# (cache_entry set, status 200 if fresh or 304 if revalidated); cache_entry is also set when a new body was cached.
+FetchResult = namedtuple("FetchResult", ["url", "status", "content", "error", "seconds", "cache_entry"], defaults=(None,))
+
+class _Cancellation:
+    """Set when any of the given threading.Events is set."""
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+def new_session(pool_size=app_constants.WEB_FETCH_WORKERS):
+    session = requests.Session()
+    # Retries would multiply the time spent on a dead site, the research run simply skips it
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = app_constants.WEB_USER_AGENT
+    return session
+
+class WebFetcher:
+    def __init__(self, workers=app_constants.WEB_FETCH_WORKERS, per_host=app_constants.WEB_FETCH_PER_HOST,
+                 timeout=(app_constants.WEB_FETCH_CONNECT_TIMEOUT, app_constants.WEB_FETCH_READ_TIMEOUT),
+                 max_bytes=app_constants.WEB_FETCH_MAX_BYTES, session=None, cache=None):
+        self.per_host = per_host
+        self.cache = cache
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = session or new_session(workers)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="web-fetch")
+        # host -> downloads in progress, and the (url, cancel, max_bytes, future) waiting for one of its slots
+        self._active = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+
+    def _schedule(self, url, cancel=None, max_bytes=None):
+        """Future of the FetchResult for url, started now if its host has a free slot, else queued for one."""
+        entry = self.cache.lookup(url) if self.cache else None
+        if entry and self.cache.is_fresh(entry):
+            self.cache.touch(url)
+            future = Future()
+            future.set_result(FetchResult(url, 200, None, None, 0.0, entry))
+            return future
+        host = urlsplit(url).netloc.lower()
+        future = Future()
+        with self._lock:
+            if self._active.get(host, 0) >= self.per_host:
+                self._waiting.setdefault(host, deque()).append((url, cancel, max_bytes, future))
+                return future
+            self._active[host] = self._active.get(host, 0) + 1
+        self._executor.submit(self._run, host, url, cancel, max_bytes, future)
+        return future
+
+    def _run(self, host, url, cancel, max_bytes, future):
+        try:
+            if future.set_running_or_notify_cancel():
+                future.set_result(self._download(url, cancel, max_bytes))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._release(host)
+
+    def _release(self, host):
+        """Hand the host's slot to its next waiting download that was not cancelled, or free it."""
+        with self._lock:
+            waiting = self._waiting.get(host)
+            following = None
+            while waiting and following is None:
+                candidate = waiting.popleft()
+                if not candidate[3].cancelled():
+                    following = candidate
+            if not waiting:
+                self._waiting.pop(host, None)
+            if following is None:
+                self._active[host] -= 1
+                if not self._active[host]:
+                    del self._active[host]
+                return
+        self._executor.submit(self._run, host, *following)
+
+    def _download(self, url, cancel=None, max_bytes=None):
+        start_time = time.time()
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        cancelled = lambda: cancel is not None and cancel.is_set()
+        result = lambda status=None, content=None, error=None, entry=None: FetchResult(url, status, content, error, time.time() - start_time, entry)
+        if cancelled():
+            return result(error="cancelled")
+        entry = self.cache.lookup(url) if self.cache else None
+        try:
+            headers = self.cache.validators(entry) if entry else None
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                if response.status_code == 304 and entry:
+                    return result(304, entry=self.cache.revalidated(url, response.headers))
+                response.raise_for_status()
+                if max_bytes and int(response.headers.get("Content-Length") or 0) > max_bytes:
+                    return result(response.status_code, error=f"larger than {max_bytes} bytes")
+                chunks = []
+                size = 0
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if cancelled():
+                        return result(response.status_code, error="cancelled")
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        return result(response.status_code, error=f"larger than {max_bytes} bytes")
+                    chunks.append(chunk)
+                content = b"".join(chunks)
+                entry = self.cache.store(url, response.headers, content) if self.cache else None
+                return result(response.status_code, content, entry=entry)
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            return result(error=str(e))
+
+    def fetch(self, url, cancel=None, max_bytes=None):
+        """
+        Download one URL, waiting for a slot if its host is busy and stopping early once cancel
+        (anything with is_set()) is set. max_bytes overrides the fetcher's size limit, 0 for none.
+        Never raises; failures, oversized bodies and cancellation are reported in error.
+        """
+        return self._schedule(url, cancel, max_bytes).result()
+
+    def fetch_all(self, urls, deadline=None, cancel=None):
+        """
+        Download urls concurrently, yielding a FetchResult for each as soon as it completes.
+        After deadline seconds, or once cancel is set, the remaining downloads are dropped; closing the
+        generator early does the same.
+        """
+        finished = threading.Event()
+        cancel = _Cancellation(cancel, finished)
+        futures = [self._schedule(url, cancel) for url in dict.fromkeys(urls)]
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                yield future.result()
+                if cancel.is_set():
+                    break
+        except FuturesTimeoutError:
+            unfinished = sum(not future.done() for future in futures)
+            app_logger.warning(f"Skipping {unfinished} of {len(futures)} pages not downloaded within {deadline}s")
+        finally:
+            finished.set()
+            for future in futures:
+                future.cancel()
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+def get_fetcher():
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = WebFetcher(cache=app_http_cache.get_cache())
+        return _fetcher
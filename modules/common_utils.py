@@ -1,5 +1,5 @@
 import os
-from modules import app_constants,app_page_definitions
+from modules import app_constants,app_page_definitions,app_processed_registry,app_tokenizer
 from modules import app_logger
 # Use the logger from app_config
 app_logger = app_logger.app_logger
@@ -40,47 +40,88 @@ def setup_initial_folders():
     os.makedirs(docs_path, exist_ok=True)
     os.makedirs(db_path, exist_ok=True)
     os.makedirs(tmp_path, exist_ok=True)
-    processed_docs_path = work_dir+app_constants.PROCESSED_DOCS
-    if not os.path.exists(processed_docs_path):
-        open(processed_docs_path, 'a').close()
+    app_processed_registry.get_registry().initialize()
 
-def construct_messages_to_send(page, message_store, prompt):
+def _anchored_history(page, message_store, history_messages, tokenizer, budget):
+    """
+    History from the page's anchor to the newest message. The anchor only moves forward when the window
+    no longer fits, and then far enough to free PROMPT_CACHE_HEADROOM of the budget, so the start of the
+    prompt stays byte-identical over several turns and the model server can reuse its prompt cache.
+    """
+    costs = [message_store.get_token_count(message, tokenizer) + app_tokenizer.MESSAGE_OVERHEAD for message in history_messages]
+    anchor = message_store.get_history_anchor(page)
+    # A cleared or shortened history invalidates the offset: start again from its first message
+    if len(history_messages) < message_store.get_anchored_length(page) or anchor > len(history_messages):
+        anchor = 0
+    window = sum(costs[anchor:])
+    if window > budget:
+        target = budget * (1 - app_constants.PROMPT_CACHE_HEADROOM)
+        while anchor < len(costs) and (window > target or history_messages[anchor]["role"] != "user"):
+            window -= costs[anchor]
+            anchor += 1
+        app_logger.debug(f"History window for {page} moved to message {anchor}")
+    message_store.set_history_anchor(page, anchor, len(history_messages))
+    return history_messages[anchor:]
+
+def construct_messages_to_send(page, message_store, prompt, token_budget=None):
     """
     Construct a list of messages to send to the language model.
 
+    The system message and prompt are always sent. The greeting and then history, newest first,
+    are added while they fit in token_budget, so prompt size does not depend on message lengths.
+    With PROMPT_CACHE_ENABLED the history window instead starts at a stable anchor, see _anchored_history.
+
     Args:
     page (str): The current page identifier.
     message_store (MessageStore): The message store instance containing message histories.
     prompt (str): The current user prompt.
+    token_budget (int): Maximum prompt tokens, defaults to app_constants.PROMPT_TOKEN_BUDGET.
 
     Returns:
     List[Dict[str, str]]: A list of messages structured for the language model.
     """
-    messages_to_send = []
+    tokenizer = app_tokenizer.get_tokenizer()
+    remaining = app_constants.PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+
+    def fits(message):
+        nonlocal remaining
+        cost = message_store.get_token_count(message, tokenizer) + app_tokenizer.MESSAGE_OVERHEAD
+        if cost > remaining:
+            return False
+        remaining -= cost
+        return True
 
     # Retrieve the system and greeting messages if available
     system_message_content = message_store.get_message(page, "system")
     greeting_message_content = message_store.get_message(page, "greeting")
-    if system_message_content:
-        messages_to_send.append({"role": "system", "content": system_message_content})
-    if greeting_message_content:
-        messages_to_send.append({"role": "assistant", "content": greeting_message_content})
-
-    # Include recent user and assistant messages from the message history
-    history_messages = message_store.get_history(page)
-
-    # Check if there are enough messages in the history, if not, adjust the slicing
-    num_messages_to_include = 4  # Include last two pairs (user and assistant)
-    if len(history_messages) < num_messages_to_include:
-        num_messages_to_include = len(history_messages)
-
-    recent_history = history_messages[-num_messages_to_include:]
-    for msg in recent_history:
-        messages_to_send.append({"role": msg["role"], "content": msg["content"]})
-
+    system_message = {"role": "system", "content": system_message_content} if system_message_content else None
+    prompt_message = {"role": "user", "content": prompt}
+    for message in (system_message, prompt_message):
+        if message:
+            remaining -= message_store.get_token_count(message, tokenizer) + app_tokenizer.MESSAGE_OVERHEAD
+
+    greeting_message = {"role": "assistant", "content": greeting_message_content} if greeting_message_content else None
+    if greeting_message and not fits(greeting_message):
+        greeting_message = None
+
+    history_messages = [{"role": msg["role"], "content": msg["content"]} for msg in message_store.get_history(page)]
+    if app_constants.PROMPT_CACHE_ENABLED:
+        recent_history = _anchored_history(page, message_store, history_messages, tokenizer, remaining)
+        remaining -= sum(message_store.get_token_count(message, tokenizer) + app_tokenizer.MESSAGE_OVERHEAD for message in recent_history)
+    else:
+        # Include user and assistant messages from the history, newest first, until the budget is used
+        recent_history = []
+        for message in reversed(history_messages):
+            if not fits(message):
+                break
+            recent_history.append(message)
+        recent_history.reverse()
+
+    messages_to_send = [message for message in (system_message, greeting_message) if message]
+    messages_to_send.extend(recent_history)
     # Append the current user prompt
-    messages_to_send.append({"role": "user", "content": prompt})
-
+    messages_to_send.append(prompt_message)
+    app_logger.debug(f"Prompt for {page}: {len(recent_history)} history messages, {remaining} of the token budget unused")
     return messages_to_send
 
 
@@ -99,20 +140,8 @@ def get_content_mapping_to_module(content_type):
     return "nav_playbooks"
 
 def read_processed_log():
-    processed_paths = set()
-    log_file_path = os.path.join(work_dir, 'index_processed.log')
-    
     try:
-        with open(log_file_path, 'r') as log_file:
-            for line in log_file:
-                parts = line.strip().split(',')
-                if len(parts) > 1:
-                    # Extract the file path (assuming it's the last part)
-                    file_path = parts[-1]
-                    processed_paths.add(file_path)
-        return processed_paths
-    except FileNotFoundError:
-        app_logger.error(f"File not found: {log_file_path}")
+        return app_processed_registry.get_registry().all_paths()
     except Exception as e:
-        app_logger.error(f"An error occurred while reading the log file: {e}")
-    return processed_paths
\ No newline at end of file
+        app_logger.error(f"An error occurred while reading the processed files registry: {e}")
+    return set()
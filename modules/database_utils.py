@@ -1,11 +1,19 @@
 # database_utils.py
 import os
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from modules import app_constants, app_logger
+import threading
+import time
+import uuid
+import weakref
+from modules import app_constants, app_logger, app_embeddings, app_query_cache, app_response_cache
 
 app_logger = app_logger.app_logger
 
+INDEX_VERSION_FILE = "index_version"
+
+# Process-wide pool of Chroma handles keyed by persist directory, shared by all sessions
+_db_pool = {}
+_db_pool_lock = threading.Lock()
+
 def initialize_chroma_db(file_path):
     """
     Initializes or creates a new Chroma database.
@@ -14,10 +22,11 @@ def initialize_chroma_db(file_path):
     :return: A retriever object if initialization is successful, None otherwise
     """
     # Initialize embeddings
-    embeddings = HuggingFaceEmbeddings(model_name=app_constants.EMBEDDING_MODEL_NAME)
+    embeddings = app_embeddings.get_embeddings()
 
     # Initialize Chroma database
     try:
+        from langchain_community.vectorstores import Chroma
         if os.path.exists(file_path):
             app_logger.info(f"Using existing Chroma database at {file_path}.")
         else:
@@ -33,6 +42,98 @@ def initialize_chroma_db(file_path):
     #retriever = db.as_retriever()
     return db
 
+def get_index_version(persist_directory):
+    """Version token of a collection, changed by mark_index_changed whenever its contents change."""
+    try:
+        with open(os.path.join(persist_directory, INDEX_VERSION_FILE), "r") as version_file:
+            return version_file.read().strip() or "0"
+    except OSError:
+        return "0"
+
+def mark_index_changed(persist_directory):
+    """Record that a collection was written to so pooled handles and caches built on it are refreshed."""
+    try:
+        os.makedirs(persist_directory, exist_ok=True)
+        version_path = os.path.join(persist_directory, INDEX_VERSION_FILE)
+        temp_path = f"{version_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as version_file:
+            version_file.write(f"{time.time_ns()}-{uuid.uuid4().hex[:8]}")
+        os.replace(temp_path, version_path)
+    except OSError as e:
+        app_logger.error(f"Failed to update index version for {persist_directory}: {e}")
+    app_query_cache.invalidate_collection(os.path.normpath(persist_directory))
+    app_response_cache.invalidate_collection(os.path.normpath(persist_directory))
+    with _db_pool_lock:
+        entry = _db_pool.get(os.path.normpath(persist_directory))
+        if entry is not None:
+            entry["db"] = None
+
+def _evict_idle_chroma_dbs(now):
+    # Only the pool's wrapper and collection handle are dropped. chromadb 0.4 keeps one System (SQLite
+    # connection, HNSW segments) per persist directory in SharedSystemClient and hands that same System to
+    # every client for the path, including ingestion writers that do not go through this pool, so stopping
+    # it here could break a write in progress. chromadb releases it with the process.
+    for path, entry in list(_db_pool.items()):
+        if entry["refs"] <= 0 and now - entry["last_used"] > app_constants.CHROMA_POOL_IDLE_SECONDS and not entry["loading"].locked():
+            del _db_pool[path]
+            app_logger.info(f"Evicted idle Chroma handle for {path}")
+
+def get_chroma_db(persist_directory):
+    """Return the pooled Chroma handle for a persist directory, opening it if needed or stale."""
+    version = get_index_version(persist_directory)
+    with _db_pool_lock:
+        now = time.time()
+        _evict_idle_chroma_dbs(now)
+        entry = _db_pool.setdefault(
+            os.path.normpath(persist_directory),
+            {"db": None, "version": None, "refs": 0, "last_used": now, "loading": threading.Lock()},
+        )
+        entry["last_used"] = now
+        if entry["db"] is not None and entry["version"] == version:
+            return entry["db"]
+    # Opened under the entry's own lock, so a cold load (embedding model, Chroma) only blocks callers of this collection
+    with entry["loading"]:
+        with _db_pool_lock:
+            if entry["db"] is not None and entry["version"] == version:
+                return entry["db"]
+        db = initialize_chroma_db(persist_directory)
+        with _db_pool_lock:
+            entry["db"] = db
+            entry["version"] = version
+        return db
+
+def acquire_chroma_db(persist_directory):
+    db = get_chroma_db(persist_directory)
+    with _db_pool_lock:
+        _db_pool[os.path.normpath(persist_directory)]["refs"] += 1
+    return db
+
+def release_chroma_db(persist_directory):
+    with _db_pool_lock:
+        entry = _db_pool.get(os.path.normpath(persist_directory))
+        if entry is not None:
+            entry["refs"] = max(0, entry["refs"] - 1)
+            entry["last_used"] = time.time()
+
+class ChromaDbLease:
+    """
+    A session's reference to a pooled Chroma handle.
+
+    The reference is released by release() or, for sessions that simply go away, when the lease is garbage collected.
+    """
+
+    def __init__(self, persist_directory):
+        self.path = persist_directory
+        acquire_chroma_db(persist_directory)
+        self._finalizer = weakref.finalize(self, release_chroma_db, persist_directory)
+
+    @property
+    def db(self):
+        return get_chroma_db(self.path)
+
+    def release(self):
+        self._finalizer()
+
 def get_chroma_db_files(directory):
     """Retrieve files ending with 'chroma_db' from the given directory."""
     return [f for f in os.listdir(directory) if f.endswith('chroma_db')]
@@ -49,27 +150,25 @@ def delete_doc_from_chroma_db(db_path, source_doc):
     :param source_doc: The source document identifier to match
     """
     # Initialize embeddings (assuming this step is necessary for your Chroma setup)
-    embeddings = HuggingFaceEmbeddings(model_name=app_constants.EMBEDDING_MODEL_NAME)
+    embeddings = app_embeddings.get_embeddings()
 
     # Initialize Chroma database
     if not os.path.exists(db_path):
         app_logger.error(f"No Chroma database found at {db_path}.")
         return
 
+    from langchain_community.vectorstores import Chroma
+
     db = Chroma(persist_directory=db_path, embedding_function=embeddings, client_settings=app_constants.CHROMA_SETTINGS)
 
-    ids_to_delete = []
-
-    # Iterate over documents in the database
-    for doc in db:
-        # Check if the document is related to the source document
-        if doc.metadata.get('source') == source_doc:
-            # Add the document's ID to the list of IDs to delete
-            ids_to_delete.append(doc.id)
-    # Delete documents with matching IDs
-    if ids_to_delete:
-        db.delete(ids=ids_to_delete)
+    # Single metadata-filtered delete instead of loading every record
+    matching_ids = db._collection.get(where={"source": source_doc}, include=[])["ids"]
+    if matching_ids:
+        db._collection.delete(where={"source": source_doc})
         db.persist()
-        app_logger.error(f"Deleted {len(ids_to_delete)} items related to '{source_doc}'.")
+        from modules import app_lexical_index
+        app_lexical_index.delete_source(db_path, source_doc)
+        mark_index_changed(db_path)
+        app_logger.info(f"Deleted {len(matching_ids)} items related to '{source_doc}'.")
     else:
-        app_logger.error(f"No items found related to '{source_doc}'.")
\ No newline at end of file
+        app_logger.error(f"No items found related to '{source_doc}'.")
@@ -1,11 +1,11 @@
 #file utils.py
 import os
-from modules import app_constants, app_to_vectorstore,app_page_definitions,common_utils
-from modules import app_logger
+from modules import app_constants,app_page_definitions,common_utils,app_processed_registry
+from modules import app_logger, app_web_fetcher
 import json
-import requests
+import shutil
 import hashlib
-import re, csv
+import re
 
 # Use the logger from app_config
 app_logger = app_logger.app_logger
@@ -14,12 +14,20 @@ system_content_file = metadata_path=app_constants.SYSTEM_CONTENT_DATA
 
 def download_file(url):
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        result = app_web_fetcher.get_fetcher().fetch(url, max_bytes=app_constants.CATALOG_DOWNLOAD_MAX_MB * 1024 * 1024)
+        if result.error:
+            raise IOError(result.error)
         sanitized_filename = sanitize_filename(url.split('/')[-1])
         sanitized_local_path = os.path.join(app_constants.WORKSPACE_DIRECTORY+"/docs/", sanitized_filename)
-        with open(sanitized_local_path, 'wb') as f:
-            f.write(response.content)
+        # None means the HTTP cache still holds the current version
+        if result.content is None:
+            if os.path.exists(sanitized_local_path):
+                app_logger.info(f"File unchanged since last download: {sanitized_local_path}")
+                return True
+            shutil.copyfile(app_web_fetcher.get_fetcher().cache.body_path(url), sanitized_local_path)
+        else:
+            with open(sanitized_local_path, 'wb') as f:
+                f.write(result.content)
         app_logger.info(f"File downloaded successfully: {sanitized_local_path}")
         return True
     except Exception as e:
@@ -27,6 +35,8 @@ def download_file(url):
         return False
 
 def index_file(local_path, module):
+    # Imported on use: loading the vector store stack is only needed when indexing
+    from modules import app_to_vectorstore
     try:
         status = app_to_vectorstore.get_chroma_index(local_path,module,True)
         app_logger.info(f"File indexed successfully: {local_path}")
@@ -36,6 +46,22 @@ def index_file(local_path, module):
         db = None
     return status
     
+def reindex_changed_files():
+    """Incrementally re-index every indexed file that still exists on disk."""
+    from modules import app_to_vectorstore
+    updated = []
+    for path in sorted(app_processed_registry.get_registry().all_paths()):
+        if not os.path.exists(path):
+            continue
+        for entry in app_processed_registry.get_registry().get_by_path(path):
+            try:
+                # Research notes live in their own temporary store, not in the page's persistent one
+                if app_to_vectorstore.update_chroma_index(path, entry["page"], bool(entry["persistent"])):
+                    updated.append(path)
+            except Exception as e:
+                app_logger.error(f"Failed to re-index {path}. Error: {e}")
+    return updated
+
 def compute_md5(file_path):
     hash_md5 = hashlib.md5()
     try:
@@ -119,19 +145,8 @@ def perform_file_operation(resource, operation):
 
 def get_indexed_files_for_page(page_id):
     try:
-        filtered_files = []
-
-        # Open and read the CSV file
-        with open(os.path.join(work_dir, app_constants.PROCESSED_DOCS), mode='r', newline='', encoding='utf-8') as file:
-            csv_reader = csv.reader(file)
-            for row in csv_reader:
-                # Check if the second item in the row matches the page_id
-                if len(row) > 2 and row[1].lower() == page_id.lower():
-                    # Extract just the file name from the full path (third item in the row)
-                    file_name = os.path.basename(row[2])
-                    filtered_files.append(file_name)
-
-        return filtered_files
+        entries = app_processed_registry.get_registry().files_for_page(page_id)
+        return [os.path.basename(entry["path"]) for entry in entries]
     except Exception as e:
         return []
 
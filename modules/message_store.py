@@ -2,6 +2,11 @@
 class MessageStore:
     def __init__(self):
         self.messages = {}
+        # (tokenizer name, role, content) -> token count, so each message is tokenized once
+        self.token_counts = {}
+        # Model server slot this session is pinned to and the last prompt sent, for prompt cache reuse
+        self.slot = None
+        self.last_prompt = []
 
     def update_message(self, page, message_type, message):
         if page not in self.messages:
@@ -20,4 +25,28 @@ class MessageStore:
     def set_history(self, page, history):
         if page not in self.messages:
             self.messages[page] = {"system": None, "greeting": None, "history": []}
-        self.messages[page]["history"] = history
\ No newline at end of file
+        self.messages[page]["history"] = history
+
+    def get_history_anchor(self, page):
+        """Index of the oldest history message sent to the model, see common_utils._anchored_history."""
+        return self.messages.get(page, {}).get("anchor", 0)
+
+    def get_anchored_length(self, page):
+        """History length when the anchor was last set, to tell when the history was cleared or shortened."""
+        return self.messages.get(page, {}).get("anchored_length", 0)
+
+    def set_history_anchor(self, page, anchor, history_length=None):
+        if page not in self.messages:
+            self.messages[page] = {"system": None, "greeting": None, "history": []}
+        self.messages[page]["anchor"] = anchor
+        if history_length is not None:
+            self.messages[page]["anchored_length"] = history_length
+
+    def get_token_count(self, message, tokenizer):
+        """Token count of a {"role", "content"} message, computed with tokenizer on first use."""
+        key = (tokenizer.name, message["role"], message["content"])
+        count = self.token_counts.get(key)
+        if count is None:
+            count = tokenizer.count(message["content"])
+            self.token_counts[key] = count
+        return count
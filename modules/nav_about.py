@@ -1,6 +1,6 @@
 from . import app_constants
 import streamlit as st
-from modules import app_logger,app_st_session_utils, app_page_definitions
+from modules import app_logger,app_st_session_utils, app_page_definitions, app_embeddings, app_profiler, app_llm_clients, app_llm_gateway, app_response_cache
 
 # Use the logger from app_config
 app_logger = app_logger.app_logger
@@ -83,8 +83,49 @@ def app():
             # Reset other modes' settings
             app_constants.model_uri = None
             st.info("Use update configuration for changes to be affected")
+        # Clients and pooled connections for the previous endpoint are no longer needed
+        app_llm_clients.reset()
         st.success("Configuration updated for " + server_mode + " mode.")
 
+    with st.expander("Model Server Connection"):
+        health = app_llm_clients.check_health(force=st.button("Check Connection"))
+        if health["ok"]:
+            st.write(f"Reachable at {app_constants.model_uri or app_llm_clients.OPENAI_BASE_URL}, responded in {health['latency'] * 1000:.0f} ms")
+        else:
+            st.write(f"Not reachable: {health['error']}")
+
+    with st.expander("Embedding Models"):
+        model_stats = app_embeddings.get_model_stats()
+        if model_stats:
+            for model_name, stats in model_stats.items():
+                memory_info = f", {stats['memory_mb']:.1f} MB" if stats["memory_mb"] is not None else ""
+                throughput_info = f", {stats['chunks_per_sec']:.1f} chunks/sec (batch size {stats['batch_size'] or 'tuning'})" if stats.get("chunks_per_sec") else ""
+                st.write(f"{model_name}: loaded in {stats['load_time']:.2f}s{memory_info}{throughput_info}")
+        else:
+            st.write("No embedding model loaded yet.")
+
+    with st.expander("Model Server Queue"):
+        gateway_stats = app_llm_gateway.stats()
+        st.write(f"{gateway_stats['in_flight']} of {app_constants.LLM_GATEWAY_CONCURRENCY} request slots in use")
+        for name in app_llm_gateway.PRIORITY_NAMES.values():
+            queue_stats = gateway_stats[name]
+            st.write(
+                f"{name.title()}: {queue_stats['admitted']} admitted, {queue_stats['queued']} waiting, "
+                f"{queue_stats['rejected']} rejected, {queue_stats['timed_out']} timed out, "
+                f"average wait {queue_stats['avg_wait']:.2f}s, average service {queue_stats['avg_service']:.2f}s"
+            )
+
+    with st.expander("Response Cache"):
+        cache_stats = app_response_cache.stats()
+        st.write(
+            f"{cache_stats['entries']} cached answers ({cache_stats['size_mb']:.1f} MB), hit rate {cache_stats['hit_rate']:.0%} "
+            f"since startup: {cache_stats['exact_hits']} exact, {cache_stats['semantic_hits']} near-duplicate, {cache_stats['misses']} misses"
+        )
+
+    if app_profiler.is_enabled():
+        with st.expander("Startup Import Profile"):
+            st.code(app_profiler.format_report(limit=50))
+
     with st.expander("About ZySec and the Author"):
         st.markdown("""
             ### About ZySec
@@ -129,6 +129,15 @@ def app():
                             st.info("These details have already been submitted in this session.")
 
 
+    st.write("Documents edited since they were learned can be refreshed without clearing the data.")
+    if st.button("Refresh Changed Documents"):
+        with st.spinner("Re-indexing changed documents..."):
+            updated_files = file_utils.reindex_changed_files()
+        if updated_files:
+            st.success(f"Re-indexed {len(updated_files)} changed document(s).")
+        else:
+            st.info("No changed documents found.")
+
     st.write("Using below clear option, you can clear all data in the system and start fresh to index and upload information!")
     if st.button("Clear Data"):
         file_utils.delete_files()
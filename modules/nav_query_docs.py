@@ -1,15 +1,18 @@
 import streamlit as st
-from modules import app_logger, app_page_definitions, app_prompt, app_constants, app_st_session_utils,common_utils,file_utils
+from modules import app_logger, app_page_definitions, app_prompt, app_constants, app_st_session_utils,common_utils,file_utils,app_retrievers
 import time
 # Use the logger from app_config
 app_logger = app_logger.app_logger
 
-def app(message_store, current_page="nav_private_ai", use_retrieval_chain=False):
+def app(message_store, current_page="nav_private_ai", use_retrieval_chain=False, federated_pages=None):
     app_logger.info(f"Starting Streamlit app - {current_page}")
 
     # Fetch page configuration from app_page_definitions
     page_config = app_page_definitions.PAGE_CONFIG.get(current_page, app_page_definitions.PAGE_CONFIG["default"])
-    files_indexed = file_utils.get_indexed_files_for_page(current_page)
+    if federated_pages:
+        files_indexed = [file for page in federated_pages for file in file_utils.get_indexed_files_for_page(page)]
+    else:
+        files_indexed = file_utils.get_indexed_files_for_page(current_page)
     #print(files_indexed)
     # Use configurations for title, caption, and greeting from page_config
     st.title(page_config["title"])
@@ -20,7 +23,9 @@ def app(message_store, current_page="nav_private_ai", use_retrieval_chain=False)
     app_st_session_utils.initialize_session_state('page_loaded', False)
     app_st_session_utils.initialize_session_state('message_store', message_store)
     db_retriever_playbooks = False
-    if use_retrieval_chain:
+    if federated_pages:
+        db_retriever_playbooks = app_retrievers.get_federated_retriever(federated_pages, k=app_constants.RAG_K)
+    elif use_retrieval_chain:
         db_retriever_playbooks = True
         # Initialize or retrieve the database
         persistent_db = app_constants.LOCAL_PERSISTANT_DB + current_page + '_chroma_db'
@@ -43,20 +48,23 @@ def app(message_store, current_page="nav_private_ai", use_retrieval_chain=False)
         st.chat_message("user").write(prompt)
         app_logger.info(f"Processed user prompt: {prompt}")
         start_time = time.time()
+        answer_stats = {}
         with st.spinner("Processing request..."):
             if use_retrieval_chain:
                 if db_retriever_playbooks:
-                    formatted_response = app_prompt.query_llm(prompt,page=current_page, retriever=db_retriever_playbooks.as_retriever(search_type="similarity", search_kwargs={"k": app_constants.RAG_K}), message_store=message_store, use_retrieval_chain=use_retrieval_chain)
-                    app_st_session_utils.display_chat_message("assistant", formatted_response)  # Updated line
+                    retriever = db_retriever_playbooks if federated_pages else app_retrievers.get_retriever(db_retriever_playbooks, persistent_db, k=app_constants.RAG_K)
+                    formatted_response = app_st_session_utils.stream_chat_message(app_prompt.query_llm_stream(prompt,page=current_page, retriever=retriever, message_store=message_store, use_retrieval_chain=use_retrieval_chain, username=st.session_state.get('username', ''), stream_stats=answer_stats))
                     app_st_session_utils.add_message_to_session("user", prompt)
                     app_st_session_utils.add_message_to_session("assistant", formatted_response)           
                 else:
                     st.error("Unable to initialize the database. Please try again later.")
             else:
-                formatted_response = app_prompt.query_llm(prompt,page=current_page, message_store=message_store, retriever=False)
-                app_st_session_utils.display_chat_message("assistant", formatted_response)  # Updated line
+                formatted_response = app_st_session_utils.stream_chat_message(app_prompt.query_llm_stream(prompt,page=current_page, message_store=message_store, retriever=False, username=st.session_state.get('username', ''), stream_stats=answer_stats))
                 app_st_session_utils.add_message_to_session("user", prompt)
                 app_st_session_utils.add_message_to_session("assistant", formatted_response)
         end_time = time.time()  # End timing
         processing_time = end_time - start_time  # Calculate processing time
         st.info(f"Processing time: {processing_time:.2f} seconds")  # Log processing time
+        app_st_session_utils.display_stream_stats(answer_stats)
+        if answer_stats.get("mode") and not answer_stats.get("cache"):
+            st.caption(f"{answer_stats['mode']}: {answer_stats['llm_calls']} LLM calls, {answer_stats['prompt_tokens']} prompt + {answer_stats['completion_tokens']} completion tokens")
@@ -1,6 +1,6 @@
 import streamlit as st
 from modules import app_prompt, app_researcher, app_logger, database_utils, app_to_vectorstore, app_page_definitions
-from modules import app_st_session_utils,app_constants,common_utils  # Importing the session utilities module
+from modules import app_st_session_utils,app_constants,common_utils,app_retrievers  # Importing the session utilities module
 
 # Use the logger from app_config
 app_logger = app_logger.app_logger
@@ -27,8 +27,12 @@ def app(message_store):
     if research_button and topic:
         with st.spinner('Searching...'):
             try:
-                research_notes = app_researcher.explore_url_on_internet(topic, count=app_constants.SEARCH_COUNT)
-                status = app_to_vectorstore.get_chroma_index(research_notes, is_persistent=False)
+                research_notes = app_researcher.explore_url_on_internet(topic, count=app_constants.SEARCH_COUNT, username=st.session_state.get('username', ''))
+                progress_bar = st.progress(0.0, text="Indexing research notes...")
+                def show_progress(progress):
+                    progress_bar.progress(progress["fraction"] or 0.0, text=f"Indexed {progress['chunks']} chunks from {progress['documents']} notes")
+                status = app_to_vectorstore.stream_chroma_index(research_notes, is_persistent=False, progress_callback=show_progress)
+                progress_bar.empty()
                 app_logger.info("Internet research completed successfully")
                 st.success("Internet research completed")
                 st.session_state['research_done'] = True
@@ -68,8 +72,9 @@ def app(message_store):
         st.chat_message("user").write(prompt)
         with st.spinner("Processing your request..."):
             if db_retriever:
-                formatted_response = app_prompt.query_llm(prompt,page=current_page, retriever=db_retriever.as_retriever(search_type="similarity", search_kwargs={"k": app_constants.RAG_K}), message_store=st.session_state['message_store'],use_retrieval_chain=True)
-                st.chat_message("assistant").markdown(formatted_response, unsafe_allow_html=True)
+                stream_stats = {}
+                formatted_response = app_st_session_utils.stream_chat_message(app_prompt.query_llm_stream(prompt,page=current_page, retriever=app_retrievers.get_retriever(db_retriever, research_notes, k=app_constants.RAG_K), message_store=st.session_state['message_store'],use_retrieval_chain=True, username=st.session_state.get('username', ''), stream_stats=stream_stats))
+                app_st_session_utils.display_stream_stats(stream_stats)
                 app_st_session_utils.add_message_to_session("user", prompt)
                 app_st_session_utils.add_message_to_session("assistant", formatted_response)
                 app_logger.info(f"Processed user prompt: {prompt}")
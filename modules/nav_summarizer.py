@@ -1,11 +1,10 @@
 
 import os
 import streamlit as st
-from langchain_openai import ChatOpenAI
 from langchain.chains import load_summarize_chain
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredWordDocumentLoader
 from langchain.prompts import PromptTemplate
-from modules import app_page_definitions, app_logger,app_constants,file_utils
+from modules import app_page_definitions, app_logger,app_constants,file_utils,app_llm_clients,app_llm_gateway
 
 # Use the logger from app_config
 app_logger = app_logger.app_logger
@@ -54,13 +53,9 @@ def app():
         progress_bar = st.progress(0)
 
         if st.button("Summarize"):
+            username = st.session_state.get('username', '')
             with st.spinner('Processing... Please wait'):
-                llm = ChatOpenAI(
-                    model_name=app_constants.MODEL_NAME,
-                    openai_api_key=app_constants.openai_api_key,
-                    base_url=app_constants.model_uri,
-                    streaming=True
-                )
+                llm = app_llm_clients.get_chat_model()
 
                 prompt_template = """Write a concise summary of the following:
                 {text}
@@ -90,23 +85,29 @@ def app():
                     output_key="output_text",
                 )
 
-                start_doc, end_doc = doc_range
-                for i in range(start_doc - 1, min(end_doc, total_docs), batch_size):
-                    batch_docs = docs[i:min(i + batch_size, total_docs)]
-
-                    progress_value = (i + len(batch_docs)) / total_docs
-                    progress_bar.progress(progress_value)
-
-                    with st.expander(f"Processing Documents {i + 1} - {i + len(batch_docs)}", expanded=False):
-                        intermediate_summary = chain.invoke({"input_documents": batch_docs}, return_only_outputs=True)
-                        st.write(intermediate_summary)
-
-                selected_docs = docs[start_doc - 1:end_doc]
-                final_summary_response = chain.invoke({"input_documents": selected_docs}, return_only_outputs=True)
-                final_summary = final_summary_response['output_text'] if 'output_text' in final_summary_response else "No summary generated."
-                st.text_area("Final Summary", final_summary, height=300)
-
-                st.success("Summarization Completed!")
+                try:
+                    start_doc, end_doc = doc_range
+                    for i in range(start_doc - 1, min(end_doc, total_docs), batch_size):
+                        batch_docs = docs[i:min(i + batch_size, total_docs)]
+
+                        progress_value = (i + len(batch_docs)) / total_docs
+                        progress_bar.progress(progress_value)
+
+                        with st.expander(f"Processing Documents {i + 1} - {i + len(batch_docs)}", expanded=False):
+                            with app_llm_gateway.admit(app_llm_gateway.BACKGROUND, username):
+                                intermediate_summary = chain.invoke({"input_documents": batch_docs}, return_only_outputs=True)
+                            st.write(intermediate_summary)
+
+                    selected_docs = docs[start_doc - 1:end_doc]
+                    with app_llm_gateway.admit(app_llm_gateway.BACKGROUND, username):
+                        final_summary_response = chain.invoke({"input_documents": selected_docs}, return_only_outputs=True)
+                    final_summary = final_summary_response['output_text'] if 'output_text' in final_summary_response else "No summary generated."
+                    st.text_area("Final Summary", final_summary, height=300)
+
+                    st.success("Summarization Completed!")
+                except app_llm_gateway.GatewayBusyError as e:
+                    app_logger.warning(f"Summarization rejected: {e}")
+                    st.error(f"The model server is busy with other requests, please try again in a moment. ({e})")
             progress_bar.empty()
     else:
         st.warning("Please upload a document to summarize.")
@@ -1,6 +1,10 @@
 #!/bin/bash
 
 source "$PWD/config.cfg"
+# Read by the app to size prompts against the model context window and load the model's tokenizer
+export CONTEXT_LENGTH MODEL_FILE
+# Read by the app to pin sessions to server slots and size the LLM gateway
+export LLM_SERVER_SLOTS
 
 # set degub mode
 if [ "$SCRIPT_DEBUG_MODE" = "on" ]; then
@@ -126,9 +130,9 @@ start_local_model_server() {
         echo "INFO: Starting model server with model file at $model_path"
         # In start_local_model_server function, after starting the server with nohup:
         if [ "$ENABLE_MODEL_SERVER_LOG" == "yes" ]; then
-            nohup python3 -m llama_cpp.server --model "$model_path" --n_batch $BATCH_SIZE --n_ctx $CONTEXT_LENGTH --verbose true --n_gpu_layers $GPU_LAYERS --chat_format zephyr > ./server.log 2>&1 &
+            nohup python3 -m llama_cpp.server --model "$model_path" --n_batch $BATCH_SIZE --n_ctx $CONTEXT_LENGTH --cache true --verbose true --n_gpu_layers $GPU_LAYERS --chat_format zephyr > ./server.log 2>&1 &
         else
-            nohup python3 -m llama_cpp.server --model "$model_path" --n_batch $BATCH_SIZE --n_ctx $CONTEXT_LENGTH --verbose true --n_gpu_layers $GPU_LAYERS --chat_format zephyr > /dev/null 2>&1 &
+            nohup python3 -m llama_cpp.server --model "$model_path" --n_batch $BATCH_SIZE --n_ctx $CONTEXT_LENGTH --cache true --verbose true --n_gpu_layers $GPU_LAYERS --chat_format zephyr > /dev/null 2>&1 &
         fi
         MODEL_SERVER_PID=$!
         export MODEL_SERVER_PID  # Export the PID to an environment variable
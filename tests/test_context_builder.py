@@ -0,0 +1,90 @@
+# common_utils.construct_messages_to_send: token-budgeted history, and the anchored window kept for the prompt cache.
+
+import unittest
+from unittest import mock
+
+from modules import app_constants, app_tokenizer, common_utils
+from modules.message_store import MessageStore
+
+PAGE = "nav_private_ai"
+# Every message costs len(content) // 4 + 1 + MESSAGE_OVERHEAD = 15 tokens with the estimate tokenizer
+MESSAGE_COST = 15
+
+
+def _message(role, index):
+    return {"role": role, "content": f"{role} message {index:03d} ".ljust(40, ".")}
+
+
+class ContextBuilderTest(unittest.TestCase):
+    def setUp(self):
+        tokenizer = mock.patch.object(app_tokenizer, "_tokenizer", app_tokenizer.EstimateTokenizer())
+        tokenizer.start()
+        self.addCleanup(tokenizer.stop)
+        self.store = MessageStore()
+        self.store.update_message(PAGE, "system", "s" * 36)
+        self.store.update_message(PAGE, "greeting", "g" * 36)
+
+    def _add_turns(self, count, start=0):
+        for index in range(start, start + count):
+            self.store.update_message(PAGE, "history", _message("user", index))
+            self.store.update_message(PAGE, "history", _message("assistant", index))
+
+    def _cost(self, messages):
+        tokenizer = app_tokenizer.get_tokenizer()
+        return sum(tokenizer.count(message["content"]) + app_tokenizer.MESSAGE_OVERHEAD for message in messages)
+
+    def _build(self, prompt, budget):
+        return common_utils.construct_messages_to_send(PAGE, self.store, prompt, token_budget=budget)
+
+    def test_newest_history_that_fits_the_budget(self):
+        self._add_turns(10)
+        with mock.patch.object(app_constants, "PROMPT_CACHE_ENABLED", False):
+            messages = self._build("q" * 36, MESSAGE_COST * 8)
+        self.assertEqual(messages[0]["role"], "system")
+        self.assertEqual(messages[1]["content"], "g" * 36)
+        self.assertEqual(messages[-1], {"role": "user", "content": "q" * 36})
+        # system, greeting and question leave room for the five newest history messages
+        self.assertEqual(messages[2:-1], self.store.get_history(PAGE)[-5:])
+        self.assertLessEqual(self._cost(messages), MESSAGE_COST * 8)
+
+    def test_greeting_dropped_when_it_does_not_fit(self):
+        with mock.patch.object(app_constants, "PROMPT_CACHE_ENABLED", False):
+            messages = self._build("q" * 36, MESSAGE_COST * 2)
+        self.assertEqual([message["role"] for message in messages], ["system", "user"])
+
+    def test_anchored_window_keeps_the_prefix_until_it_overflows(self):
+        # System, greeting and question leave room for ten history messages, five turns
+        budget = MESSAGE_COST * 13
+        with mock.patch.object(app_constants, "PROMPT_CACHE_ENABLED", True), mock.patch.object(app_constants, "PROMPT_CACHE_HEADROOM", 0.5):
+            self._add_turns(1)
+            previous = self._build("q" * 36, budget)
+            for turn in range(1, 5):
+                self._add_turns(1, start=turn)
+                messages = self._build("q" * 36, budget)
+                # While the window fits, each prompt repeats the previous one up to its question
+                self.assertEqual(messages[:len(previous) - 1], previous[:-1])
+                previous = messages
+            self.assertEqual(self.store.get_history_anchor(PAGE), 0)
+            self._add_turns(1, start=5)
+            messages = self._build("q" * 36, budget)
+        history = messages[2:-1]
+        # The overflow moved the window to a user message and freed half of the history budget
+        self.assertEqual(history[0]["role"], "user")
+        self.assertEqual(history, self.store.get_history(PAGE)[-4:])
+        self.assertLessEqual(self._cost(messages), budget)
+
+    def test_cleared_history_resets_the_anchor(self):
+        budget = MESSAGE_COST * 9
+        with mock.patch.object(app_constants, "PROMPT_CACHE_ENABLED", True):
+            self._add_turns(8)
+            self._build("q" * 36, budget)
+            self.assertGreater(self.store.get_history_anchor(PAGE), 0)
+            self.store.set_history(PAGE, [])
+            self._add_turns(1, start=100)
+            messages = self._build("q" * 36, budget)
+        self.assertEqual(messages[2:-1], self.store.get_history(PAGE))
+        self.assertEqual(self.store.get_history_anchor(PAGE), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
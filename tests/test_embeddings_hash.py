@@ -0,0 +1,45 @@
+# The hash embedding backend used in tests: deterministic, fixed-size, normalized vectors.
+
+import math
+import unittest
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from modules import app_embeddings  # noqa: E402
+
+TEXTS = ["Ransomware encrypts files and demands payment.", "Phishing emails deliver the initial payload.", ""]
+
+
+class HashBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = app_embeddings.HashBackend("test-model")
+
+    def test_vectors_are_deterministic(self):
+        first = self.backend.embed_documents(TEXTS)
+        second = app_embeddings.HashBackend("test-model").embed_documents(TEXTS)
+        self.assertEqual(first, second)
+        self.assertEqual(self.backend.embed_query(TEXTS[0]), first[0])
+
+    def test_dimensions_and_norm(self):
+        vectors = self.backend.embed_documents(TEXTS)
+        self.assertEqual(len(vectors), len(TEXTS))
+        for vector in vectors:
+            self.assertEqual(len(vector), app_embeddings.HashBackend.dimensions)
+        for vector in vectors[:2]:
+            self.assertAlmostEqual(math.sqrt(sum(value * value for value in vector)), 1.0)
+        self.assertEqual(set(vectors[2]), {0.0})
+
+    def test_different_texts_differ(self):
+        vectors = self.backend.embed_documents(TEXTS[:2])
+        self.assertNotEqual(vectors[0], vectors[1])
+
+    def test_selected_by_name(self):
+        embeddings = app_embeddings.get_embeddings("test-model", backend="hash")
+        self.assertIsInstance(embeddings, app_embeddings.HashBackend)
+        self.assertIs(app_embeddings.get_embeddings("test-model", backend="hash"), embeddings)
+
+
+if __name__ == "__main__":
+    unittest.main()
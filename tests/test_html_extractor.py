@@ -0,0 +1,53 @@
+# lxml extractor of app_html_extractor on the benchmark corpus and on bodies libxml2 cannot parse.
+
+import os
+import unittest
+
+import pytest
+
+pytest.importorskip("lxml")
+
+from modules import app_html_extractor  # noqa: E402
+
+CORPUS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "corpus")
+
+
+class LxmlExtractorTest(unittest.TestCase):
+    def test_wrapper_classes_do_not_drop_the_page(self):
+        with open(os.path.join(CORPUS_DIRECTORY, "body_class_sidebar.html"), "rb") as f:
+            text = app_html_extractor.lxml_extract_text(f.read())
+        self.assertIn("Isolate affected hosts from the network", text)
+        self.assertIn("at least thirty days", text)
+        for boilerplate in ("Related playbooks", "Subscribe", "uses cookies", "Copyright"):
+            self.assertNotIn(boilerplate, text)
+
+    def test_saved_pages_keep_the_content_only(self):
+        pages = {
+            "vendor_advisory.html": (
+                ("Remove the JndiLookup class from the classpath", "Log Analytics Appliance All releases 5.0.4 Fixed"),
+                ("Accept all", "Subscribe to advisories", "Related advisories", "Was this advisory helpful", "Copyright", "dataLayer"),
+            ),
+            "nist_publication.html": (
+                ("Computer Security Incident Handling Guide", "Containment Eradication and Recovery"),
+                ("Secure .gov websites use HTTPS", "Glossary", "Related NIST Publications", "Gaithersburg", "bootstrap"),
+            ),
+            "security_blog_post.html": (
+                ("A simple beaconing score", "score gaps.std / gaps.mean"),
+                ("Recent Posts", "Newsletter", "Sponsored", "Share this", "Proudly powered", "wpemojiSettings"),
+            ),
+        }
+        for name, (kept, dropped) in pages.items():
+            with open(os.path.join(CORPUS_DIRECTORY, name), "rb") as f:
+                text = app_html_extractor.lxml_extract_text(f.read())
+            for phrase in kept:
+                self.assertIn(phrase, text, name)
+            for phrase in dropped:
+                self.assertNotIn(phrase, text, name)
+
+    def test_unparseable_bodies_give_no_text(self):
+        for content in (b"", b"   ", b"<!-- nothing -->", b"<?xml version='1.0'?>", "<!-- nothing -->"):
+            self.assertEqual(app_html_extractor.lxml_extract_text(content), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+# app_to_vectorstore indexing paths against an in-memory stand-in for the Chroma store: chunk ids are the same
+# whichever path indexed a file, and re-indexing a changed file only replaces the chunks that differ.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_community")
+pytest.importorskip("requests")
+
+from modules import app_constants, app_embedding_cache, app_processed_registry, app_to_vectorstore, database_utils  # noqa: E402
+
+
+class _FakeCollection:
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, where=None, include=None):
+        return {"ids": [chunk_id for chunk_id, (_, metadata) in self.store.items() if metadata.get("source") == where["source"]]}
+
+    def delete(self, ids=None, where=None):
+        for chunk_id in ids:
+            self.store.pop(chunk_id, None)
+
+
+class _FakeChroma:
+    """Chroma stand-in keeping (text, metadata) per id and recording the ids written."""
+    stores = {}
+    written = []
+
+    def __init__(self, persist_directory=None, embedding_function=None, client_settings=None):
+        self.store = _FakeChroma.stores.setdefault(persist_directory, {})
+        self._collection = _FakeCollection(self.store)
+
+    @classmethod
+    def from_documents(cls, docs, embeddings, ids=None, persist_directory=None, client_settings=None):
+        db = cls(persist_directory)
+        db.add_texts([doc.page_content for doc in docs], [doc.metadata for doc in docs], ids)
+        return db
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        _FakeChroma.written.extend(ids)
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            self.store[chunk_id] = (text, metadata)
+
+    def persist(self):
+        pass
+
+
+def _paragraph(index, variant=""):
+    # Just under CHUNK_SIZE, so every paragraph is one chunk
+    words = f"paragraph {index}{variant} " + " ".join(f"word{index}x{n}" for n in range(200))
+    return words[:app_constants.CHUNK_SIZE - 20]
+
+
+class IncrementalIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        registry = app_processed_registry.ProcessedFilesRegistry(os.path.join(self.directory.name, "processed.sqlite3"), os.path.join(self.directory.name, "none.log"))
+        _FakeChroma.stores, _FakeChroma.written = {}, []
+        for patcher in (
+            mock.patch.object(app_to_vectorstore, "Chroma", _FakeChroma),
+            mock.patch.object(app_to_vectorstore, "DB_DIR", os.path.join(self.directory.name, "db")),
+            # Set in the module dict: patch.object would build the real settings to restore them
+            mock.patch.dict(app_constants.__dict__, {"CHROMA_SETTINGS": None}),
+            mock.patch.object(app_embedding_cache, "get_cached_embeddings", lambda *args: None),
+            mock.patch.object(app_processed_registry, "get_registry", lambda: registry),
+            mock.patch.object(database_utils, "mark_index_changed", lambda *args: None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.file_path = os.path.join(self.directory.name, "standard.txt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write(self, paragraphs):
+        with open(self.file_path, "w", encoding="utf-8") as f:
+            f.write("\n\n".join(paragraphs))
+        # A later mtime even on filesystems with coarse timestamps
+        stat = os.stat(self.file_path)
+        os.utime(self.file_path, (stat.st_atime, stat.st_mtime + len(_FakeChroma.written) + 1))
+
+    def _ids(self, page):
+        persist_directory = app_to_vectorstore.get_chroma_persist_directory(self.file_path, page)
+        return set(_FakeChroma.stores.get(persist_directory, {}))
+
+    def test_stream_and_batch_paths_give_the_same_ids(self):
+        self._write([_paragraph(index) for index in range(7)])
+        # Text files are read in blocks, make the blocks split the file
+        block_size = mock.patch.object(app_constants, "STREAM_TEXT_BLOCK_SIZE", 2000)
+        block_size.start()
+        self.addCleanup(block_size.stop)
+        self.assertTrue(app_to_vectorstore.get_chroma_index(self.file_path, "nav_playbooks"))
+        app_processed_registry.get_registry().remove("nav_playbooks", self.file_path)
+        self.assertTrue(app_to_vectorstore.stream_chroma_index(self.file_path, "nav_standards", batch_size=2))
+        self.assertTrue(self._ids("nav_playbooks"))
+        self.assertEqual(self._ids("nav_playbooks"), self._ids("nav_standards"))
+
+    def test_update_replaces_only_the_changed_chunks(self):
+        paragraphs = [_paragraph(index) for index in range(6)]
+        self._write(paragraphs)
+        self.assertTrue(app_to_vectorstore.get_chroma_index(self.file_path, "nav_playbooks"))
+        before = self._ids("nav_playbooks")
+        _FakeChroma.written = []
+
+        paragraphs[2] = _paragraph(2, "b")
+        paragraphs.append(_paragraph(6))
+        self._write(paragraphs)
+        self.assertTrue(app_to_vectorstore.update_chroma_index(self.file_path, "nav_playbooks", batch_size=2))
+        after = self._ids("nav_playbooks")
+        self.assertEqual(len(_FakeChroma.written), 2)
+        self.assertEqual(len(before - after), 1)
+        self.assertEqual(after - before, set(_FakeChroma.written))
+        # The result is what indexing the new file from scratch gives
+        documents = app_to_vectorstore.load_file_documents(self.file_path)
+        self.assertEqual(after, set(app_to_vectorstore.make_chunk_ids(app_to_vectorstore.split_documents(documents))))
+        self.assertEqual(app_processed_registry.get_registry().get("nav_playbooks", self.file_path)["size"], os.path.getsize(self.file_path))
+
+    def test_unchanged_file_is_skipped(self):
+        self._write([_paragraph(index) for index in range(3)])
+        self.assertTrue(app_to_vectorstore.get_chroma_index(self.file_path, "nav_playbooks"))
+        _FakeChroma.written = []
+        self.assertFalse(app_to_vectorstore.update_chroma_index(self.file_path, "nav_playbooks"))
+        stat = os.stat(self.file_path)
+        os.utime(self.file_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertFalse(app_to_vectorstore.update_chroma_index(self.file_path, "nav_playbooks"))
+        self.assertEqual(_FakeChroma.written, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# app_llm_gateway admission control: concurrency limit, priority order, rejection of full queues and timeouts.
+
+import threading
+import time
+import unittest
+
+from modules import app_llm_gateway
+from modules.app_llm_gateway import BACKGROUND, INTERACTIVE, GatewayBusyError, LLMGateway
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+class LLMGatewayTest(unittest.TestCase):
+    def setUp(self):
+        self.gateway = LLMGateway(concurrency=1, max_queue=3, max_queue_per_user=2, max_wait=5)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.gateway.loop.call_soon_threadsafe(self.gateway.loop.stop)
+
+    def _hold_slot(self):
+        """Occupy the gateway's only slot from another thread until self.release is set."""
+        admitted = threading.Event()
+
+        def hold():
+            with self.gateway.admit(INTERACTIVE, "holder"):
+                admitted.set()
+                self.release.wait()
+
+        thread = threading.Thread(target=hold, daemon=True)
+        thread.start()
+        admitted.wait(2)
+        return thread
+
+    def _queued(self, priority, user, order):
+        def run():
+            try:
+                with self.gateway.admit(priority, user):
+                    order.append(user)
+            except GatewayBusyError:
+                order.append(f"rejected {user}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def test_admits_immediately_when_idle(self):
+        with self.gateway.admit(INTERACTIVE, "alice") as ticket:
+            self.assertLess(ticket["queue_wait"], 1.0)
+            self.assertEqual(self.gateway.stats()["in_flight"], 1)
+        _wait_for(lambda: self.gateway.stats()["in_flight"] == 0)
+        self.assertEqual(self.gateway.stats()["interactive"]["admitted"], 1)
+
+    def test_waiting_requests_run_one_at_a_time_by_priority(self):
+        holder = self._hold_slot()
+        order = []
+        background = self._queued(BACKGROUND, "bob", order)
+        _wait_for(lambda: self.gateway.stats()["background"]["queued"] == 1)
+        interactive = self._queued(INTERACTIVE, "carol", order)
+        _wait_for(lambda: self.gateway.stats()["interactive"]["queued"] == 1)
+        self.assertEqual(order, [])
+        self.release.set()
+        for thread in (holder, background, interactive):
+            thread.join(2)
+        self.assertEqual(order, ["carol", "bob"])
+
+    def test_users_share_a_priority_fairly(self):
+        holder = self._hold_slot()
+        order = []
+        threads = []
+        for user, queued in (("alice", 1), ("alice", 2), ("bob", 3)):
+            threads.append(self._queued(INTERACTIVE, user, order))
+            _wait_for(lambda: self.gateway.stats()["interactive"]["queued"] == queued)
+        self.release.set()
+        for thread in [holder] + threads:
+            thread.join(2)
+        self.assertEqual(order, ["alice", "bob", "alice"])
+
+    def test_full_queue_rejects_at_once(self):
+        self._hold_slot()
+        order = []
+        for user in ("bob", "carol", "erin"):
+            self._queued(INTERACTIVE, user, order)
+        _wait_for(lambda: self.gateway.stats()["interactive"]["queued"] == 3)
+        start_time = time.time()
+        with self.assertRaises(GatewayBusyError):
+            with self.gateway.admit(INTERACTIVE, "dave"):
+                pass
+        self.assertLess(time.time() - start_time, 1.0)
+        self.assertEqual(self.gateway.stats()["interactive"]["rejected"], 1)
+
+    def test_per_user_queue_limit(self):
+        self._hold_slot()
+        order = []
+        for _ in range(2):
+            self._queued(BACKGROUND, "bob", order)
+        _wait_for(lambda: self.gateway.stats()["background"]["queued"] == 2)
+        with self.assertRaises(GatewayBusyError):
+            with self.gateway.admit(INTERACTIVE, "bob"):
+                pass
+
+    def test_wait_times_out(self):
+        self.gateway.max_wait = 0.2
+        self._hold_slot()
+        with self.assertRaises(GatewayBusyError):
+            with self.gateway.admit(INTERACTIVE, "bob"):
+                pass
+        stats = self.gateway.stats()
+        self.assertEqual(stats["interactive"]["timed_out"], 1)
+        self.assertEqual(stats["interactive"]["queued"], 0)
+        self.release.set()
+        _wait_for(lambda: self.gateway.stats()["in_flight"] == 0)
+
+    def test_module_gateway_is_shared(self):
+        self.assertIs(app_llm_gateway.get_gateway(), app_llm_gateway.get_gateway())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# app_processed_registry: lookups, transactions, the in-memory view and migration of older registries.
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from modules import app_processed_registry
+from modules.app_processed_registry import ProcessedFilesRegistry, TEMP_PREFIX
+
+
+class ProcessedFilesRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "processed.sqlite3")
+        self.legacy_log = os.path.join(self.directory.name, "index_processed.log")
+        self.registry = ProcessedFilesRegistry(self.path, self.legacy_log)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookups(self):
+        self.registry.record("aaa", "nav_playbooks", "/docs/a.pdf", 10, 1.0)
+        self.registry.record("aaa", "nav_standards", "/docs/a.pdf")
+        self.registry.record("bbb", "nav_playbooks", "/docs/b.pdf")
+        self.assertTrue(self.registry.is_processed("aaa"))
+        self.assertFalse(self.registry.is_processed("ccc"))
+        self.assertEqual({entry["page"] for entry in self.registry.get_by_md5("aaa")}, {"nav_playbooks", "nav_standards"})
+        self.assertEqual(len(self.registry.get_by_path("/docs/a.pdf")), 2)
+        self.assertEqual(self.registry.get("NAV_PLAYBOOKS", "/docs/a.pdf")["size"], 10)
+        self.assertEqual({entry["path"] for entry in self.registry.files_for_page("nav_playbooks")}, {"/docs/a.pdf", "/docs/b.pdf"})
+        self.assertEqual(self.registry.all_paths(), {"/docs/a.pdf", "/docs/b.pdf"})
+
+    def test_record_replaces_and_remove_forgets(self):
+        self.registry.record("aaa", "nav_playbooks", "/docs/a.pdf")
+        self.registry.record("bbb", "nav_playbooks", "/docs/a.pdf")
+        self.assertFalse(self.registry.is_processed("aaa"))
+        self.assertEqual(self.registry.get("nav_playbooks", "/docs/a.pdf")["md5"], "bbb")
+        self.registry.remove("nav_playbooks", "/docs/a.pdf")
+        self.assertIsNone(self.registry.get("nav_playbooks", "/docs/a.pdf"))
+        self.assertEqual(self.registry.all_paths(), set())
+
+    def test_failed_transaction_changes_nothing(self):
+        self.registry.record("aaa", "nav_playbooks", "/docs/a.pdf")
+        with self.assertRaises(RuntimeError):
+            with self.registry.transaction() as txn:
+                txn.remove("nav_playbooks", "/docs/a.pdf")
+                txn.record("bbb", "nav_playbooks", "/docs/b.pdf")
+                raise RuntimeError("ingestion failed")
+        self.assertEqual(self.registry.all_paths(), {"/docs/a.pdf"})
+        self.assertEqual(ProcessedFilesRegistry(self.path, self.legacy_log).all_paths(), {"/docs/a.pdf"})
+
+    def test_writes_update_the_view_without_rereading_the_table(self):
+        self.registry.initialize()
+        rereads = []
+        refresh = self.registry._refresh
+        self.registry._refresh = lambda force=False: (rereads.append(force), refresh(force))
+        for index in range(20):
+            self.registry.record(f"md5-{index}", "nav_playbooks", f"/docs/{index}.pdf")
+        self.assertNotIn(True, rereads)
+        self.assertEqual(len(self.registry.all_paths()), 20)
+        self.assertEqual(ProcessedFilesRegistry(self.path, self.legacy_log).all_paths(), self.registry.all_paths())
+
+    def test_sees_writes_from_another_registry(self):
+        self.registry.record("aaa", "nav_playbooks", "/docs/a.pdf")
+        other = ProcessedFilesRegistry(self.path, self.legacy_log)
+        other.record("bbb", "nav_playbooks", "/docs/b.pdf")
+        self.registry.record("ccc", "nav_playbooks", "/docs/c.pdf")
+        self.assertEqual(self.registry.all_paths(), {"/docs/a.pdf", "/docs/b.pdf", "/docs/c.pdf"})
+
+    def test_imports_the_legacy_log(self):
+        note = os.path.join(TEMP_PREFIX, "note.jsonl")
+        with open(self.legacy_log, "w", encoding="utf-8") as log_file:
+            log_file.write("aaa,nav_playbooks,/docs/a.pdf\n")
+            log_file.write(f"bbb,nav_researcher,{note}\n")
+            log_file.write("malformed line\n")
+        self.registry.initialize()
+        self.assertEqual(self.registry.get("nav_playbooks", "/docs/a.pdf")["persistent"], 1)
+        self.assertEqual(self.registry.get("nav_researcher", note)["persistent"], 0)
+        self.assertEqual(len(self.registry.all_paths()), 2)
+
+    def test_adds_the_persistent_column_to_older_registries(self):
+        note = os.path.join(TEMP_PREFIX, "note.jsonl")
+        conn = sqlite3.connect(self.path)
+        conn.execute(
+            "CREATE TABLE processed_files (page TEXT NOT NULL, path TEXT NOT NULL, md5 TEXT NOT NULL, size INTEGER, "
+            "mtime REAL, indexed_at REAL NOT NULL, PRIMARY KEY (page, path))"
+        )
+        conn.execute("INSERT INTO processed_files VALUES ('nav_playbooks', '/docs/a.pdf', 'aaa', NULL, NULL, 1)")
+        conn.execute("INSERT INTO processed_files VALUES ('nav_researcher', ?, 'bbb', NULL, NULL, 2)", (note,))
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.registry.get("nav_playbooks", "/docs/a.pdf")["persistent"], 1)
+        self.assertEqual(self.registry.get("nav_researcher", note)["persistent"], 0)
+
+    def test_module_registry_is_shared(self):
+        self.assertIs(app_processed_registry.get_registry(), app_processed_registry.get_registry())
+
+
+if __name__ == "__main__":
+    unittest.main()
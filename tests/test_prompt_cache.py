@@ -0,0 +1,96 @@
+# Prompt cache request shaping against a mock OpenAI-compatible server that records the request bodies.
+
+import json
+import threading
+import unittest
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("httpx")
+
+from modules import app_answer_engine, app_constants, app_llm_clients, common_utils  # noqa: E402
+from modules.message_store import MessageStore  # noqa: E402
+
+PAGE = "nav_private_ai"
+
+
+class _RecordingHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.bodies.append(body)
+        reply = json.dumps({
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class PromptCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _RecordingHandler)
+        self.server.bodies = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = app_llm_clients.get_client(base_url=f"http://127.0.0.1:{self.server.server_port}/v1", api_key="test")
+        self.store = MessageStore()
+        self.store.update_message(PAGE, "system", "You are a security assistant.")
+        self.store.update_message(PAGE, "greeting", "Hello! How can I assist you today?")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        # The shared clients point at this test's server
+        app_llm_clients.reset()
+
+    def _ask(self, prompt, extra_body):
+        messages = common_utils.construct_messages_to_send(PAGE, self.store, prompt)
+        stats, lock = app_answer_engine.new_stats("direct"), threading.Lock()
+        reply = app_answer_engine._complete(self.client, messages, stats, lock, extra_body=extra_body)
+        self.store.update_message(PAGE, "history", {"role": "user", "content": prompt})
+        self.store.update_message(PAGE, "history", {"role": "assistant", "content": reply})
+        return self.server.bodies[-1]
+
+    def test_follow_up_repeats_the_previous_prompt(self):
+        first = self._ask("What is CVE-2021-44228?", app_llm_clients.prompt_cache_params())
+        second = self._ask("How is it mitigated?", app_llm_clients.prompt_cache_params())
+        self.assertEqual(second["messages"][:len(first["messages"])], first["messages"])
+        self.assertEqual(second["messages"][-1], {"role": "user", "content": "How is it mitigated?"})
+        self.assertEqual(first["cache_prompt"], True)
+        self.assertEqual(second["cache_prompt"], True)
+
+    def test_slot_is_sent_only_to_servers_with_several_slots(self):
+        slots = app_constants.LLM_SERVER_SLOTS
+        try:
+            app_constants.LLM_SERVER_SLOTS = 1
+            self.assertNotIn("id_slot", self._ask("What is ATT&CK T1059?", app_llm_clients.prompt_cache_params(0)))
+            app_constants.LLM_SERVER_SLOTS = 4
+            body = self._ask("And T1059.001?", app_llm_clients.prompt_cache_params(2))
+        finally:
+            app_constants.LLM_SERVER_SLOTS = slots
+        self.assertEqual(body["id_slot"], 2)
+        self.assertEqual(body["cache_prompt"], True)
+
+    def test_map_calls_ask_for_the_prompt_cache(self):
+        documents = [SimpleNamespace(page_content=f"Excerpt {i}", metadata={"source": f"doc{i}.pdf"}) for i in range(3)]
+        stats, lock = app_answer_engine.new_stats("map_reduce"), threading.Lock()
+        app_answer_engine.map_reduce_messages(self.client, "What changed?", documents, [{"role": "user", "content": "What changed?"}], stats, lock)
+        self.assertEqual(len(self.server.bodies), 3)
+        prefix = app_answer_engine.MAP_TEMPLATE.split("{excerpt}")[0]
+        for body in self.server.bodies:
+            self.assertTrue(body["messages"][0]["content"].startswith(prefix))
+            self.assertEqual(body["cache_prompt"], True)
+            self.assertNotIn("id_slot", body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# app_researcher.expand_keywords: offline keyphrases from the results of a topic-only search, reused by search_term_ddg.
+
+import unittest
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("duckduckgo_search")
+
+from modules import app_constants, app_researcher
+from modules.app_query_cache import LRUTTLCache
+
+TOPIC = "ransomware"
+RESULTS = [
+    {"href": "https://www.cisa.gov/stopransomware", "title": "StopRansomware Guide",
+     "body": "Ransomware attacks encrypt files. Offline encrypted backups and incident response plans limit the damage."},
+    {"href": "https://www.nist.gov/ransomware", "title": "Ransomware Protection and Response",
+     "body": "Ransomware recovery starts from offline encrypted backups; network segmentation slows lateral movement."},
+    {"href": "https://example.com/report.pdf", "title": "Ransomware trends report",
+     "body": "Double extortion ransomware groups steal data before encryption."},
+]
+
+
+class FakeDDGS:
+    queries = []
+
+    def __init__(self, timeout=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def text(self, query, max_results=None):
+        FakeDDGS.queries.append(query)
+        return RESULTS if query == TOPIC else [{"href": f"https://example.com/{len(FakeDDGS.queries)}", "title": query, "body": ""}]
+
+
+class ResearchKeywordsTest(unittest.TestCase):
+    def setUp(self):
+        FakeDDGS.queries = []
+        for patcher in (
+            mock.patch.object(app_researcher, "DDGS", FakeDDGS),
+            mock.patch.object(app_researcher, "_keyword_cache", LRUTTLCache(16, 60)),
+            mock.patch.object(app_researcher, "_search_cache", LRUTTLCache(16, 60)),
+            mock.patch.object(app_researcher, "_llm_keywords", side_effect=AssertionError("offline mode asked the model server")),
+            mock.patch.object(app_constants, "RESEARCH_KEYWORD_MODE", "rake"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_keywords_come_from_the_search_results(self):
+        keywords = app_researcher.expand_keywords(TOPIC)
+        self.assertTrue(keywords)
+        self.assertLessEqual(len(keywords), app_constants.RESEARCH_KEYWORD_COUNT)
+        self.assertNotIn(TOPIC, keywords)
+        self.assertIn("offline encrypted backups", keywords)
+        # Phrases repeating a topic word are kept when they add another one
+        self.assertTrue(any(TOPIC in keyword.split() for keyword in keywords))
+        self.assertEqual(FakeDDGS.queries, [TOPIC])
+
+    def test_topic_search_is_reused(self):
+        urls = app_researcher.search_term_ddg(TOPIC)
+        keywords = app_researcher.expand_keywords(TOPIC)
+        # One search for the topic, shared by the keywords and the URL list, then one per keyword
+        self.assertEqual(FakeDDGS.queries.count(TOPIC), 1)
+        self.assertEqual(sorted(FakeDDGS.queries[1:]), sorted(f"{TOPIC} {keyword}" for keyword in keywords))
+        self.assertIn("https://www.cisa.gov/stopransomware", urls)
+        self.assertNotIn("https://example.com/report.pdf", urls)
+        self.assertEqual(len(urls), 2 + len(keywords))
+
+    def test_failed_search_leaves_no_keywords(self):
+        with mock.patch.object(FakeDDGS, "text", side_effect=RuntimeError("offline")):
+            self.assertEqual(app_researcher.expand_keywords(TOPIC), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# app_response_cache: exact and near-duplicate hits, expiry, and invalidation by index version and collection.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from modules import app_constants, app_response_cache
+from modules.app_response_cache import ResponseCache
+
+COLLECTIONS = {"/db/playbooks": 3}
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.directory.name, "responses.sqlite3"), ttl_seconds=60)
+        self.scope = ResponseCache.scope("nav_playbooks", "analyst", ["b", "a"], COLLECTIONS)
+
+    def tearDown(self):
+        self.cache._conn.close()
+        self.directory.cleanup()
+
+    def test_exact_hit_ignores_case_and_spacing(self):
+        self.cache.put(self.scope, "How do I contain ransomware?", "Isolate the host.", "a.pdf", list(COLLECTIONS))
+        self.assertEqual(self.cache.get(self.scope, "  how do I   contain RANSOMWARE? "), ("Isolate the host.", "a.pdf", "exact"))
+        # Chunk order does not change the scope, the page does
+        self.assertEqual(ResponseCache.scope("nav_playbooks", "analyst", ["a", "b"], COLLECTIONS), self.scope)
+        other_page = ResponseCache.scope("nav_standards", "analyst", ["a", "b"], COLLECTIONS)
+        self.assertIsNone(self.cache.get(other_page, "How do I contain ransomware?"))
+        self.assertEqual((self.cache.exact_hits, self.cache.misses), (1, 1))
+
+    def test_semantic_hit_needs_similar_embedding(self):
+        self.cache.put(self.scope, "How do I contain ransomware?", "Isolate the host.", "", list(COLLECTIONS), [1.0, 0.0, 0.0])
+        with mock.patch.object(app_constants, "RESPONSE_CACHE_SIMILARITY", 0.95):
+            hit = self.cache.get(self.scope, "What are the steps to contain ransomware?", [0.99, 0.05, 0.0])
+            miss = self.cache.get(self.scope, "What is phishing?", [0.0, 1.0, 0.0])
+        self.assertEqual(hit, ("Isolate the host.", "", "semantic"))
+        self.assertIsNone(miss)
+        self.assertEqual(self.cache.semantic_hits, 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        with mock.patch("time.time", return_value=1000.0):
+            self.cache.put(self.scope, "prompt", "answer", "", list(COLLECTIONS), [1.0, 0.0])
+        with mock.patch("time.time", return_value=1059.0):
+            self.assertEqual(self.cache.get(self.scope, "prompt")[0], "answer")
+        with mock.patch("time.time", return_value=1061.0):
+            self.assertIsNone(self.cache.get(self.scope, "prompt"))
+            self.assertIsNone(self.cache.get(self.scope, "other prompt", [1.0, 0.0]))
+
+    def test_new_index_version_or_invalidation_misses(self):
+        self.cache.put(self.scope, "prompt", "answer", "", list(COLLECTIONS))
+        newer = ResponseCache.scope("nav_playbooks", "analyst", ["a", "b"], {"/db/playbooks": 4})
+        self.assertIsNone(self.cache.get(newer, "prompt"))
+        self.cache.invalidate_collection("/db/other")
+        self.assertIsNotNone(self.cache.get(self.scope, "prompt"))
+        self.cache.invalidate_collection("/db/playbooks")
+        self.assertIsNone(self.cache.get(self.scope, "prompt"))
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_eviction_keeps_recently_used_entries(self):
+        self.cache.max_bytes = 120
+        for index in range(4):
+            with mock.patch("time.time", return_value=1000.0 + index):
+                self.cache.put(self.scope, f"prompt {index}", "a" * 20, "", list(COLLECTIONS))
+        with mock.patch("time.time", return_value=1010.0):
+            self.cache.get(self.scope, "prompt 0")
+            self.cache.put(self.scope, "prompt 4", "a" * 20, "", list(COLLECTIONS))
+            self.assertIsNotNone(self.cache.get(self.scope, "prompt 0"))
+            self.assertIsNone(self.cache.get(self.scope, "prompt 1"))
+        self.assertLessEqual(self.cache.stats()["size_mb"] * 1024 * 1024, 120)
+
+    def test_module_helpers_respect_the_switch(self):
+        with mock.patch.object(app_response_cache, "_cache", self.cache), mock.patch.object(app_constants, "RESPONSE_CACHE_SEMANTIC", False):
+            app_response_cache.store("nav_playbooks", "analyst", ["a"], "prompt", "answer", collections=COLLECTIONS)
+            self.assertEqual(app_response_cache.lookup("nav_playbooks", "analyst", ["a"], "prompt", COLLECTIONS)[0], "answer")
+            with mock.patch.object(app_constants, "RESPONSE_CACHE_ENABLED", False):
+                self.assertIsNone(app_response_cache.lookup("nav_playbooks", "analyst", ["a"], "prompt", COLLECTIONS))
+
+
+if __name__ == "__main__":
+    unittest.main()
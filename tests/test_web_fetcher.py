@@ -0,0 +1,104 @@
+# app_web_fetcher against a local http.server: per-host limits, scheduling across hosts and cancellation.
+
+import threading
+import time
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from modules import app_web_fetcher  # noqa: E402
+
+SLOW_SECONDS = 0.3
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        host = self.headers["Host"]
+        with server.lock:
+            server.active[host] += 1
+            server.peak[host] = max(server.peak[host], server.active[host])
+            server.requests += 1
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(SLOW_SECONDS)
+            body = f"<html><body>{self.path}</body></html>".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active[host] -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class WebFetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _PageHandler)
+        self.server.lock = threading.Lock()
+        self.server.active, self.server.peak, self.server.requests = Counter(), Counter(), 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        # Two names for the same server count as two hosts
+        port = self.server.server_port
+        self.host_a = f"http://127.0.0.1:{port}"
+        self.host_b = f"http://localhost:{port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_per_host_limit(self):
+        fetcher = app_web_fetcher.WebFetcher(workers=8, per_host=2)
+        urls = [f"{self.host_a}/slow/{i}" for i in range(6)]
+        results = list(fetcher.fetch_all(urls))
+        self.assertEqual(sorted(result.url for result in results), sorted(urls))
+        self.assertTrue(all(result.error is None and result.status == 200 for result in results))
+        self.assertEqual(self.server.peak[f"127.0.0.1:{self.server.server_port}"], 2)
+        self.assertEqual(fetcher._active, {})
+
+    def test_busy_host_does_not_hold_up_other_hosts(self):
+        fetcher = app_web_fetcher.WebFetcher(workers=2, per_host=1)
+        urls = [f"{self.host_a}/slow/{i}" for i in range(4)] + [f"{self.host_b}/fast"]
+        order = [result.url for result in fetcher.fetch_all(urls)]
+        self.assertIn(f"{self.host_b}/fast", order[:2])
+        self.assertEqual(len(order), 5)
+
+    def test_standalone_fetch(self):
+        fetcher = app_web_fetcher.WebFetcher(workers=2, per_host=1)
+        result = fetcher.fetch(f"{self.host_a}/page")
+        self.assertEqual(result.status, 200)
+        self.assertIn(b"/page", result.content)
+
+    def test_cancel_drops_remaining_downloads(self):
+        fetcher = app_web_fetcher.WebFetcher(workers=4, per_host=1)
+        cancel = threading.Event()
+        urls = [f"{self.host_a}/slow/{i}" for i in range(6)]
+        results = []
+        for result in fetcher.fetch_all(urls, cancel=cancel):
+            results.append(result)
+            cancel.set()
+        self.assertEqual(len(results), 1)
+        time.sleep(SLOW_SECONDS * 2)
+        # The queued downloads were dropped: at most the one started when the first finished reached the server
+        self.assertLessEqual(self.server.requests, 2)
+        self.assertEqual(fetcher._active, {})
+
+    def test_deadline_skips_unfinished_downloads(self):
+        fetcher = app_web_fetcher.WebFetcher(workers=4, per_host=1)
+        urls = [f"{self.host_a}/slow/{i}" for i in range(6)]
+        start_time = time.time()
+        results = list(fetcher.fetch_all(urls, deadline=SLOW_SECONDS * 2.5))
+        self.assertLess(time.time() - start_time, SLOW_SECONDS * 4)
+        self.assertEqual(len(results), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()